@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'lms.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,8 +44,39 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    'lms.query_inspector.QueryInspectorMiddleware',
 ]
 
+# Per-request timings (database, templates, PDF rendering, channel layer sends): a Server-Timing
+# header, a JSON log line for this share of requests, and a per-endpoint histogram served to
+# admins at /api/metrics/performance/
+SERVER_TIMING = True
+SERVER_TIMING_HEADER = True
+SERVER_TIMING_LOG_SAMPLE_RATE = 0.01
+
+# Opt-in: run this share of requests under cProfile and keep the profiles of those taking at
+# least SLOW_REQUEST_PROFILE_MS (None: off), with their URL, user and query count, in a
+# directory holding the newest SLOW_REQUEST_PROFILE_MAX_FILES. Outside MEDIA_ROOT on purpose.
+SLOW_REQUEST_PROFILE_MS = None
+SLOW_REQUEST_PROFILE_SAMPLE_RATE = 0.05
+SLOW_REQUEST_PROFILE_DIR = BASE_DIR / 'profiles'
+SLOW_REQUEST_PROFILE_MAX_FILES = 50
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'lms.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Log repeated query shapes (likely N+1 patterns) per request, with the template or code that ran them
+QUERY_INSPECTOR = DEBUG
+QUERY_INSPECTOR_THRESHOLD = 5
+
 ROOT_URLCONF = 'crm.urls'
 
 TEMPLATES = [
@@ -91,6 +123,34 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered BOQ PDFs are cached here and pre-generated by a background thread pool
+BOQ_PDF_CACHE_DIR = MEDIA_ROOT / 'boq_pdfs'
+BOQ_PDF_WORKERS = 2
+BOQ_PDF_BACKGROUND = True
+BOQ_PDF_EXPORT_PROCESSES = None  # bulk export worker processes; None = available cores
+
+# Inventory Excel uploads are imported by this many background threads
+INVENTORY_IMPORT_WORKERS = 2
+
+# Inventory autocomplete is served from a per-process index, reloaded at least this often (seconds)
+INVENTORY_INDEX_MAX_AGE = 300
+
+# WebSocket clients connecting with ?batch=1 get the events of each window in one frame.
+# Nothing more is sent while MAX_UNACKED frames are unacknowledged, and at most
+# MAX_PENDING events are buffered per connection meanwhile
+NOTIFICATION_BATCH_WINDOW_MS = 50
+NOTIFICATION_BATCH_MAX_UNACKED = 4
+NOTIFICATION_BATCH_MAX_PENDING = 500
+
+# Notification retention (manage.py prune_notifications, run from cron): read / unread notifications
+# older than this many days are removed in transactions of NOTIFICATION_RETENTION_BATCH rows.
+# None keeps them forever.
+NOTIFICATION_READ_TTL_DAYS = 30
+NOTIFICATION_UNREAD_TTL_DAYS = 180
+NOTIFICATION_RETENTION_BATCH = 1000
+NOTIFICATION_ARCHIVE = False  # copy removed rows to NotificationArchive
+NOTIFICATION_COLLAPSE_DUPLICATES = False  # keep only the newest identical notification per user
+
 # AUTH REDIRECTS
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = '/dashboard/'
@@ -107,11 +167,37 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-        "CONFIG": {
-            "capacity": 1500,  # Maximum number of messages that can be stored
-        },
+# Channel layer (WebSocket pushes). The in-memory layer only reaches clients connected
+# to the same process; set CHANNEL_REDIS_URL (e.g. redis://localhost:6379/0) to share
+# groups between several daphne workers through Redis (requires channels_redis).
+CHANNEL_REDIS_URL = os.environ.get('CHANNEL_REDIS_URL', '')
+CHANNEL_LAYER_CAPACITY = int(os.environ.get('CHANNEL_LAYER_CAPACITY', 1500))  # Max queued messages per channel
+CHANNEL_GROUP_EXPIRY = int(os.environ.get('CHANNEL_GROUP_EXPIRY', 86400))  # Seconds a group membership lives
+CHANNEL_MESSAGE_EXPIRY = int(os.environ.get('CHANNEL_MESSAGE_EXPIRY', 60))  # Seconds an undelivered message lives
+
+# The layer used when CHANNEL_REDIS_URL is set (also exercised by the tests against fakeredis)
+REDIS_CHANNEL_LAYER = {
+    # channels_redis.pubsub.RedisPubSubChannelLayer also works, without capacity/expiry
+    "BACKEND": os.environ.get('CHANNEL_LAYER_BACKEND', "channels_redis.core.RedisChannelLayer"),
+    "CONFIG": {
+        "hosts": [CHANNEL_REDIS_URL or 'redis://localhost:6379/0'],
+        "prefix": os.environ.get('CHANNEL_LAYER_PREFIX', 'crm'),
+        "capacity": CHANNEL_LAYER_CAPACITY,
+        "group_expiry": CHANNEL_GROUP_EXPIRY,
+        "expiry": CHANNEL_MESSAGE_EXPIRY,
     },
 }
+
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {"default": REDIS_CHANNEL_LAYER}
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": {
+                "capacity": CHANNEL_LAYER_CAPACITY,
+                "group_expiry": CHANNEL_GROUP_EXPIRY,
+                "expiry": CHANNEL_MESSAGE_EXPIRY,
+            },
+        },
+    }
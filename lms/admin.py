@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import LeadSource, InventoryItem, Project, Task, Event, Invoice
+from .models import LeadSource, InventoryItem, Project, Task, Event, Invoice, NotificationArchive
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 
@@ -55,3 +55,10 @@ class InvoiceAdmin(admin.ModelAdmin):
     list_display = ('invoice_amount', 'project', 'item', 'snapshot_d')
     list_filter = ('snapshot_d',)
     search_fields = ('project__project_name',)
+
+@admin.register(NotificationArchive)
+class NotificationArchiveAdmin(admin.ModelAdmin):
+    list_display = ('message', 'user', 'is_read', 'reason', 'created_at', 'archived_at')
+    list_filter = ('reason', 'is_read')
+    search_fields = ('message', 'user__username')
+    raw_id_fields = ('user',)
@@ -0,0 +1,174 @@
+import json
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import BOQ, InventoryItem, Project
+from .pdf import invalidate_boq_pdf
+from .scale_seed import seed_scale
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+
+# seed_scale arguments of the benchmark data set; a baseline only compares against the same data
+BENCHMARK_DATA = {'leads': 2000, 'inventory': 500, 'users': 20, 'events': 500, 'notifications': 5000, 'seed': 1}
+
+# Default regression thresholds: relative wall time (plus absolute slack for
+# very fast endpoints), extra queries, and relative response size
+TIME_THRESHOLD = 0.5
+TIME_SLACK_MS = 10
+QUERY_THRESHOLD = 0
+BYTES_THRESHOLD = 0.10
+
+# Transaction control differs between a test case and a real request, so it is not counted
+TRANSACTION_SQL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+@dataclass
+class Endpoint:
+    name: str
+    url: object  # fixtures -> URL
+    data: object = None  # fixtures -> POST data (GET when None)
+    before: object = None  # fixtures -> None, run untimed before each request
+
+
+def _create_boq_data(fixtures):
+    items = fixtures['inventory']
+    return {
+        'tax_rate': '18.00',
+        'sr_no[]': [str(i) for i in range(1, len(items) + 1)],
+        'inventory_id[]': [str(pk) for pk in items],
+        'quantity[]': ['3'] * len(items),
+        'discount[]': ['5'] * len(items),
+    }
+
+
+ENDPOINTS = [
+    Endpoint('dashboard', lambda f: reverse('dashboard')),
+    Endpoint('tasks', lambda f: reverse('tasks')),
+    Endpoint('leads_list', lambda f: reverse('leads_list')),
+    Endpoint('inventory', lambda f: reverse('inventory')),
+    Endpoint('view_boq', lambda f: reverse('view_boq', args=[f['boq']])),
+    Endpoint('create_boq', lambda f: reverse('create_boq', args=[f['project']]), data=_create_boq_data),
+    # A cold render each time, not the cached file
+    Endpoint(
+        'download_boq_pdf',
+        lambda f: reverse('download_boq_pdf', args=[f['boq']]),
+        before=lambda f: invalidate_boq_pdf(f['boq']),
+    ),
+]
+
+
+def seed_benchmark_data():
+    """Seed BENCHMARK_DATA and make its first user a superuser, who sees every row"""
+    seed_scale(**BENCHMARK_DATA)
+    User.objects.filter(username='seeduser0').update(is_superuser=True)
+
+
+def _fixtures():
+    boq = BOQ.objects.annotate(lines=Count('items')).order_by('-lines', 'id').first()
+    return {
+        'user': User.objects.get(username='seeduser0'),
+        'boq': boq.pk,
+        'project': Project.objects.filter(lead_source__isnull=False).order_by('id').values_list('pk', flat=True)[0],
+        'inventory': list(InventoryItem.objects.order_by('id').values_list('pk', flat=True)[:10]),
+    }
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, -(-len(ordered) * pct // 100) - 1)]
+
+
+def _measure(client, endpoint, fixtures):
+    if endpoint.before:
+        endpoint.before(fixtures)
+    url = endpoint.url(fixtures)
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        if endpoint.data is None:
+            response = client.get(url)
+        else:
+            response = client.post(url, endpoint.data(fixtures))
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        elapsed = time.perf_counter() - started
+    response.close()
+    if response.status_code >= 400:
+        raise AssertionError(f'{endpoint.name}: {url} returned {response.status_code}')
+    query_count = sum(1 for query in queries.captured_queries if not query['sql'].startswith(TRANSACTION_SQL))
+    return elapsed * 1000, query_count, len(content)
+
+
+def run_benchmarks(iterations=10, warmup=1, endpoints=None):
+    """
+    Request each endpoint `warmup` + `iterations` times as the benchmark user
+    and return {name: {p50_ms, p95_ms, max_ms, queries, bytes}} over the timed
+    iterations. Needs the seed_benchmark_data() data set.
+    """
+    fixtures = _fixtures()
+    client = Client()
+    client.force_login(fixtures['user'])
+    results = {}
+    with tempfile.TemporaryDirectory() as pdf_dir, override_settings(
+        BOQ_PDF_CACHE_DIR=Path(pdf_dir), BOQ_PDF_BACKGROUND=False
+    ):
+        cache.clear()
+        for endpoint in endpoints or ENDPOINTS:
+            for _ in range(warmup):
+                _measure(client, endpoint, fixtures)
+            samples = [_measure(client, endpoint, fixtures) for _ in range(iterations)]
+            times = [ms for ms, _, _ in samples]
+            results[endpoint.name] = {
+                'p50_ms': round(percentile(times, 50), 2),
+                'p95_ms': round(percentile(times, 95), 2),
+                'max_ms': round(max(times), 2),
+                'queries': max(count for _, count, _ in samples),
+                'bytes': max(size for _, _, size in samples),
+            }
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_baseline(results, path=BASELINE_PATH, iterations=None):
+    with open(path, 'w') as f:
+        json.dump({'data': BENCHMARK_DATA, 'iterations': iterations, 'endpoints': results}, f, indent=2)
+        f.write('\n')
+
+
+def compare(results, baseline, time_threshold=TIME_THRESHOLD, query_threshold=QUERY_THRESHOLD,
+            bytes_threshold=BYTES_THRESHOLD):
+    """
+    Regressions of `results` against a baseline, as readable lines. Pass
+    time_threshold=None to skip wall times (e.g. on noisy CI machines).
+    """
+    if baseline.get('data') != BENCHMARK_DATA:
+        return [f"baseline was recorded with {baseline.get('data')}, not {BENCHMARK_DATA}"]
+
+    regressions = []
+    for name, result in results.items():
+        base = baseline['endpoints'].get(name)
+        if base is None:
+            continue
+        if time_threshold is not None:
+            for metric in ('p50_ms', 'p95_ms'):
+                limit = base[metric] * (1 + time_threshold) + TIME_SLACK_MS
+                if result[metric] > limit:
+                    regressions.append(f'{name}: {metric} {result[metric]} > {limit:.2f} (baseline {base[metric]})')
+        if result['queries'] > base['queries'] + query_threshold:
+            regressions.append(f"{name}: {result['queries']} queries (baseline {base['queries']})")
+        if bytes_threshold is not None and result['bytes'] > base['bytes'] * (1 + bytes_threshold):
+            regressions.append(f"{name}: {result['bytes']} bytes (baseline {base['bytes']})")
+    return regressions
@@ -0,0 +1,261 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .inventory_index import inventory_changed
+from .models import BOQItem, InventoryItem, InventoryOrderRequirement
+from .rollups import track_totals
+
+
+@dataclass
+class BOQLine:
+    """One submitted BOQ row"""
+    sr_no: int
+    inventory_id: int
+    quantity: int
+    discount_percentage: Decimal = Decimal('0')
+
+
+@dataclass
+class BOQBuildResult:
+    items: list = field(default_factory=list)
+    requirements: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+
+@dataclass
+class BOQReconcileResult:
+    created: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    unchanged: list = field(default_factory=list)
+    deleted_count: int = 0
+    errors: list = field(default_factory=list)
+
+    @property
+    def items(self):
+        return sorted(self.created + self.updated + self.unchanged, key=lambda item: item.sr_no)
+
+
+def parse_boq_lines(data):
+    """
+    Read the sr_no[]/inventory_id[]/quantity[]/discount[] arrays posted by the
+    BOQ form. Returns (lines, errors); rows without an inventory item are skipped.
+    """
+    sr_nos = data.getlist('sr_no[]')
+    inventory_ids = data.getlist('inventory_id[]')
+    quantities = data.getlist('quantity[]')
+    discounts = data.getlist('discount[]')
+
+    lines, errors = [], []
+    for i, inv_id in enumerate(inventory_ids):
+        if not inv_id or not inv_id.strip():
+            continue
+        try:
+            discount = discounts[i] if i < len(discounts) else ''
+            lines.append(BOQLine(
+                sr_no=int(sr_nos[i]),
+                inventory_id=int(inv_id),
+                quantity=int(quantities[i]),
+                discount_percentage=Decimal(discount) if discount else Decimal('0'),
+            ))
+        except Exception as e:
+            errors.append(f'Error adding BOQ item {i+1}: {str(e)}')
+    return lines, errors
+
+
+def _order_requirement(boq, item):
+    return InventoryOrderRequirement(
+        inventory_item=item.inventory_item,
+        project_id=boq.project_id,
+        boq=boq,
+        boq_item=item,
+        required_quantity=item.quantity,
+        available_quantity=item.available_quantity,
+        shortage_quantity=item.shortage,
+        status='pending',
+    )
+
+
+@transaction.atomic
+def build_boq_items(boq, lines, reserve_stock=True, inventory=None, update_totals=True):
+    """
+    Create all BOQ items for `lines` in bulk.
+
+    Lines are priced in memory from a single InventoryItem fetch, items and
+    order requirements are inserted with bulk_create, each inventory item
+    gets one F()-based update and the BOQ totals are calculated once.
+    With `reserve_stock` the quantities are taken out of available stock.
+    """
+    result = BOQBuildResult()
+    if inventory is None:
+        inventory = InventoryItem.objects.in_bulk({line.inventory_id for line in lines})
+
+    # Stock seen by each line, so repeated items see what earlier lines reserved
+    available = {pk: item.available_quantity for pk, item in inventory.items()}
+    reserved = defaultdict(int)
+    to_order = defaultdict(int)
+    seen_sr_nos = set()
+
+    for line in lines:
+        inventory_item = inventory.get(line.inventory_id)
+        if inventory_item is None:
+            result.errors.append(f'Error adding BOQ item {line.sr_no}: inventory item {line.inventory_id} not found')
+            continue
+        if line.sr_no in seen_sr_nos:
+            result.errors.append(f'Error adding BOQ item {line.sr_no}: duplicate serial number')
+            continue
+        seen_sr_nos.add(line.sr_no)
+
+        item = BOQItem(
+            boq=boq,
+            sr_no=line.sr_no,
+            inventory_item=inventory_item,
+            quantity=line.quantity,
+            discount_percentage=line.discount_percentage,
+        )
+        item.price_from_inventory(available[line.inventory_id])
+
+        if reserve_stock:
+            available[line.inventory_id] -= line.quantity
+            reserved[line.inventory_id] += line.quantity
+        to_order[line.inventory_id] += item.shortage
+        result.items.append(item)
+
+    if not result.items:
+        return result
+
+    BOQItem.objects.bulk_create(result.items)
+
+    if boq.project_id:
+        result.requirements = InventoryOrderRequirement.objects.bulk_create([
+            _order_requirement(boq, item) for item in result.items if not item.has_sufficient_stock
+        ])
+
+    now = timezone.now()
+    changed = set(reserved) | {pk for pk, qty in to_order.items() if qty}
+    with track_totals(InventoryItem, changed):
+        for pk in changed:
+            InventoryItem.objects.filter(pk=pk).update(
+                available_quantity=F('available_quantity') - reserved[pk],
+                quantity_to_be_ordered=F('quantity_to_be_ordered') + to_order[pk],
+                snapshot_d=now,
+            )
+    inventory_changed(changed)
+
+    if update_totals:
+        boq.calculate_totals(result.items)
+    return result
+
+
+@transaction.atomic
+def reconcile_boq_items(boq, lines):
+    """
+    Bring a BOQ's items in line with the submitted `lines`, touching only
+    what changed.
+
+    Lines are matched to existing items by (sr_no, inventory item) first and
+    then by inventory item alone, so renumbered rows are kept. Matched items
+    whose quantity, discount or serial number changed are repriced and
+    updated, unmatched lines are inserted and unmatched items are deleted.
+    Stock is not reserved again; quantity_to_be_ordered only grows by new or
+    increased shortages.
+    """
+    result = BOQReconcileResult()
+    existing = list(boq.items.all())
+    inventory = InventoryItem.objects.in_bulk(
+        {line.inventory_id for line in lines} | {item.inventory_item_id for item in existing}
+    )
+
+    # Drop lines that cannot be applied before matching
+    valid_lines, seen_sr_nos = [], set()
+    for line in lines:
+        if line.inventory_id not in inventory:
+            result.errors.append(f'Error adding BOQ item {line.sr_no}: inventory item {line.inventory_id} not found')
+        elif line.sr_no in seen_sr_nos:
+            result.errors.append(f'Error adding BOQ item {line.sr_no}: duplicate serial number')
+        else:
+            seen_sr_nos.add(line.sr_no)
+            valid_lines.append(line)
+
+    by_position = {(item.sr_no, item.inventory_item_id): item for item in existing}
+    matches, unmatched_lines = [], []
+    for line in valid_lines:
+        item = by_position.pop((line.sr_no, line.inventory_id), None)
+        if item:
+            matches.append((line, item))
+        else:
+            unmatched_lines.append(line)
+
+    by_inventory = {}
+    for item in by_position.values():
+        by_inventory.setdefault(item.inventory_item_id, []).append(item)
+    new_lines = []
+    for line in unmatched_lines:
+        candidates = by_inventory.get(line.inventory_id)
+        if candidates:
+            matches.append((line, candidates.pop(0)))
+        else:
+            new_lines.append(line)
+    removed = [item for items in by_inventory.values() for item in items]
+
+    # Removed rows go first so their serial numbers can be reused
+    if removed:
+        result.deleted_count = len(removed)
+        BOQItem.objects.filter(pk__in=[item.pk for item in removed]).delete()
+
+    to_order = defaultdict(int)
+    renumbered = []
+    for line, item in matches:
+        if (item.sr_no, item.quantity, item.discount_percentage) == (
+            line.sr_no, line.quantity, line.discount_percentage
+        ):
+            result.unchanged.append(item)
+            continue
+        old_shortage = item.shortage
+        if item.sr_no != line.sr_no:
+            renumbered.append(item)
+        item.sr_no = line.sr_no
+        item.quantity = line.quantity
+        item.discount_percentage = line.discount_percentage
+        item.inventory_item = inventory[line.inventory_id]
+        item.price_from_inventory()
+        to_order[line.inventory_id] += max(item.shortage - old_shortage, 0)
+        result.updated.append(item)
+
+    if renumbered:
+        # Park moved rows on temporary numbers so swaps don't trip unique(boq, sr_no)
+        BOQItem.objects.bulk_update(
+            [BOQItem(pk=item.pk, sr_no=-i) for i, item in enumerate(renumbered, start=1)], ['sr_no']
+        )
+    if result.updated:
+        BOQItem.objects.bulk_update(result.updated, [
+            'sr_no', 'quantity', 'discount_percentage', 'discount_amount', 'line_total',
+            'item_name', 'unit_price', 'available_quantity', 'has_sufficient_stock',
+        ])
+        InventoryOrderRequirement.objects.filter(boq_item__in=result.updated).delete()
+        if boq.project_id:
+            InventoryOrderRequirement.objects.bulk_create([
+                _order_requirement(boq, item) for item in result.updated if not item.has_sufficient_stock
+            ])
+
+    now = timezone.now()
+    short = [pk for pk, quantity in to_order.items() if quantity]
+    with track_totals(InventoryItem, short):
+        for pk in short:
+            InventoryItem.objects.filter(pk=pk).update(
+                quantity_to_be_ordered=F('quantity_to_be_ordered') + to_order[pk],
+                snapshot_d=now,
+            )
+    inventory_changed(short)
+
+    if new_lines:
+        build = build_boq_items(boq, new_lines, reserve_stock=False, inventory=inventory, update_totals=False)
+        result.created = build.items
+        result.errors.extend(build.errors)
+
+    boq.calculate_totals(result.items)
+    return result
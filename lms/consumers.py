@@ -1,7 +1,28 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
+from collections import OrderedDict
+from django.conf import settings
+from urllib.parse import parse_qs
+import asyncio
+import itertools
 import json
 
+
 class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes notifications (and import progress) to the user's sockets.
+
+    Clients connecting with ?batch=1 get the events of each
+    NOTIFICATION_BATCH_WINDOW_MS window in one frame:
+    {"type": "batch", "seq": n, "events": [...], "unread_delta": n, "dropped": n}.
+    Progress events of the same import job, and unread counts, are
+    coalesced to the latest one.
+    The client acknowledges each frame with {"ack": seq}; while
+    NOTIFICATION_BATCH_MAX_UNACKED frames are unacknowledged nothing more
+    is sent, and events wait (coalesced) for the next frame. At most
+    NOTIFICATION_BATCH_MAX_PENDING events are kept for a lagging client;
+    older ones are dropped and counted so the client can resync.
+    """
+
     async def connect(self):
         user = self.scope["user"]
         if user.is_anonymous:
@@ -10,6 +31,16 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             # Use a per-user group name
             self.group_name = f"user_{user.id}"
 
+            query = parse_qs(self.scope.get("query_string", b"").decode())
+            self.batching = query.get("batch", ["0"])[0] not in ("", "0")
+            self.pending = OrderedDict()  # coalescing key -> event, oldest first
+            self.unread_delta = 0
+            self.dropped = 0
+            self.flush_task = None
+            self.sent_seq = 0
+            self.acked_seq = 0
+            self.event_ids = itertools.count()
+
             await self.channel_layer.group_add(
                 self.group_name,
                 self.channel_name
@@ -17,13 +48,19 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-        )
+        if getattr(self, "flush_task", None):
+            self.flush_task.cancel()
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
 
     async def receive(self, text_data):
         data = json.loads(text_data)
+        if "ack" in data:
+            self._ack(data["ack"])
+            return
         message = data.get('message', '')
         await self.channel_layer.group_send(
             self.group_name,
@@ -31,6 +68,72 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         )
 
     async def send_notification(self, event):
-        await self.send(text_data=json.dumps({
-            "message": event["message"]
-        }))
+        await self._push({"message": event["message"]}, unread=1)
+
+    async def import_progress(self, event):
+        await self._push(
+            {"type": "import_progress", "job": event["job"]},
+            key=("import_progress", event["job"].get("id")),
+        )
+
+    async def unread_count(self, event):
+        await self._push({"type": "unread_count", "count": event["count"]}, key=("unread_count",))
+
+    # ------------------------------------------------------------------
+    # Batching
+    # ------------------------------------------------------------------
+
+    async def _push(self, payload, unread=0, key=None):
+        """Send `payload` now, or queue it for the next batch frame"""
+        if not self.batching:
+            await self.send(text_data=json.dumps(payload))
+            return
+
+        self.unread_delta += unread
+        if key is None:
+            key = next(self.event_ids)
+        self.pending[key] = payload
+        self.pending.move_to_end(key)  # a coalesced event carries the latest state, so it goes last
+        while len(self.pending) > getattr(settings, 'NOTIFICATION_BATCH_MAX_PENDING', 500):
+            self.pending.popitem(last=False)
+            self.dropped += 1
+
+        self._schedule_flush()
+
+    def _ack(self, seq):
+        """Record that the client has handled every frame up to `seq`"""
+        try:
+            seq = int(seq)
+        except (TypeError, ValueError):
+            return
+        self.acked_seq = max(self.acked_seq, min(seq, self.sent_seq))
+        self._schedule_flush()
+
+    def _can_send(self):
+        max_unacked = getattr(settings, 'NOTIFICATION_BATCH_MAX_UNACKED', 4)
+        return self.sent_seq - self.acked_seq < max_unacked
+
+    def _schedule_flush(self):
+        if self.pending and self.flush_task is None and self._can_send():
+            self.flush_task = asyncio.ensure_future(self._flush_batches())
+
+    async def _flush_batches(self):
+        window = getattr(settings, 'NOTIFICATION_BATCH_WINDOW_MS', 50) / 1000
+        try:
+            # A lagging client stops the loop; its next ack starts it again
+            while self.pending and self._can_send():
+                await asyncio.sleep(window)
+                self.sent_seq += 1
+                frame = {
+                    "type": "batch",
+                    "seq": self.sent_seq,
+                    "events": list(self.pending.values()),
+                    "unread_delta": self.unread_delta,
+                    "dropped": self.dropped,
+                }
+                self.pending.clear()
+                self.unread_delta = self.dropped = 0
+                # Events arriving while this frame is sent wait in self.pending
+                await self.send(text_data=json.dumps(frame))
+        finally:
+            self.flush_task = None
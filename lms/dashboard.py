@@ -0,0 +1,284 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import BOQItem, DashboardRollup, InventorySalesRollup, LeadSourceRollup
+
+# Project status -> label shown on the dashboard status chart
+STATUS_LABELS = {
+    'open': 'New',
+    'contacted': 'Contacted',
+    'boq': 'BOQ',
+    'advance': 'Advance',
+    'In Progress': 'In Progress',
+    'Testing': 'Testing',
+    'won': 'Won',
+    'closed': 'Closed',
+    'lost': 'Lost',
+}
+
+# Projects that count towards billing / average deal size (a positive amount, as in the rollup)
+BILLED_PROJECTS = Q(status='advance') & Q(amount__gt=0)
+
+# Bars of the lead source chart
+LEAD_SOURCE_LIMIT = 8
+
+
+@dataclass
+class DashboardSummary:
+    """Aggregated figures rendered by the dashboard view"""
+    total_projects: int = 0
+    won_count: int = 0
+    billed_count: int = 0
+    total_revenue: Decimal = Decimal('0')
+    status_counts: dict = field(default_factory=dict)
+    lead_source_counts: dict = field(default_factory=dict)
+    city_counts: dict = field(default_factory=dict)
+    revenue_labels: list = field(default_factory=list)
+    revenue_data: list = field(default_factory=list)
+    top_inventory: list = field(default_factory=list)
+
+    @property
+    def avg_deal(self):
+        return (self.total_revenue / self.billed_count) if self.billed_count else 0
+
+    @property
+    def win_rate(self):
+        return round(self.won_count / self.total_projects * 100, 1) if self.total_projects else 0
+
+    @property
+    def conversion_rate(self):
+        return round(self.billed_count / self.total_projects * 100, 1) if self.total_projects else 0
+
+
+def _month_starts(months, now=None):
+    """First day (local time) of each of the last `months` months, oldest first"""
+    now = timezone.localtime(now)
+    year, month = now.year, now.month
+    starts = []
+    for _ in range(months):
+        starts.append(timezone.make_aware(datetime(year, month, 1)))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return starts[::-1]
+
+
+def kpi_counts(projects):
+    """Totals, billing and per-status counts in a single conditional-aggregate query"""
+    aggregates = {
+        'total': Count('id'),
+        'won': Count('id', filter=Q(status='won')),
+        'billed': Count('id', filter=BILLED_PROJECTS),
+        'revenue': Sum('amount', filter=BILLED_PROJECTS),
+    }
+    for i, status in enumerate(STATUS_LABELS):
+        aggregates[f'status_{i}'] = Count('id', filter=Q(status=status))
+
+    row = projects.order_by().aggregate(**aggregates)
+    row['status_counts'] = {
+        label: row.pop(f'status_{i}') for i, label in enumerate(STATUS_LABELS.values())
+    }
+    return row
+
+
+def revenue_trend(projects, months=12):
+    """Monthly revenue for the last `months` months using one TruncMonth group-by"""
+    starts = _month_starts(months)
+    rows = (
+        projects.filter(amount__gt=0, snapshot_d__gte=starts[0])
+                .annotate(month=TruncMonth('snapshot_d'))
+                .order_by()
+                .values('month')
+                .annotate(total=Sum('amount'))
+                .values_list('month', 'total')
+    )
+    totals = {timezone.localtime(month).date(): total for month, total in rows}
+
+    labels = [start.strftime('%b') for start in starts]
+    data = [float(totals.get(start.date()) or 0) for start in starts]
+    return labels, data
+
+
+def top_inventory(limit=10):
+    """Best-selling inventory items across approved BOQs"""
+    rows = (
+        BOQItem.objects
+        .filter(boq__status='approved')
+        .values('inventory_item__id', 'inventory_item__item_name')
+        .annotate(
+            total_sold=Sum('quantity'),
+            total_revenue=Sum(F('quantity') * F('unit_price'))
+        )
+        .order_by('-total_revenue')[:limit]
+    )
+    return [
+        {
+            'item_name': row['inventory_item__item_name'],
+            'total_sold': row['total_sold'],
+            'total_revenue': row['total_revenue'],
+        }
+        for row in rows
+    ]
+
+
+def lead_source_counts(projects):
+    """Projects per lead source (top 8)"""
+    return dict(
+        projects.filter(lead_source__isnull=False)
+                .values('lead_source__first_name', 'lead_source__last_name')
+                .annotate(count=Count('id'))
+                .order_by('-count')[:LEAD_SOURCE_LIMIT]
+                .values_list('lead_source__first_name', 'count')
+    )
+
+
+def build_dashboard_summary(projects):
+    """Compute every dashboard figure for an already filtered Project queryset"""
+    kpis = kpi_counts(projects)
+
+    city_counts = dict(
+        projects.exclude(city__isnull=True)
+                .exclude(city='')
+                .values('city')
+                .annotate(count=Count('id'))
+                .order_by('-count')[:10]
+                .values_list('city', 'count')
+    )
+    revenue_labels, revenue_data = revenue_trend(projects)
+
+    return DashboardSummary(
+        total_projects=kpis['total'],
+        won_count=kpis['won'],
+        billed_count=kpis['billed'],
+        total_revenue=kpis['revenue'] or Decimal('0'),
+        status_counts=kpis['status_counts'],
+        lead_source_counts=lead_source_counts(projects),
+        city_counts=city_counts,
+        revenue_labels=revenue_labels,
+        revenue_data=revenue_data,
+        top_inventory=top_inventory(),
+    )
+
+
+def rollup_buckets(user=None, city='', status=''):
+    """DashboardRollup rows matching the dashboard filters (user=None means all users)"""
+    buckets = DashboardRollup.objects.all()
+    if user is not None:
+        buckets = buckets.filter(user=user)
+    if city:
+        buckets = buckets.filter(city=city)
+    if status:
+        buckets = buckets.filter(status=status)
+    return buckets.order_by()
+
+
+def rollup_lead_source_counts():
+    """Projects per lead source (top 8) across all users, read from LeadSourceRollup"""
+    return dict(
+        LeadSourceRollup.objects.filter(project_count__gt=0)
+        .order_by('-project_count')[:LEAD_SOURCE_LIMIT]
+        .values_list('lead_source__first_name', 'project_count')
+    )
+
+
+def rollup_status_counts(user=None):
+    """Project count per status read from the rollup"""
+    return dict(
+        rollup_buckets(user)
+        .values('status')
+        .annotate(count=Sum('project_count'))
+        .values_list('status', 'count')
+    )
+
+
+def rollup_cities(status=''):
+    """Distinct project cities, read from the (much smaller) rollup table"""
+    return list(
+        rollup_buckets(status=status)
+        .filter(project_count__gt=0)
+        .exclude(city='')
+        .values_list('city', flat=True)
+        .distinct()
+        .order_by('city')
+    )
+
+
+def rollup_statuses():
+    """Distinct project statuses, read from the rollup table"""
+    return list(
+        rollup_buckets()
+        .filter(project_count__gt=0)
+        .values_list('status', flat=True)
+        .distinct()
+        .order_by('status')
+    )
+
+
+def build_rollup_dashboard_summary(projects, user=None, city='', status=''):
+    """
+    Same figures as build_dashboard_summary, read from the rollup tables so
+    the cost does not grow with the number of projects. The lead source chart
+    comes from LeadSourceRollup for all users and no filters; otherwise it is
+    counted over `projects`, which are then narrowed to one user, city or status.
+    """
+    buckets = rollup_buckets(user, city, status)
+    billed = Q(status='advance')
+
+    aggregates = {
+        'total': Sum('project_count'),
+        'won': Sum('project_count', filter=Q(status='won')),
+        'billed': Sum('priced_count', filter=billed),
+        'revenue': Sum('revenue', filter=billed),
+    }
+    for i, status_key in enumerate(STATUS_LABELS):
+        aggregates[f'status_{i}'] = Sum('project_count', filter=Q(status=status_key))
+    kpis = buckets.aggregate(**aggregates)
+
+    city_counts = dict(
+        buckets.filter(project_count__gt=0)
+               .exclude(city='')
+               .values('city')
+               .annotate(count=Sum('project_count'))
+               .order_by('-count')[:10]
+               .values_list('city', 'count')
+    )
+
+    starts = [start.date() for start in _month_starts(12)]
+    monthly = dict(
+        buckets.filter(month__gte=starts[0])
+               .values('month')
+               .annotate(total=Sum('revenue'))
+               .values_list('month', 'total')
+    )
+
+    top_inventory = [
+        {
+            'item_name': row.inventory_item.item_name,
+            'total_sold': row.quantity_sold,
+            'total_revenue': row.revenue,
+        }
+        for row in InventorySalesRollup.objects.select_related('inventory_item')
+                                               .filter(quantity_sold__gt=0)
+                                               .order_by('-revenue')[:10]
+    ]
+
+    return DashboardSummary(
+        total_projects=kpis['total'] or 0,
+        won_count=kpis['won'] or 0,
+        billed_count=kpis['billed'] or 0,
+        total_revenue=kpis['revenue'] or Decimal('0'),
+        status_counts={
+            label: kpis[f'status_{i}'] or 0 for i, label in enumerate(STATUS_LABELS.values())
+        },
+        lead_source_counts=(
+            rollup_lead_source_counts() if user is None and not city and not status
+            else lead_source_counts(projects)
+        ),
+        city_counts=city_counts,
+        revenue_labels=[start.strftime('%b') for start in starts],
+        revenue_data=[float(monthly.get(start) or 0) for start in starts],
+        top_inventory=top_inventory,
+    )
@@ -0,0 +1,140 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .instrumentation import timed
+from .inventory_import import import_inventory_workbook, workbook_row_count
+from .models import InventoryImportJob
+from .notifications import notify
+
+logger = logging.getLogger(__name__)
+
+# Errors kept on the job row / returned by the status endpoint
+MAX_STORED_ERRORS = 200
+
+
+def job_payload(job, processed_rows=None):
+    """JSON-serialisable state of an import job"""
+    processed = job.processed_rows if processed_rows is None else processed_rows
+    percent = None
+    if job.status == 'completed':
+        percent = 100
+    elif job.total_rows:
+        percent = min(round(processed / job.total_rows * 100), 99)
+    return {
+        'id': job.pk,
+        'file_name': job.file_name,
+        'status': job.status,
+        'total_rows': job.total_rows,
+        'processed_rows': processed,
+        'percent': percent,
+        'added': job.added,
+        'updated': job.updated,
+        'error_count': job.error_count,
+        'errors': job.errors,
+        'message': job.message,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _push(user_id, event):
+    try:
+        with timed('channels'):
+            async_to_sync(get_channel_layer().group_send)(f"user_{user_id}", event)
+    except Exception:
+        logger.exception('Could not push inventory import progress to user %s', user_id)
+
+
+def _push_progress(job, processed_rows=None):
+    _push(job.user_id, {"type": "import_progress", "job": job_payload(job, processed_rows)})
+
+
+# ============================================================================
+# BACKGROUND WORKER
+# ============================================================================
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'INVENTORY_IMPORT_WORKERS', 2),
+                thread_name_prefix='inventory-import',
+            )
+        return _executor
+
+
+def run_import_job(job_id):
+    """Process a queued import job and report the outcome to its owner"""
+    job = InventoryImportJob.objects.filter(pk=job_id, status='queued').first()
+    if job is None:
+        return None
+
+    job.status = 'running'
+    job.started_at = timezone.now()
+    try:
+        job.total_rows = workbook_row_count(job.file.path)
+    except Exception:
+        job.total_rows = None  # unreadable files fail below with the real error
+    job.save(update_fields=['status', 'started_at', 'total_rows'])
+    _push_progress(job)
+
+    def on_progress(processed_rows):
+        job.processed_rows = processed_rows
+        # Visible to the status endpoint in every worker
+        InventoryImportJob.objects.filter(pk=job.pk).update(processed_rows=processed_rows)
+        _push_progress(job, processed_rows)
+
+    try:
+        report = import_inventory_workbook(job.file.path, on_progress=on_progress)
+    except Exception as e:
+        logger.exception('Inventory import job %s failed', job.pk)
+        job.status = 'failed'
+        job.message = f'Error reading Excel file: {str(e)}'
+    else:
+        job.status = 'completed'
+        job.added, job.updated, job.error_count = report.added, report.updated, report.error_count
+        job.errors = report.errors[:MAX_STORED_ERRORS]
+        job.message = f'Added: {report.added}, Updated: {report.updated}, Errors: {report.error_count}'
+
+    job.finished_at = timezone.now()
+    job.file.delete(save=False)
+    job.save()
+    _push_progress(job)
+
+    if job.status == 'completed':
+        message = f'Excel upload completed! {job.message}'
+    else:
+        message = f'Inventory import of {job.file_name} failed'
+    notify([job.user_id], message)
+    return job
+
+
+def _run_in_background(job_id):
+    close_old_connections()
+    try:
+        run_import_job(job_id)
+    except Exception:
+        logger.exception('Inventory import job %s crashed', job_id)
+        InventoryImportJob.objects.filter(pk=job_id).exclude(status='completed').update(
+            status='failed', finished_at=timezone.now(), message='Import crashed, see server logs'
+        )
+    finally:
+        connection.close()
+
+
+def submit_import_job(job):
+    """Queue a saved job for the worker pool once the current transaction commits"""
+    transaction.on_commit(lambda: _get_executor().submit(_run_in_background, job.pk))
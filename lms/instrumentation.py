@@ -0,0 +1,277 @@
+import bisect
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template import base as template_base
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; slower requests fall in a last, open bucket
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Server-Timing metric names and descriptions, in header order
+METRICS = {
+    'db': 'Database',
+    'tpl': 'Template render',
+    'pdf': 'PDF render',
+    'channels': 'Channel layer send',
+}
+
+# Slow request profiles kept by default; the oldest are removed beyond this
+PROFILE_MAX_FILES = 50
+
+_current = contextvars.ContextVar('lms_request_timings', default=None)
+
+
+class RequestTimings:
+    """Seconds spent per metric (and queries run) during one request"""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self.rendering = False
+
+    def add(self, name, seconds):
+        self.durations[name] += seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += time.perf_counter() - started
+            self.queries += 1
+
+
+@contextmanager
+def timed(name):
+    """Add the block's duration to metric `name` of the current request, if it is being timed"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+_original_render = template_base.Template.render
+
+
+def _timed_render(self, context):
+    timings = _current.get()
+    if timings is None or timings.rendering:  # included templates count towards the outer one
+        return _original_render(self, context)
+    timings.rendering = True
+    try:
+        with timed('tpl'):
+            return _original_render(self, context)
+    finally:
+        timings.rendering = False
+
+
+class LatencyHistogram:
+    """Per-endpoint request latencies of this process, for the admin metrics endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+
+    def observe(self, endpoint, total_ms, timings):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0,
+                    'metrics_ms': defaultdict(float), 'buckets': [0] * (len(BUCKETS_MS) + 1),
+                }
+            stats['count'] += 1
+            stats['total_ms'] += total_ms
+            stats['max_ms'] = max(stats['max_ms'], total_ms)
+            stats['queries'] += timings.queries
+            for name, seconds in timings.durations.items():
+                stats['metrics_ms'][name] += seconds * 1000
+            stats['buckets'][bisect.bisect_left(BUCKETS_MS, total_ms)] += 1
+
+    @staticmethod
+    def _percentile(buckets, count, pct):
+        """Upper bound of the bucket holding the pct-th percentile (None: above the last bound)"""
+        rank = count * pct / 100
+        seen = 0
+        for bound, hits in zip(BUCKETS_MS, buckets):
+            seen += hits
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        with self.lock:
+            endpoints = {}
+            for endpoint, stats in self.endpoints.items():
+                count = stats['count']
+                endpoints[endpoint] = {
+                    'count': count,
+                    'mean_ms': round(stats['total_ms'] / count, 2),
+                    'max_ms': round(stats['max_ms'], 2),
+                    'p50_ms': self._percentile(stats['buckets'], count, 50),
+                    'p95_ms': self._percentile(stats['buckets'], count, 95),
+                    'p99_ms': self._percentile(stats['buckets'], count, 99),
+                    'mean_queries': round(stats['queries'] / count, 1),
+                    'mean_metrics_ms': {name: round(ms / count, 2) for name, ms in stats['metrics_ms'].items()},
+                    'buckets': dict(zip([*map(str, BUCKETS_MS), 'inf'], stats['buckets'])),
+                }
+        return {
+            'pid': os.getpid(),
+            'bucket_bounds_ms': BUCKETS_MS,
+            'endpoints': dict(sorted(endpoints.items(), key=lambda item: -item[1]['mean_ms'] * item[1]['count'])),
+        }
+
+
+histogram = LatencyHistogram()
+
+
+def server_timing_header(timings, total_ms):
+    parts = [
+        f'{name};dur={timings.durations[name] * 1000:.1f};desc="{description}"'
+        for name, description in METRICS.items() if name in timings.durations
+    ]
+    parts.append(f'queries;desc="{timings.queries} queries"')
+    parts.append(f'total;dur={total_ms:.1f}')
+    return ', '.join(parts)
+
+
+def _start_profile():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is already active
+        return None
+    return profiler
+
+
+def save_profile(profiler, meta, directory, max_files=PROFILE_MAX_FILES):
+    """
+    Write the profiler's stats as a pstats file (read with `python -m pstats`
+    or snakeviz), with `meta` in a JSON file of the same name beside it, and
+    remove the oldest profiles beyond `max_files`.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    endpoint = meta['endpoint'].replace(' ', '_').replace(':', '-')
+    stem = f"{datetime.now():%Y%m%d-%H%M%S-%f}_{endpoint}_{meta['total_ms']:.0f}ms"
+    path = directory / f'{stem}.prof'
+    profiler.dump_stats(path)
+    (directory / f'{stem}.json').write_text(json.dumps(meta, indent=2))
+    for old in sorted(directory.glob('*.prof'))[:-max_files]:  # names start with the time
+        old.unlink(missing_ok=True)
+        old.with_suffix('.json').unlink(missing_ok=True)
+    return path
+
+
+def _user_id(request):
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+class ServerTimingMiddleware:
+    """
+    Times the database, template rendering, PDF rendering and channel layer
+    sends of each request. Adds a Server-Timing header (SERVER_TIMING_HEADER),
+    logs a JSON line for a SERVER_TIMING_LOG_SAMPLE_RATE share of requests,
+    and feeds the per-endpoint histogram of the performance_metrics view.
+    Disabled by SERVER_TIMING = False.
+
+    With SLOW_REQUEST_PROFILE_MS set, a SLOW_REQUEST_PROFILE_SAMPLE_RATE share
+    of requests also runs under cProfile, and the profiles of those taking at
+    least SLOW_REQUEST_PROFILE_MS (profiler overhead included) are kept in
+    SLOW_REQUEST_PROFILE_DIR, see save_profile().
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVER_TIMING', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = getattr(settings, 'SERVER_TIMING_HEADER', True)
+        self.sample_rate = getattr(settings, 'SERVER_TIMING_LOG_SAMPLE_RATE', 0.01)
+        self.profile_ms = getattr(settings, 'SLOW_REQUEST_PROFILE_MS', None)
+        self.profile_rate = getattr(settings, 'SLOW_REQUEST_PROFILE_SAMPLE_RATE', 0.05)
+        self.profile_dir = getattr(settings, 'SLOW_REQUEST_PROFILE_DIR', Path(settings.BASE_DIR) / 'profiles')
+        self.profile_max_files = getattr(settings, 'SLOW_REQUEST_PROFILE_MAX_FILES', PROFILE_MAX_FILES)
+        template_base.Template.render = _timed_render
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profiler = None
+        if self.profile_ms is not None and random.random() < self.profile_rate:
+            profiler = _start_profile()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings):
+                response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _current.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        match = request.resolver_match
+        endpoint = f'{request.method} {match.view_name if match else "unresolved"}'
+        histogram.observe(endpoint, total_ms, timings)
+        if self.header:
+            response['Server-Timing'] = server_timing_header(timings, total_ms)
+        if self.sample_rate and random.random() < self.sample_rate:
+            logger.info(json.dumps({
+                'endpoint': endpoint,
+                'path': request.path,
+                'status': response.status_code,
+                'user': _user_id(request),
+                'total_ms': round(total_ms, 1),
+                'queries': timings.queries,
+                **{f'{name}_ms': round(seconds * 1000, 1) for name, seconds in timings.durations.items()},
+            }))
+        if profiler is not None and total_ms >= self.profile_ms:
+            self._save_profile(profiler, request, response, endpoint, total_ms, timings)
+        return response
+
+    def _save_profile(self, profiler, request, response, endpoint, total_ms, timings):
+        user_id = _user_id(request)
+        meta = {
+            'endpoint': endpoint,
+            'url': request.get_full_path(),
+            'method': request.method,
+            'status': response.status_code,
+            'user': user_id,
+            'username': request.user.get_username() if user_id else None,
+            'total_ms': round(total_ms, 1),
+            'queries': timings.queries,
+            **{f'{name}_ms': round(seconds * 1000, 1) for name, seconds in timings.durations.items()},
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+        }
+        try:
+            path = save_profile(profiler, meta, self.profile_dir, self.profile_max_files)
+        except Exception:
+            logger.exception('Could not save the profile of a slow %s request', endpoint)
+        else:
+            logger.info('Slow %s request (%.0fms) profiled to %s', endpoint, total_ms, path)
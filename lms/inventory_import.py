@@ -0,0 +1,228 @@
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .inventory_index import inventory_changed
+from .locks import DatabaseLock
+from .models import InventoryItem
+from .rollups import apply_totals_change, sum_totals, track_totals
+
+# Rows buffered before they are written (and committed) together
+IMPORT_CHUNK_SIZE = 1000
+
+# Existing items changed by one UPDATE statement
+UPDATE_BATCH_SIZE = 500
+
+# Imports run one at a time; the lock is refreshed after every chunk and
+# expires this many seconds after the last one if the importer dies
+IMPORT_LOCK = 'inventory-import'
+IMPORT_LOCK_TTL = 300
+
+
+@dataclass
+class InventoryImportReport:
+    added: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)
+
+    @property
+    def error_count(self):
+        return len(self.errors)
+
+    def add_error(self, row_num, message):
+        self.errors.append({'row': row_num, 'error': message})
+
+    def error_lines(self):
+        return [f"Row {error['row']}: {error['error']}" for error in self.errors]
+
+    def as_dict(self):
+        return {'added': self.added, 'updated': self.updated, 'errors': self.errors}
+
+
+def parse_inventory_row(row):
+    """
+    Expected columns: Item Name, Unit Selling Price, Available Quantity, Quantity to be Ordered.
+    Returns (item_name, unit_selling_price, available_quantity, quantity_to_be_ordered).
+    """
+    item_name = str(row[0]).strip()
+    try:
+        unit_selling_price = Decimal(str(row[1])) if len(row) > 1 and row[1] else Decimal('0')
+    except InvalidOperation:
+        raise ValueError(f'Invalid unit price: {row[1]}')
+    available_quantity = int(row[2]) if len(row) > 2 and row[2] else 0
+    quantity_to_be_ordered = int(row[3]) if len(row) > 3 and row[3] else 0
+
+    if not item_name:
+        raise ValueError('Item name is required')
+    if unit_selling_price <= 0:
+        raise ValueError('Unit price must be greater than 0')
+    return item_name, unit_selling_price, available_quantity, quantity_to_be_ordered
+
+
+@dataclass
+class _ItemChange:
+    """What the rows of a chunk do to one existing item"""
+    unit_selling_price: Decimal
+    available_quantity: int = 0
+    quantity_to_be_ordered: int = 0
+
+
+class _ChunkWriter:
+    """
+    Buffers new items and changes to existing ones, and writes them in one
+    transaction per chunk. Quantities are applied as F() deltas, so stock
+    taken by BOQs while the import runs is not overwritten.
+    """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.to_create = []
+        self.changes = {}
+
+    def __len__(self):
+        return len(self.to_create) + len(self.changes)
+
+    def create(self, item):
+        self.to_create.append(item)
+
+    def change(self, item, unit_selling_price, available_quantity, quantity_to_be_ordered):
+        if item.pk is None:
+            # Still waiting in to_create, saved with its latest values
+            item.unit_selling_price = unit_selling_price
+            item.available_quantity += available_quantity
+            item.quantity_to_be_ordered += quantity_to_be_ordered
+            return
+        change = self.changes.setdefault(item.pk, _ItemChange(unit_selling_price))
+        change.unit_selling_price = unit_selling_price
+        change.available_quantity += available_quantity
+        change.quantity_to_be_ordered += quantity_to_be_ordered
+
+    def _update(self, changes, now):
+        def per_item(attr):
+            return Case(*[When(pk=pk, then=Value(getattr(change, attr))) for pk, change in changes])
+
+        InventoryItem.objects.filter(pk__in=[pk for pk, _ in changes]).update(
+            unit_selling_price=per_item('unit_selling_price'),
+            available_quantity=F('available_quantity') + per_item('available_quantity'),
+            quantity_to_be_ordered=F('quantity_to_be_ordered') + per_item('quantity_to_be_ordered'),
+            snapshot_d=now,
+        )
+
+    def flush(self):
+        now = timezone.now()
+        changes = list(self.changes.items())
+        with transaction.atomic():
+            if self.to_create:
+                InventoryItem.objects.bulk_create(self.to_create, batch_size=self.chunk_size)
+                apply_totals_change({}, sum_totals(InventoryItem, (
+                    (item.available_quantity, item.quantity_to_be_ordered) for item in self.to_create
+                )))
+            with track_totals(InventoryItem, [pk for pk, _ in changes]):
+                for start in range(0, len(changes), UPDATE_BATCH_SIZE):
+                    self._update(changes[start:start + UPDATE_BATCH_SIZE], now)
+        self.to_create, self.changes = [], {}
+
+
+def import_inventory_rows(rows, chunk_size=IMPORT_CHUNK_SIZE, on_progress=None, lock_timeout=None):
+    """
+    Upsert inventory from an iterable of (row_num, values) tuples.
+
+    Existing items are matched case-insensitively by name from an id map
+    loaded with one query; their quantities are added to and the price
+    replaced. Each chunk of `chunk_size` rows is written and committed on
+    its own, so other writers are not held up for the whole import.
+    `on_progress(processed_rows)` is called after every committed chunk.
+
+    Imports are serialized by a database lock, so two of them cannot both
+    create the same new item; this waits up to `lock_timeout` seconds (None:
+    until the running import finishes) and raises LockUnavailable after that.
+    """
+    with DatabaseLock(IMPORT_LOCK, ttl=IMPORT_LOCK_TTL, timeout=lock_timeout) as lock:
+        return _import_rows(rows, chunk_size, on_progress, lock)
+
+
+def _import_rows(rows, chunk_size, on_progress, lock):
+    report = InventoryImportReport()
+    items = {
+        item.item_name.casefold(): item
+        for item in InventoryItem.objects.only('id', 'item_name')
+    }
+    writer = _ChunkWriter(chunk_size)
+    processed = 0
+
+    for row_num, row in rows:
+        processed += 1
+        if not row or not row[0]:  # Skip empty rows
+            continue
+        try:
+            item_name, unit_selling_price, available_quantity, quantity_to_be_ordered = parse_inventory_row(row)
+        except Exception as e:
+            report.add_error(row_num, str(e))
+            continue
+
+        key = item_name.casefold()
+        item = items.get(key)
+        if item is not None:
+            # Update existing item (add to existing quantities)
+            writer.change(item, unit_selling_price, available_quantity, max(quantity_to_be_ordered, 0))
+            report.updated += 1
+        else:
+            item = InventoryItem(
+                item_name=item_name,
+                unit_selling_price=unit_selling_price,
+                available_quantity=available_quantity,
+                quantity_to_be_ordered=quantity_to_be_ordered,
+            )
+            items[key] = item
+            writer.create(item)
+            report.added += 1
+
+        if len(writer) >= chunk_size:
+            writer.flush()
+            lock.refresh()
+            if on_progress:
+                on_progress(processed)
+
+    writer.flush()
+    inventory_changed()  # bulk writes send no signals
+    if on_progress:
+        on_progress(processed)
+    return report
+
+
+def iter_workbook_rows(excel_file):
+    """
+    Stream (row_num, values) from the active sheet, skipping the header.
+    The workbook is opened (and validated) before the first row is requested.
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+
+    def rows():
+        try:
+            yield from enumerate(wb.active.iter_rows(min_row=2, values_only=True), start=2)
+        finally:
+            wb.close()
+
+    return rows()
+
+
+def workbook_row_count(excel_file):
+    """Data rows in the active sheet according to its stored dimensions (None if unknown)"""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        max_row = wb.active.max_row
+    finally:
+        wb.close()
+    return max(max_row - 1, 0) if max_row else None
+
+
+def import_inventory_workbook(excel_file, chunk_size=IMPORT_CHUNK_SIZE, on_progress=None):
+    """Import an inventory Excel file (path or file object) without loading it whole"""
+    return import_inventory_rows(iter_workbook_rows(excel_file), chunk_size=chunk_size, on_progress=on_progress)
@@ -0,0 +1,277 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import InventoryIndexChange, InventoryItem
+
+NGRAM_SIZES = (2, 3)
+DEFAULT_LIMIT = 10
+# Above this many n-gram candidates a search scans the sorted names instead of sorting candidates
+DENSE_MATCHES = 2000
+# Every inventory change is an InventoryIndexChange row whose id is the new
+# version; a worker whose index is at an older version re-reads the changed
+# items. Rows older than this are pruned (every PRUNE_EVERY versions).
+CHANGE_LOG_TTL = 3600
+PRUNE_EVERY = 100
+MAX_CATCH_UP_VERSIONS = 50
+MAX_CATCH_UP_ITEMS = 500
+
+
+@dataclass(frozen=True)
+class InventoryEntry:
+    id: int
+    name: str
+    price: Decimal
+    available_quantity: int
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'price': float(self.price),
+            'available_quantity': self.available_quantity,
+        }
+
+
+def _ngrams(text):
+    for size in NGRAM_SIZES:
+        for i in range(len(text) - size + 1):
+            yield text[i:i + size]
+
+
+class InventoryIndex:
+    """
+    In-memory search structure over inventory names: a sorted list of
+    (casefolded name, id) for prefix lookups and an n-gram -> ids map for
+    substring lookups.
+    """
+
+    def __init__(self, entries=()):
+        self.entries = {}
+        self.names = []
+        self.grams = defaultdict(set)
+        for entry in entries:
+            self.entries[entry.id] = entry
+            self.names.append((entry.name.casefold(), entry.id))
+            for gram in set(_ngrams(entry.name.casefold())):
+                self.grams[gram].add(entry.id)
+        self.names.sort()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, item_id):
+        return self.entries.get(item_id)
+
+    def remove(self, item_id):
+        entry = self.entries.pop(item_id, None)
+        if entry is None:
+            return
+        key = (entry.name.casefold(), entry.id)
+        i = bisect.bisect_left(self.names, key)
+        if i < len(self.names) and self.names[i] == key:
+            del self.names[i]
+        for gram in set(_ngrams(key[0])):
+            ids = self.grams.get(gram)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self.grams[gram]
+
+    def upsert(self, entry):
+        old = self.entries.get(entry.id)
+        if old is not None and old.name == entry.name:
+            self.entries[entry.id] = entry  # name unchanged, search structures stay valid
+            return
+        self.remove(entry.id)
+        self.entries[entry.id] = entry
+        bisect.insort(self.names, (entry.name.casefold(), entry.id))
+        for gram in set(_ngrams(entry.name.casefold())):
+            self.grams[gram].add(entry.id)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Items whose name contains `query`; names starting with it come first, then by name"""
+        query = query.strip().casefold()
+        if not query:
+            return []
+
+        results = []
+        start = bisect.bisect_left(self.names, (query,))
+        for name, item_id in self.names[start:start + limit]:
+            if not name.startswith(query):
+                break
+            results.append(self.entries[item_id])
+        if len(results) >= limit:
+            return results
+
+        seen = {entry.id for entry in results}
+        wanted = limit - len(results)
+        postings = [self.entries.keys()]
+        if len(query) >= NGRAM_SIZES[0]:
+            size = min(len(query), NGRAM_SIZES[-1])
+            postings = sorted((self.grams.get(query[i:i + size], set())
+                               for i in range(len(query) - size + 1)), key=len)
+
+        if len(postings[0]) > DENSE_MATCHES:
+            # Common substring: walking the names in order finds `wanted` matches quickly
+            matches = []
+            for name, item_id in self.names:
+                if item_id not in seen and query in name:
+                    matches.append(self.entries[item_id])
+                    if len(matches) == wanted:
+                        break
+            return results + matches
+
+        candidates = set(postings[0]).intersection(*postings[1:])
+        matches = heapq.nsmallest(
+            wanted,
+            (self.entries[item_id] for item_id in candidates
+             if item_id not in seen and query in self.entries[item_id].name.casefold()),
+            key=lambda entry: (entry.name.casefold(), entry.id),
+        )
+        return results + matches
+
+
+def _load_entries(ids=None):
+    items = InventoryItem.objects.order_by().values_list('id', 'item_name', 'unit_selling_price', 'available_quantity')
+    if ids is not None:
+        items = items.filter(pk__in=ids)
+    return [InventoryEntry(*row) for row in items.iterator(chunk_size=2000)]
+
+
+def _current_version():
+    return InventoryIndexChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def _publish(ids):
+    """Record a change to `ids` (None = everything) and return its version"""
+    version = InventoryIndexChange.objects.create(item_ids=None if ids is None else sorted(ids)).pk
+    if version % PRUNE_EVERY == 0:
+        InventoryIndexChange.objects.filter(
+            id__lt=version, created_at__lt=timezone.now() - timedelta(seconds=CHANGE_LOG_TTL)
+        ).delete()
+    return version
+
+
+def _changed_since(version, current):
+    """Ids changed between two versions, or None if a full reload is needed"""
+    if current - version > MAX_CATCH_UP_VERSIONS:
+        return None
+    changes = list(
+        InventoryIndexChange.objects.filter(id__gt=version, id__lte=current).values_list('item_ids', flat=True)
+    )
+    if len(changes) != current - version:  # pruned, or a change still being committed
+        return None
+    ids = set()
+    for item_ids in changes:
+        if item_ids is None:  # a full reload was published
+            return None
+        ids.update(item_ids)
+    return ids if len(ids) <= MAX_CATCH_UP_ITEMS else None
+
+
+# ============================================================================
+# PROCESS-LOCAL INSTANCE
+# ============================================================================
+
+_index = None
+_index_version = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def _apply(ids):
+    ids = list(ids)
+    entries = {entry.id: entry for entry in _load_entries(ids)}
+    for item_id in ids:
+        if item_id in entries:
+            _index.upsert(entries[item_id])
+        else:
+            _index.remove(item_id)
+
+
+def get_index():
+    """
+    The process-local index, loaded on first use. When other workers changed
+    the inventory (newer InventoryIndexChange rows) only the changed items are re-read;
+    everything is reloaded after INVENTORY_INDEX_MAX_AGE seconds to catch
+    writes that bypass the ORM.
+    """
+    global _index, _index_version, _loaded_at
+    version = _current_version()
+    max_age = getattr(settings, 'INVENTORY_INDEX_MAX_AGE', 300)
+    with _lock:
+        if _index is not None and time.monotonic() - _loaded_at > max_age:
+            _index = None
+        if _index is not None and _index_version != version:
+            ids = _changed_since(_index_version, version) if _index_version < version else None
+            if ids is None:
+                _index = None
+            else:
+                _apply(ids)
+                _index_version = version
+        if _index is None:
+            _index = InventoryIndex(_load_entries())
+            _index_version = version
+            _loaded_at = time.monotonic()
+        return _index
+
+
+def _refresh(ids):
+    """Publish a change to `ids` (None = everything) and apply it to the local index"""
+    global _index, _index_version
+    version = _publish(ids)
+    with _lock:
+        if _index is None:
+            return
+        if ids is None:
+            _index = None
+        elif _index_version == version - 1:
+            _apply(ids)
+            _index_version = version
+        # Otherwise other workers changed it too; get_index() catches up on all of it
+
+
+# Item ids changed by the current thread's transaction(s), refreshed on commit
+_pending = threading.local()
+
+
+def _flush_pending():
+    full = getattr(_pending, 'full', False)
+    ids = getattr(_pending, 'ids', set())
+    _pending.full, _pending.ids = False, set()
+    if full or ids:
+        _refresh(None if full else ids)
+
+
+def inventory_changed(ids=None):
+    """
+    Refresh the index for the given inventory item ids (None = all) once
+    the current transaction commits. Called by the InventoryItem signals and
+    by bulk writers, which send no signals.
+    """
+    if ids is None:
+        _pending.full = True
+    else:
+        if not hasattr(_pending, 'ids'):
+            _pending.ids = set()
+        _pending.ids.update(ids)
+    transaction.on_commit(_flush_pending)
+
+
+def search_inventory(query, limit=DEFAULT_LIMIT):
+    return get_index().search(query, limit)
+
+
+def get_inventory_entry(item_id):
+    return get_index().get(item_id)
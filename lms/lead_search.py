@@ -0,0 +1,198 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from .models import LeadSource
+
+# FTS5 table (SQLite) holding one row per lead, rowid = lead id
+SEARCH_TABLE = 'lms_leadsource_search'
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+_fts_ready = False
+
+
+def _fts_enabled():
+    global _fts_ready
+    if connection.vendor != 'sqlite':
+        return False
+    if not _fts_ready:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+            _fts_ready = cursor.fetchone() is not None
+    return _fts_ready
+
+
+def search_document(first_name, last_name, phone_number):
+    """Indexed columns of a lead: its name and the reversed digits of its phone number"""
+    name = f"{first_name or ''} {last_name or ''}".strip()
+    phone_rev = re.sub(r'\D', '', phone_number or '')[::-1]
+    return name, phone_rev
+
+
+def index_lead(lead):
+    """Add or refresh a lead in the search index"""
+    if not _fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [lead.pk])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, phone_rev) VALUES (%s, %s, %s)',
+            [lead.pk, *search_document(lead.first_name, lead.last_name, lead.phone_number)],
+        )
+
+
+def remove_lead(lead_id):
+    if not _fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [lead_id])
+
+
+@transaction.atomic
+def rebuild_lead_index(batch_size=5000):
+    """Re-index every lead, e.g. after bulk_create (which sends no signals)"""
+    if not _fts_enabled():
+        return 0
+    count = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        rows = LeadSource.objects.order_by().values_list('id', 'first_name', 'last_name', 'phone_number')
+        batch = []
+        for pk, first_name, last_name, phone_number in rows.iterator(chunk_size=batch_size):
+            batch.append((pk, *search_document(first_name, last_name, phone_number)))
+            if len(batch) >= batch_size:
+                cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, name, phone_rev) VALUES (%s, %s, %s)', batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, name, phone_rev) VALUES (%s, %s, %s)', batch)
+            count += len(batch)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def parse_query(query):
+    """
+    Split a search string into (name_prefixes, phone_suffixes). A query made of
+    digits only (spaces, dashes and + allowed) is one phone number; otherwise
+    digit-only words are phone suffixes and the rest name prefixes.
+    """
+    query = query.strip()
+    if re.fullmatch(r'[\d\s+\-]+', query):
+        digits = re.sub(r'\D', '', query)
+        return [], [digits] if digits else []
+
+    names, phones = [], []
+    for term in query.split():
+        if term.isdigit():
+            phones.append(term)
+        else:
+            term = re.sub(r'[^\w]+', ' ', term).strip()
+            if term:
+                names.append(term)
+    return names, phones
+
+
+def _fts_phrase(term, prefix=True):
+    return '"' + term.replace('"', '""') + ('"*' if prefix else '"')
+
+
+def _fts_ids(cursor, match, limit, exclude=()):
+    cursor.execute(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s',
+        [match, limit + len(exclude)],
+    )
+    return [row[0] for row in cursor.fetchall() if row[0] not in exclude]
+
+
+def _phone_match(phones):
+    return [f'phone_rev : {_fts_phrase(digits[::-1])}' for digits in phones]
+
+
+def _prefix_match(names, phones):
+    return ' AND '.join([f'name : {_fts_phrase(term)}' for term in names] + _phone_match(phones))
+
+
+def _search_fts(names, phones, limit):
+    """
+    Ranking: leads whose name words match the typed words exactly come first,
+    then prefix matches; newest first within each group. Both lookups walk the
+    index in rowid order and stop at `limit`, so they stay fast however many
+    leads share a prefix (bm25 would have to score every match).
+    """
+    phone_match = _phone_match(phones)
+    prefix_match = _prefix_match(names, phones)
+
+    with connection.cursor() as cursor:
+        ids = []
+        if names:
+            exact_match = ' AND '.join([f'name : {_fts_phrase(term, prefix=False)}' for term in names] + phone_match)
+            ids = _fts_ids(cursor, exact_match, limit)
+        if len(ids) < limit:
+            ids += _fts_ids(cursor, prefix_match, limit - len(ids), exclude=set(ids))
+    return ids[:limit]
+
+
+def _orm_filter(names, phones):
+    condition = Q()
+    for term in names:
+        condition &= Q(first_name__istartswith=term) | Q(last_name__istartswith=term)
+    for digits in phones:
+        condition &= Q(phone_number__endswith=digits)
+    return condition
+
+
+def _search_orm(names, phones, limit):
+    """PostgreSQL (served by the pg_trgm indexes) and other databases"""
+    leads = LeadSource.objects.order_by().filter(_orm_filter(names, phones))
+
+    if names and connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        query = ' '.join(names)
+        leads = leads.annotate(
+            rank=TrigramSimilarity('first_name', query)
+            + TrigramSimilarity(Coalesce('last_name', Value('')), query)
+        ).order_by('-rank', '-snapshot_d')
+    else:
+        leads = leads.order_by('-snapshot_d')
+    return list(leads.values_list('id', flat=True)[:limit])
+
+
+def search_lead_ids(query, limit=DEFAULT_LIMIT):
+    """Ids of the leads matching `query`, best match first"""
+    names, phones = parse_query(query)
+    if not names and not phones:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+    if _fts_enabled():
+        return _search_fts(names, phones, limit)
+    return _search_orm(names, phones, limit)
+
+
+def filter_leads(leads, query):
+    """
+    `leads` narrowed to the ones matching `query` (same matching as
+    search_lead_ids, without its limit or ranking), for list pages that
+    paginate in their own order. A query without search terms keeps them all.
+    """
+    names, phones = parse_query(query)
+    if not names and not phones:
+        return leads
+    if _fts_enabled():
+        return leads.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [_prefix_match(names, phones)]
+        ))
+    return leads.filter(_orm_filter(names, phones))
+
+
+def search_leads(query, limit=DEFAULT_LIMIT, fields=('id', 'first_name', 'last_name')):
+    """Matching leads as dicts of `fields`, in ranking order"""
+    ids = search_lead_ids(query, limit)
+    rows = {row['id']: row for row in LeadSource.objects.filter(pk__in=ids).values('id', *(f for f in fields if f != 'id'))}
+    return [{field: rows[pk][field] for field in fields} for pk in ids if pk in rows]
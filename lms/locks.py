@@ -0,0 +1,73 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import NamedLock
+
+# Seconds between attempts while waiting for a lock
+LOCK_POLL_INTERVAL = 1.0
+
+
+class LockUnavailable(Exception):
+    pass
+
+
+class DatabaseLock:
+    """
+    A named lock held in the NamedLock table, so it works across processes
+    and hosts sharing the database. It is held until release(), or until
+    `ttl` seconds pass without refresh(), after which another process may
+    take it over (a crashed holder cannot block everyone). Acquire it
+    outside a transaction so other processes see it.
+
+        with DatabaseLock('inventory-import', ttl=300):
+            ...
+    """
+
+    def __init__(self, name, ttl=300, timeout=None):
+        self.name = name
+        self.ttl = ttl
+        self.timeout = timeout
+        self.owner = uuid.uuid4().hex
+
+    def _expiry(self):
+        return timezone.now() + timedelta(seconds=self.ttl)
+
+    def try_acquire(self):
+        # Take over an expired lock, else create it
+        if NamedLock.objects.filter(name=self.name, expires_at__lt=timezone.now()).update(
+            owner=self.owner, expires_at=self._expiry()
+        ):
+            return True
+        try:
+            with transaction.atomic():
+                NamedLock.objects.create(name=self.name, owner=self.owner, expires_at=self._expiry())
+            return True
+        except IntegrityError:
+            return False
+
+    def acquire(self, timeout=None):
+        """Wait up to `timeout` seconds (None: as long as it takes) for the lock"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire():
+            if deadline is not None and time.monotonic() >= deadline:
+                raise LockUnavailable(f'{self.name} is held by another process')
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def refresh(self):
+        """Extend the lock by `ttl`; LockUnavailable if it expired and was taken over"""
+        if not NamedLock.objects.filter(name=self.name, owner=self.owner).update(expires_at=self._expiry()):
+            raise LockUnavailable(f'{self.name} expired and was taken over')
+
+    def release(self):
+        NamedLock.objects.filter(name=self.name, owner=self.owner).delete()
+
+    def __enter__(self):
+        self.acquire(self.timeout)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
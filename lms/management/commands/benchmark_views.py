@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from lms.benchmarks import (
+    BASELINE_PATH,
+    BYTES_THRESHOLD,
+    QUERY_THRESHOLD,
+    TIME_THRESHOLD,
+    compare,
+    load_baseline,
+    run_benchmarks,
+    seed_benchmark_data,
+    write_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the main views (wall time percentiles, queries, response bytes) on seeded data '
+        'in a throwaway test database, and fail on regressions against the committed baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per endpoint first')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH), help='Baseline JSON file')
+        parser.add_argument('--update-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--time-threshold', type=float, default=TIME_THRESHOLD, help='Allowed relative slowdown')
+        parser.add_argument('--no-time', action='store_true', help='Only compare queries and bytes')
+        parser.add_argument('--query-threshold', type=int, default=QUERY_THRESHOLD, help='Allowed extra queries')
+        parser.add_argument('--bytes-threshold', type=float, default=BYTES_THRESHOLD, help='Allowed relative growth')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write('Seeding benchmark data...')
+            seed_benchmark_data()
+            results = run_benchmarks(iterations=options['iterations'], warmup=options['warmup'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'endpoint':<18} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'queries':>8} {'bytes':>9}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<18} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['max_ms']:>9} "
+                f"{result['queries']:>8} {result['bytes']:>9}"
+            )
+
+        if options['update_baseline']:
+            write_baseline(results, options['baseline'], iterations=options['iterations'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+
+        try:
+            baseline = load_baseline(options['baseline'])
+        except FileNotFoundError:
+            raise CommandError(f"No baseline at {options['baseline']}; run with --update-baseline first")
+        regressions = compare(
+            results,
+            baseline,
+            time_threshold=None if options['no_time'] else options['time_threshold'],
+            query_threshold=options['query_threshold'],
+            bytes_threshold=options['bytes_threshold'],
+        )
+        if regressions:
+            for line in regressions:
+                self.stderr.write(line)
+            raise CommandError(f'{len(regressions)} benchmark regression(s)')
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
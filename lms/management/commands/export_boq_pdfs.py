@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.pdf import PDF_AVAILABLE, ExportStats, export_queryset, stream_boq_zip
+
+
+class Command(BaseCommand):
+    help = 'Render the PDFs of all matching BOQs in parallel and write them to a ZIP file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the ZIP file to write')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='Created on or after (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Created on or before (YYYY-MM-DD)')
+        parser.add_argument('--status', help='BOQ status, e.g. approved')
+        parser.add_argument('--project', type=int, help='Project id')
+        parser.add_argument('--processes', type=int, help='Worker processes (default: available cores)')
+
+    def handle(self, *args, **options):
+        if not PDF_AVAILABLE:
+            raise CommandError('xhtml2pdf is not installed.')
+
+        boqs = export_queryset(
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+            status=options['status'],
+            project_id=options['project'],
+        )
+        stats = ExportStats()
+        with open(options['output'], 'wb') as output:
+            for chunk in stream_boq_zip(boqs, processes=options['processes'], stats=stats):
+                output.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(stats.summary()))
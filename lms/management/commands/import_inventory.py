@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.inventory_import import IMPORT_CHUNK_SIZE, import_inventory_workbook
+
+
+class Command(BaseCommand):
+    help = 'Import inventory items from an Excel file (Item Name, Unit Selling Price, Available Quantity, Quantity to be Ordered)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the .xlsx file')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Rows written per bulk query')
+        parser.add_argument('--report', help='Write the full error report to this JSON file')
+
+    def handle(self, *args, **options):
+        try:
+            report = import_inventory_workbook(
+                options['path'],
+                chunk_size=options['chunk_size'],
+                on_progress=lambda rows: self.stdout.write(f'{rows} rows processed'),
+            )
+        except FileNotFoundError:
+            raise CommandError(f"File not found: {options['path']}")
+
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(report.as_dict(), f, indent=2)
+
+        for line in report.error_lines()[:20]:
+            self.stderr.write(line)
+        self.stdout.write(self.style.SUCCESS(
+            f'Import completed! Added: {report.added}, Updated: {report.updated}, Errors: {report.error_count}'
+        ))
@@ -0,0 +1,30 @@
+from argparse import BooleanOptionalAction
+
+from django.core.management.base import BaseCommand
+
+from lms.locks import LockUnavailable
+from lms.notification_retention import run_retention
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete or archive expired notifications (NOTIFICATION_READ_TTL_DAYS / NOTIFICATION_UNREAD_TTL_DAYS). '
+        'Meant to run from cron; a run that overlaps another one exits without doing anything.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows removed per transaction (default: NOTIFICATION_RETENTION_BATCH)')
+        parser.add_argument('--archive', action=BooleanOptionalAction, help='Copy removed rows to NotificationArchive (default: NOTIFICATION_ARCHIVE)')
+        parser.add_argument('--collapse', action=BooleanOptionalAction, help='Keep only the newest of identical notifications per user (default: NOTIFICATION_COLLAPSE_DUPLICATES)')
+
+    def handle(self, *args, **options):
+        try:
+            report = run_retention(
+                batch_size=options['batch_size'],
+                archive=options['archive'],
+                collapse=options['collapse'],
+            )
+        except LockUnavailable:
+            self.stdout.write('Another prune_notifications run is in progress; skipping.')
+            return
+        self.stdout.write(self.style.SUCCESS(str(report)))
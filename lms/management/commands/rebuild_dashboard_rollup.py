@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from lms.rollups import rebuild_inventory_rollup, rebuild_project_rollup, rebuild_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the dashboard rollup tables from Project and approved BOQ items, '
+        'and the page header totals from LeadSource and InventoryItem'
+    )
+
+    def handle(self, *args, **options):
+        buckets = rebuild_project_rollup()
+        items = rebuild_inventory_rollup()
+        totals = rebuild_totals()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {buckets} dashboard buckets, {items} inventory sales rows and {totals} page totals.'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from lms.lead_search import rebuild_lead_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the lead search index (needed after bulk inserts, which send no signals)'
+
+    def handle(self, *args, **options):
+        count = rebuild_lead_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} leads.'))
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+
+def populate_rollups(apps, schema_editor):
+    Project = apps.get_model('lms', 'Project')
+    BOQItem = apps.get_model('lms', 'BOQItem')
+    DashboardRollup = apps.get_model('lms', 'DashboardRollup')
+    InventorySalesRollup = apps.get_model('lms', 'InventorySalesRollup')
+
+    buckets = (
+        Project.objects.order_by()
+        .annotate(bucket_city=Coalesce('city', Value('')), bucket_month=TruncMonth('snapshot_d'))
+        .values('user_id', 'bucket_city', 'status', 'bucket_month')
+        .annotate(
+            project_count=Count('id'),
+            priced_count=Count('id', filter=Q(amount__gt=0)),
+            revenue=Sum('amount', filter=Q(amount__gt=0)),
+        )
+    )
+    DashboardRollup.objects.bulk_create([
+        DashboardRollup(
+            user_id=row['user_id'],
+            city=row['bucket_city'],
+            status=row['status'],
+            month=timezone.localtime(row['bucket_month']).date(),
+            project_count=row['project_count'],
+            priced_count=row['priced_count'],
+            revenue=row['revenue'] or 0,
+        )
+        for row in buckets
+    ], batch_size=500)
+
+    sales = (
+        BOQItem.objects.filter(boq__status='approved')
+        .values('inventory_item_id')
+        .annotate(sold=Sum('quantity'), sales=Sum(F('quantity') * F('unit_price')))
+    )
+    InventorySalesRollup.objects.bulk_create([
+        InventorySalesRollup(
+            inventory_item_id=row['inventory_item_id'],
+            quantity_sold=row['sold'],
+            revenue=row['sales'],
+        )
+        for row in sales
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0013_remove_leadsource_city_project_city'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity_sold', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('inventory_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollup', to='lms.inventoryitem')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DashboardRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(blank=True, default='', max_length=100)),
+                ('status', models.CharField(max_length=100)),
+                ('month', models.DateField()),
+                ('project_count', models.IntegerField(default=0)),
+                ('priced_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'city', 'status', 'month'), name='unique_dashboard_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
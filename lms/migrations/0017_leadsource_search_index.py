@@ -0,0 +1,59 @@
+import re
+
+from django.db import migrations
+
+SEARCH_TABLE = 'lms_leadsource_search'
+
+POSTGRES_INDEXES = {
+    'lms_lead_first_name_trgm': 'UPPER(first_name) gin_trgm_ops',
+    'lms_lead_last_name_trgm': 'UPPER(last_name) gin_trgm_ops',
+    'lms_lead_phone_trgm': 'phone_number gin_trgm_ops',
+}
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, expression in POSTGRES_INDEXES.items():
+            schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON lms_leadsource USING gin ({expression})')
+        return
+    if connection.vendor != 'sqlite':
+        return
+
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+        "name, phone_rev, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4 5 6')"
+    )
+    LeadSource = apps.get_model('lms', 'LeadSource')
+    rows = [
+        (
+            pk,
+            f"{first_name or ''} {last_name or ''}".strip(),
+            re.sub(r'\D', '', phone_number or '')[::-1],
+        )
+        for pk, first_name, last_name, phone_number
+        in LeadSource.objects.values_list('id', 'first_name', 'last_name', 'phone_number').iterator()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, name, phone_rev) VALUES (%s, %s, %s)', rows)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        for name in POSTGRES_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0016_inventoryimportjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0017_leadsource_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(fields=['item_name', 'id'], name='inventory_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leadsource',
+            index=models.Index(fields=['-snapshot_d', 'id'], name='lead_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at', 'id'], name='notification_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['-snapshot_d', 'id'], name='project_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status', '-snapshot_d', 'id'], name='project_status_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_lead_phones(apps, schema_editor):
+    """Fail with a readable message instead of an IntegrityError from the constraint"""
+    LeadSource = apps.get_model('lms', 'LeadSource')
+    duplicates = list(
+        LeadSource.objects.values('country_code', 'phone_number')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('country_code', 'phone_number')[:20]
+    )
+    if duplicates:
+        numbers = ', '.join(f"{d['country_code']}{d['phone_number']} ({d['count']})" for d in duplicates)
+        raise RuntimeError(f'Merge or delete lead sources sharing a phone number before migrating: {numbers}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0018_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='boq',
+            index=models.Index(fields=['project', 'created_at'], name='boq_project_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryorderrequirement',
+            index=models.Index(fields=['inventory_item', 'created_at'], name='requirement_item_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['user', 'status'], name='project_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['city'], name='project_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'completed', 'due_date'], name='task_user_open_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_by', 'completed', 'due_date'], name='task_assigner_open_due_idx'),
+        ),
+        # The composite indexes above lead with these foreign keys
+        migrations.AlterField(
+            model_name='notification',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='assigned_by',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tasks_assigned_by', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='user',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tasks_assigned_to', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(check_duplicate_lead_phones, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='leadsource',
+            constraint=models.UniqueConstraint(fields=('country_code', 'phone_number'), name='unique_lead_phone'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_lead_source_rollup(apps, schema_editor):
+    Project = apps.get_model('lms', 'Project')
+    LeadSourceRollup = apps.get_model('lms', 'LeadSourceRollup')
+
+    rows = (
+        Project.objects.filter(lead_source__isnull=False)
+        .order_by()
+        .values('lead_source_id')
+        .annotate(count=Count('id'))
+    )
+    LeadSourceRollup.objects.bulk_create([
+        LeadSourceRollup(lead_source_id=row['lead_source_id'], project_count=row['count'])
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0020_notification_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadSourceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['-amount'], name='project_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['user', '-amount'], name='project_user_amount_idx'),
+        ),
+        migrations.AddField(
+            model_name='leadsourcerollup',
+            name='lead_source',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='project_rollup', to='lms.leadsource'),
+        ),
+        migrations.AddIndex(
+            model_name='leadsourcerollup',
+            index=models.Index(fields=['-project_count'], name='leadsource_rollup_count_idx'),
+        ),
+        migrations.RunPython(populate_lead_source_rollup, migrations.RunPython.noop),
+    ]
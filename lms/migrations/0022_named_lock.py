@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0021_dashboard_lead_source_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NamedLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('owner', models.CharField(max_length=64)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:16
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_rollup_totals(apps, schema_editor):
+    LeadSource = apps.get_model('lms', 'LeadSource')
+    InventoryItem = apps.get_model('lms', 'InventoryItem')
+    RollupTotal = apps.get_model('lms', 'RollupTotal')
+
+    totals = {
+        **LeadSource.objects.aggregate(
+            leads=Count('id'),
+            leads_with_projects=Count('id', filter=Q(has_project=True)),
+        ),
+        **InventoryItem.objects.aggregate(
+            inventory=Count('id'),
+            inventory_low_stock=Count('id', filter=Q(available_quantity__gt=0, available_quantity__lt=10)),
+            inventory_out_of_stock=Count('id', filter=Q(available_quantity=0)),
+            inventory_to_order=Coalesce(Sum('quantity_to_be_ordered'), 0),
+        ),
+    }
+    RollupTotal.objects.bulk_create([RollupTotal(name=name, value=value) for name, value in totals.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0023_inventory_index_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_rollup_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0024_rollup_total'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['project_name'], name='project_name_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from datetime import datetime
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
@@ -27,10 +29,22 @@ class LeadSource(models.Model):
     def __str__(self):
         return f"{self.first_name} {self.last_name} - {self.country_code}{self.phone_number}"
 
+    def save(self, *args, **kwargs):
+        from .rollups import track_saved_totals
+
+        with transaction.atomic(), track_saved_totals(self):
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Lead Source'
         verbose_name_plural = 'Lead Sources'
         ordering = ['-snapshot_d']
+        indexes = [
+            models.Index(fields=['-snapshot_d', 'id'], name='lead_recent_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['country_code', 'phone_number'], name='unique_lead_phone'),
+        ]
 
 
 class InventoryItem(models.Model):
@@ -43,11 +57,22 @@ class InventoryItem(models.Model):
     def __str__(self):
         return self.item_name
 
+    def save(self, *args, **kwargs):
+        from .rollups import track_saved_totals
+
+        with transaction.atomic(), track_saved_totals(self):
+            super().save(*args, **kwargs)
+
     @property
     def is_low_stock(self):
         """Returns True if stock is below 10 units"""
         return self.available_quantity < 10
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['item_name', 'id'], name='inventory_name_idx'),
+        ]
+
 
 class Project(models.Model):
     project_name = models.CharField(max_length=255)
@@ -60,9 +85,98 @@ class Project(models.Model):
     snapshot_d = models.DateTimeField(auto_now=True)
     city = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-snapshot_d', 'id'], name='project_recent_idx'),
+            models.Index(fields=['status', '-snapshot_d', 'id'], name='project_status_recent_idx'),
+            models.Index(fields=['user', 'status'], name='project_user_status_idx'),
+            models.Index(fields=['city'], name='project_city_idx'),
+            # Project dropdown of the task forms
+            models.Index(fields=['project_name'], name='project_name_idx'),
+            # Top deals on the dashboard
+            models.Index(fields=['-amount'], name='project_amount_idx'),
+            models.Index(fields=['user', '-amount'], name='project_user_amount_idx'),
+        ]
+
     def __str__(self):
         return self.project_name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what this row contributes to the dashboard rollup
+        from .rollups import project_state
+        instance._rollup_state = project_state(instance)
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .rollups import apply_project_change, project_state, stored_project_state
+
+        with transaction.atomic():
+            old_state = getattr(self, '_rollup_state', None)
+            if self.pk and old_state is None:
+                old_state = stored_project_state(self.pk)
+            super().save(*args, **kwargs)
+            new_state = project_state(self)
+            apply_project_change(old_state, new_state)
+        self._rollup_state = new_state
+
+
+class InvoiceSequence(models.Model):
+    """Per-day counter behind the INV-YYYYMMDD-XXXX invoice numbers"""
+    day = models.DateField(unique=True)
+    last_number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day:%Y%m%d}: {self.last_number}"
+
+    @staticmethod
+    def format_number(day, number):
+        return f'INV-{day:%Y%m%d}-{number:04d}'
+
+    @classmethod
+    def allocate(cls, count=1, day=None):
+        """
+        Atomically take `count` consecutive numbers for `day` (today by default)
+        and return them as a range. The counter row is bumped with a single
+        UPDATE, which holds its row lock until the surrounding transaction ends.
+        """
+        day = day or timezone.localdate()
+        while True:
+            with transaction.atomic():
+                if cls.objects.filter(day=day).update(last_number=F('last_number') + count):
+                    last = cls.objects.filter(day=day).values_list('last_number', flat=True).get()
+                    return range(last - count + 1, last + 1)
+                try:
+                    # First invoice of the day: continue after numbers issued before the counter existed
+                    with transaction.atomic():
+                        start = cls._highest_issued(day) + 1
+                        cls.objects.create(day=day, last_number=start + count - 1)
+                    return range(start, start + count)
+                except IntegrityError:
+                    # Another request created today's counter first; bump it instead
+                    continue
+
+    @classmethod
+    def _highest_issued(cls, day):
+        prefix = f'INV-{day:%Y%m%d}-'
+        highest = 0
+        for number in BOQ.objects.filter(invoice_number__startswith=prefix).values_list('invoice_number', flat=True):
+            suffix = number[len(prefix):]
+            if suffix.isdigit():
+                highest = max(highest, int(suffix))
+        return highest
+
+    @classmethod
+    def reserve(cls, count, day=None):
+        """Reserve a batch of invoice numbers, e.g. for bulk imports"""
+        day = day or timezone.localdate()
+        return [cls.format_number(day, number) for number in cls.allocate(count, day)]
+
+    @classmethod
+    def next_invoice_number(cls):
+        return cls.reserve(1)[0]
+
 
 class BOQ(models.Model):
     """Bill of Quantity for a lead"""
@@ -119,32 +233,54 @@ class BOQ(models.Model):
         ordering = ['-created_at']
         verbose_name = 'BOQ'
         verbose_name_plural = 'BOQs'
+        indexes = [
+            models.Index(fields=['project', 'created_at'], name='boq_project_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.invoice_number} - {self.lead_source}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            instance._loaded_status = instance.status
+        return instance
+
+    # Attempts at saving a new BOQ when its allocated invoice number is already taken
+    INVOICE_SAVE_ATTEMPTS = 5
+
     def save(self, *args, **kwargs):
-        if not self.invoice_number:
-            # Generate invoice number: INV-YYYYMMDD-XXXX
-            from django.db.models import Max
-            today = datetime.now().strftime('%Y%m%d')
-            last_invoice = BOQ.objects.filter(
-                invoice_number__startswith=f'INV-{today}'
-            ).aggregate(Max('invoice_number'))
-            
-            if last_invoice['invoice_number__max']:
-                last_number = int(last_invoice['invoice_number__max'].split('-')[-1])
-                new_number = last_number + 1
-            else:
-                new_number = 1
-            
-            self.invoice_number = f'INV-{today}-{new_number:04d}'
-        
-        super().save(*args, **kwargs)
+        if self.invoice_number:
+            return self._save_tracking_status(*args, **kwargs)
+
+        # Generate invoice number: INV-YYYYMMDD-XXXX
+        for attempt in range(1, self.INVOICE_SAVE_ATTEMPTS + 1):
+            self.invoice_number = InvoiceSequence.next_invoice_number()
+            try:
+                return self._save_tracking_status(*args, **kwargs)
+            except IntegrityError:
+                # The number may have been assigned by hand (update_invoice_number); take the next one
+                taken = BOQ.objects.filter(invoice_number=self.invoice_number).exists()
+                self.invoice_number = ''
+                if not taken or attempt == self.INVOICE_SAVE_ATTEMPTS:
+                    raise
+
+    def _save_tracking_status(self, *args, **kwargs):
+        from .rollups import apply_boq_approval
+
+        was_approved = getattr(self, '_loaded_status', None) == 'approved'
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Approving (or un-approving) a BOQ moves its items in/out of the sales rollup
+            if was_approved != (self.status == 'approved'):
+                apply_boq_approval(self, 1 if self.status == 'approved' else -1)
+        self._loaded_status = self.status
     
-    def calculate_totals(self):
-        """Calculate all totals for the BOQ"""
-        items = self.items.all()
+    def calculate_totals(self, items=None):
+        """Calculate all totals for the BOQ (pass `items` to skip re-reading them)"""
+        if items is None:
+            items = self.items.all()
         
         # Calculate subtotal (sum of gross amounts BEFORE discounts)
         subtotal = Decimal('0')
@@ -217,11 +353,19 @@ class BOQItem(models.Model):
     def __str__(self):
         return f"{self.sr_no}. {self.item_name}"
     
-    def save(self, *args, **kwargs):
+    @property
+    def shortage(self):
+        """Units missing from stock for this line"""
+        return max(self.quantity - self.available_quantity, 0)
+
+    def price_from_inventory(self, available_quantity=None):
+        """Copy inventory details onto the line and calculate discount and line total"""
         # Store current inventory details
         self.item_name = self.inventory_item.item_name
         self.unit_price = Decimal(str(self.inventory_item.unit_selling_price))
-        self.available_quantity = self.inventory_item.available_quantity
+        if available_quantity is None:
+            available_quantity = self.inventory_item.available_quantity
+        self.available_quantity = available_quantity
         
         # Check stock availability
         self.has_sufficient_stock = self.available_quantity >= self.quantity
@@ -236,14 +380,16 @@ class BOQItem(models.Model):
         
         # Calculate line total (after discount, before tax)
         self.line_total = gross_amount - self.discount_amount
+
+    def save(self, *args, **kwargs):
+        self.price_from_inventory()
         
         super().save(*args, **kwargs)
         
         # Update inventory order requirement
         if not self.has_sufficient_stock:
-            shortage = self.quantity - self.available_quantity
             current_to_order = self.inventory_item.quantity_to_be_ordered
-            self.inventory_item.quantity_to_be_ordered = current_to_order + shortage
+            self.inventory_item.quantity_to_be_ordered = current_to_order + self.shortage
             self.inventory_item.save()
         
         # Recalculate BOQ totals
@@ -280,6 +426,9 @@ class InventoryOrderRequirement(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Inventory Order Requirement'
         verbose_name_plural = 'Inventory Order Requirements'
+        indexes = [
+            models.Index(fields=['inventory_item', 'created_at'], name='requirement_item_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.inventory_item.item_name} - {self.project.project_name} (Need: {self.shortage_quantity})"
@@ -290,14 +439,16 @@ class Task(models.Model):
         settings.AUTH_USER_MODEL, 
         on_delete=models.SET_NULL, 
         null=True,
-        related_name="tasks_assigned_to"
+        related_name="tasks_assigned_to",
+        db_index=False,  # covered by task_user_open_due_idx
     )
 
     assigned_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
         null=True,
-        related_name="tasks_assigned_by"
+        related_name="tasks_assigned_by",
+        db_index=False,  # covered by task_assigner_open_due_idx
     )
 
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="tasks")
@@ -312,6 +463,12 @@ class Task(models.Model):
     )
     snapshot_d = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'completed', 'due_date'], name='task_user_open_due_idx'),
+            models.Index(fields=['assigned_by', 'completed', 'due_date'], name='task_assigner_open_due_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -350,11 +507,36 @@ class Invoice(models.Model):
 
 
 class Notification(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Indexed by notification_user_recent_idx / notification_user_unread_idx
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
     message = models.CharField(max_length=255)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', 'id'], name='notification_user_recent_idx'),
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_unread_idx'),
+        ]
+
+    def __str__(self):
+        return self.message
+
+
+class NotificationArchive(models.Model):
+    """Notifications moved out of the Notification table by the retention job"""
+    REASON_CHOICES = [
+        ('expired', 'Expired'),
+        ('collapsed', 'Collapsed duplicate'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_notifications')
+    message = models.CharField(max_length=255)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+
     def __str__(self):
         return self.message
 
@@ -365,4 +547,119 @@ class TaskAssignment(models.Model):
     assigned_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.task.title} assigned to {self.user.username}"
\ No newline at end of file
+        return f"{self.task.title} assigned to {self.user.username}"
+
+
+class DashboardRollup(models.Model):
+    """Project counts and revenue pre-aggregated per user, city, status and month for the dashboard"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    city = models.CharField(max_length=100, blank=True, default='')
+    status = models.CharField(max_length=100)
+    month = models.DateField()
+
+    project_count = models.IntegerField(default=0)
+    priced_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'city', 'status', 'month'], name='unique_dashboard_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.status} {self.city} ({self.project_count})"
+
+
+class InventorySalesRollup(models.Model):
+    """Quantity and revenue sold per inventory item across approved BOQs"""
+    inventory_item = models.OneToOneField(InventoryItem, on_delete=models.CASCADE, related_name='sales_rollup')
+    quantity_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.inventory_item.item_name} ({self.quantity_sold} sold)"
+
+
+class LeadSourceRollup(models.Model):
+    """Number of projects per lead source, for the dashboard's top lead sources chart"""
+    lead_source = models.OneToOneField(LeadSource, on_delete=models.CASCADE, related_name='project_rollup')
+    project_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-project_count'], name='leadsource_rollup_count_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.lead_source} ({self.project_count} projects)"
+
+
+class RollupTotal(models.Model):
+    """
+    Whole-table counts shown in page headers (lead sources, inventory stock
+    levels), one row per name, kept current by rollups.apply_totals_change
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class InventoryImportJob(models.Model):
+    """An inventory Excel upload processed in the background"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='inventory_imports')
+    file = models.FileField(upload_to='inventory_imports/', blank=True)
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+
+    total_rows = models.IntegerField(null=True, blank=True)
+    processed_rows = models.IntegerField(default=0)
+    added = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+
+class NamedLock(models.Model):
+    """A lock shared by every process using the database, see lms.locks"""
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=64)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} (until {self.expires_at:%H:%M:%S})"
+
+
+class InventoryIndexChange(models.Model):
+    """
+    One change to the inventory, published to the in-process search indexes
+    of every worker (see lms.inventory_index); the id is the index version.
+    """
+    item_ids = models.JSONField(null=True, blank=True)  # None: reload everything
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"v{self.pk}: {'all items' if self.item_ids is None else len(self.item_ids)}"
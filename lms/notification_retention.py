@@ -0,0 +1,133 @@
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .locks import DatabaseLock
+from .models import Notification, NotificationArchive
+from .notifications import publish
+
+# Held while a pass runs, so overlapping cron runs (or hosts) skip instead of
+# racing; refreshed after every batch
+RETENTION_LOCK = 'notification-retention'
+RETENTION_LOCK_TTL = 600
+
+
+@dataclass
+class RetentionReport:
+    expired: int = 0
+    collapsed: int = 0
+    archived: int = 0
+
+    def __str__(self):
+        return f'Removed {self.expired} expired and {self.collapsed} duplicate notifications, archived {self.archived}.'
+
+
+def expired_filter(now=None):
+    """
+    Read notifications older than NOTIFICATION_READ_TTL_DAYS and unread ones
+    older than NOTIFICATION_UNREAD_TTL_DAYS; a TTL of None keeps them forever.
+    """
+    now = now or timezone.now()
+    expired = Q(pk__in=[])
+    for is_read, ttl_days in (
+        (True, getattr(settings, 'NOTIFICATION_READ_TTL_DAYS', 30)),
+        (False, getattr(settings, 'NOTIFICATION_UNREAD_TTL_DAYS', 180)),
+    ):
+        if ttl_days is not None:
+            expired |= Q(is_read=is_read, created_at__lt=now - timedelta(days=ttl_days))
+    return expired
+
+
+def _remove(ids, reason, archive, lock=None):
+    """Delete (and optionally archive) one batch of notifications; returns (removed, archived)"""
+    if lock is not None:
+        lock.refresh()
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.filter(pk__in=ids).values('id', 'user_id', 'message', 'is_read', 'created_at')
+        )
+        archived = NotificationArchive.objects.bulk_create([
+            NotificationArchive(
+                user_id=row['user_id'],
+                message=row['message'],
+                is_read=row['is_read'],
+                created_at=row['created_at'],
+                reason=reason,
+            )
+            for row in rows
+        ]) if archive else []
+        Notification.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+
+        unread = Counter(row['user_id'] for row in rows if not row['is_read'])
+        if unread:
+            publish(unread_deltas={user_id: -count for user_id, count in unread.items()})
+    return len(rows), len(archived)
+
+
+def prune_expired(report, batch_size, archive, now=None, lock=None):
+    # Oldest ids first: expired rows sit at the start of the primary key, so
+    # each batch query stops after reading about batch_size rows
+    expired = Notification.objects.filter(expired_filter(now)).order_by('id').values_list('id', flat=True)
+    while True:
+        ids = list(expired[:batch_size])
+        if not ids:
+            return
+        removed, archived = _remove(ids, 'expired', archive, lock)
+        report.expired += removed
+        report.archived += archived
+
+
+def collapse_duplicates(report, batch_size, archive, lock=None):
+    """Keep only the newest of the identical (message, read state) notifications of each user"""
+    groups = list(
+        Notification.objects.order_by()
+        .values('user_id', 'message', 'is_read')
+        .annotate(newest=Max('id'), copies=Count('id'))
+        .filter(copies__gt=1)
+    )
+    pending = []
+    for group in groups:
+        pending.extend(Notification.objects.filter(
+            user_id=group['user_id'],
+            message=group['message'],
+            is_read=group['is_read'],
+            id__lt=group['newest'],
+        ).values_list('id', flat=True))
+        while len(pending) >= batch_size:
+            removed, archived = _remove(pending[:batch_size], 'collapsed', archive, lock)
+            report.collapsed += removed
+            report.archived += archived
+            pending = pending[batch_size:]
+    if pending:
+        removed, archived = _remove(pending, 'collapsed', archive, lock)
+        report.collapsed += removed
+        report.archived += archived
+
+
+def run_retention(batch_size=None, archive=None, collapse=None, now=None):
+    """
+    Apply the notification retention policy in transactions of at most
+    `batch_size` rows. Defaults come from the NOTIFICATION_RETENTION_BATCH,
+    NOTIFICATION_ARCHIVE and NOTIFICATION_COLLAPSE_DUPLICATES settings.
+
+    Holds the RETENTION_LOCK database lock for the pass; raises
+    LockUnavailable if another process is already running one.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'NOTIFICATION_RETENTION_BATCH', 1000)
+    if archive is None:
+        archive = getattr(settings, 'NOTIFICATION_ARCHIVE', False)
+    if collapse is None:
+        collapse = getattr(settings, 'NOTIFICATION_COLLAPSE_DUPLICATES', False)
+
+    report = RetentionReport()
+    with DatabaseLock(RETENTION_LOCK, ttl=RETENTION_LOCK_TTL, timeout=0) as lock:
+        prune_expired(report, batch_size, archive, now, lock)
+        if collapse:
+            collapse_duplicates(report, batch_size, archive, lock)
+    return report
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, QuerySet
+from django.utils import timezone
+
+from .instrumentation import timed
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# An identical unread notification this recent is not created (or pushed) again
+DEDUPE_WINDOW = timedelta(minutes=5)
+MESSAGE_MAX_LENGTH = Notification._meta.get_field('message').max_length
+
+
+def group_members(group_name, exclude=None):
+    """Users of an auth group, for notify(); `exclude` is a user or user id"""
+    users = User.objects.filter(groups__name=group_name)
+    if exclude is not None:
+        users = users.exclude(pk=getattr(exclude, 'pk', exclude))
+    return users
+
+
+def _user_ids(recipients):
+    if isinstance(recipients, QuerySet):
+        return set(recipients.order_by().values_list('pk', flat=True))
+    return {getattr(recipient, 'pk', recipient) for recipient in recipients if recipient is not None}
+
+
+def notify(recipients, message, push_message=None):
+    """
+    Store `message` for every recipient (users, user ids or a User queryset)
+    and push `push_message` (default: `message`) to their `user_<id>` channel
+    groups once the current transaction commits.
+
+    Recipients are resolved with one query, rows written with one
+    bulk_create, and recipients that already have the same unread message
+    from the last DEDUPE_WINDOW are skipped. Returns the created notifications.
+    """
+    user_ids = _user_ids(recipients)
+    if not user_ids:
+        return []
+
+    message = message[:MESSAGE_MAX_LENGTH]
+    user_ids -= set(
+        Notification.objects.filter(
+            user_id__in=user_ids,
+            is_read=False,
+            message=message,
+            created_at__gte=timezone.now() - DEDUPE_WINDOW,
+        ).values_list('user_id', flat=True)
+    )
+    notifications = Notification.objects.bulk_create(
+        [Notification(user_id=user_id, message=message) for user_id in sorted(user_ids)]
+    )
+
+    event = {"type": "send_notification", "message": push_message or message}
+    publish(
+        [(f"user_{notification.user_id}", event) for notification in notifications],
+        unread_deltas={notification.user_id: 1 for notification in notifications},
+    )
+    return notifications
+
+
+def unread_count(user):
+    """Unread notifications of a user (or user id); an index-only count on notification_user_unread_idx"""
+    return Notification.objects.filter(user_id=getattr(user, 'pk', user), is_read=False).count()
+
+
+def _unread_counts(user_ids):
+    """{user_id: unread count} for several users, in one grouped query"""
+    counts = dict.fromkeys(user_ids, 0)
+    counts.update(
+        Notification.objects.filter(user_id__in=user_ids, is_read=False)
+        .order_by()
+        .values('user_id')
+        .annotate(count=Count('pk'))
+        .values_list('user_id', 'count')
+    )
+    return counts
+
+
+def _update_unread(deltas, counts):
+    """Committed unread changes, as the unread_count events to push"""
+    recount = set(deltas) - set(counts)
+    counts = {**counts, **(_unread_counts(recount) if recount else {})}
+    return [
+        (f"user_{user_id}", {"type": "unread_count", "count": count})
+        for user_id, count in counts.items()
+    ]
+
+
+async def _group_send_all(messages):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    results = await asyncio.gather(
+        *(channel_layer.group_send(group, event) for group, event in messages),
+        return_exceptions=True,
+    )
+    for (group, _), result in zip(messages, results):
+        if isinstance(result, Exception):
+            logger.warning('Could not push notification to %s: %s', group, result)
+
+
+def _send(messages):
+    try:
+        with timed('channels'):
+            async_to_sync(_group_send_all)(messages)
+    except Exception:
+        logger.exception('Could not push %s notification(s)', len(messages))
+
+
+def publish(messages=(), unread_deltas=None, unread_counts=None):
+    """
+    Send (group, event) pairs to the channel layer in a single async batch
+    after the current transaction commits; nothing is sent if it rolls back.
+
+    The new unread counts of the users in `unread_deltas` ({user_id: +n/-n},
+    recounted from the database after the commit) and `unread_counts`
+    ({user_id: n}, known already) are pushed in the same batch.
+    """
+    seen, unique = set(), []
+    for group, event in messages:
+        key = (group, json.dumps(event, sort_keys=True, default=str))
+        if key not in seen:
+            seen.add(key)
+            unique.append((group, event))
+    if unique or unread_deltas or unread_counts:
+        transaction.on_commit(lambda: _send(unique + _update_unread(unread_deltas or {}, unread_counts or {})))
@@ -0,0 +1,129 @@
+import base64
+import json
+from dataclasses import dataclass
+from urllib.parse import urlencode
+
+from django.core.exceptions import BadRequest
+from django.db.models import Q
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Orderings backed by composite indexes (see the model Meta.indexes)
+RECENT_FIRST = ('-snapshot_d', 'id')
+BY_ITEM_NAME = ('item_name', 'id')
+NEWEST_CREATED = ('-created_at', 'id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _parse_ordering(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def encode_cursor(obj, ordering):
+    """Opaque cursor pointing just after `obj` in `ordering`"""
+    values = [obj._meta.get_field(name).value_to_string(obj) for name, _ in _parse_ordering(ordering)]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(model, ordering, cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        fields = _parse_ordering(ordering)
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [model._meta.get_field(name).to_python(value) for (name, _), value in zip(fields, values)]
+    except Exception:
+        raise InvalidCursor(f'Invalid cursor: {cursor}')
+
+
+def _after(fields, values):
+    """
+    Rows after `values` in the ordering. Written as `a <= x AND (a < x OR ...)`
+    rather than a plain OR so the leading column can seek the composite index.
+    """
+    (name, desc), value = fields[0], values[0]
+    strict = Q(**{f'{name}__{"lt" if desc else "gt"}': value})
+    if len(fields) == 1:
+        return strict
+    loose = Q(**{f'{name}__{"lte" if desc else "gte"}': value})
+    return loose & (strict | _after(fields[1:], values[1:]))
+
+
+def keyset_paginate(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    """
+    One page of `queryset` ordered by `ordering` (e.g. ('-snapshot_d', 'id')),
+    starting after `cursor`. The ordering fields must be non-null and end in a
+    unique field. Each page is an index range scan of page_size + 1 rows, so its
+    cost does not depend on the table size or how far the user has scrolled.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(queryset.model, ordering, cursor)
+        queryset = queryset.filter(_after(_parse_ordering(ordering), values))
+
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return KeysetPage(rows)
+    rows = rows[:page_size]
+    return KeysetPage(rows, encode_cursor(rows[-1], ordering))
+
+
+def paginate_request(request, queryset, ordering):
+    """keyset_paginate with the `cursor` and `page_size` query parameters"""
+    try:
+        page_size = min(max(int(request.GET.get('page_size', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = PAGE_SIZE
+    try:
+        return keyset_paginate(queryset, ordering, request.GET.get('cursor') or None, page_size)
+    except InvalidCursor as e:
+        raise BadRequest(str(e))
+
+
+def keyset_params(**params):
+    """
+    Query string of a list's search and filter parameters (empty ones left
+    out), for keyset_loader.html's `params` so later pages keep them.
+    """
+    return urlencode({key: value for key, value in params.items() if value})
+
+
+def wants_json(request):
+    return request.GET.get('format') == 'json'
+
+
+def keyset_json_response(request, page, serialize, rows_template=None, context=None):
+    """
+    JSON variant of a paginated list: serialized rows, the next cursor and,
+    with `rows_template`, the rows rendered as HTML for the scroll loader.
+    """
+    data = {
+        'results': [serialize(obj) for obj in page],
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    }
+    if rows_template:
+        data['html'] = render_to_string(rows_template, {**(context or {}), 'page': page}, request=request)
+    return JsonResponse(data)
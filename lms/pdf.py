@@ -0,0 +1,296 @@
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.template.loader import get_template
+from django.utils.text import get_valid_filename
+
+from .instrumentation import timed
+from .models import BOQ
+from .pdf_worker import html_to_pdf
+
+# For PDF generation, install: pip install xhtml2pdf reportlab
+try:
+    from xhtml2pdf import pisa
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+    print("Warning: xhtml2pdf not installed. PDF generation will not work.")
+
+logger = logging.getLogger(__name__)
+
+COMPANY_DETAILS = {
+    'company_name': 'SecureTech AV',
+    'company_address': 'Your Company Address Here',
+    'company_phone': '+91-XXXXXXXXXX',
+    'company_email': 'info@securetechav.com',
+    'company_gst': 'GSTIN: XXXXXXXXXXXX',
+}
+
+
+class PDFRenderError(Exception):
+    pass
+
+
+def render_boq_html(boq):
+    """Render the PDF template of a BOQ to HTML"""
+    context = {
+        'boq': boq,
+        'items': boq.items.all(),  # ordered by sr_no; also uses prefetched items
+        **COMPANY_DETAILS,
+    }
+    return get_template('lms/boq_pdf_template.html').render(context)
+
+
+def render_boq_pdf(boq):
+    """Render a BOQ to PDF bytes"""
+    html = render_boq_html(boq)
+    with timed('pdf'):
+        content = html_to_pdf(html)
+    if content is None:
+        raise PDFRenderError(f'Error generating PDF for BOQ {boq.invoice_number}')
+    return content
+
+
+# ============================================================================
+# PDF ARTIFACT CACHE
+# ============================================================================
+
+def _cache_dir():
+    return Path(getattr(settings, 'BOQ_PDF_CACHE_DIR', Path(settings.MEDIA_ROOT) / 'boq_pdfs'))
+
+
+def boq_pdf_path(boq):
+    """Cache file for the current version of a BOQ (any save bumps updated_at)"""
+    version = int(boq.updated_at.timestamp() * 1_000_000)
+    return _cache_dir() / f'{boq.pk}_{version}.pdf'
+
+
+def invalidate_boq_pdf(boq_id, keep=None):
+    """Remove cached PDFs of a BOQ, except the `keep` path"""
+    for path in _cache_dir().glob(f'{boq_id}_*.pdf'):
+        if path != keep:
+            path.unlink(missing_ok=True)
+
+
+def get_boq_pdf(boq):
+    """
+    The PDF of a BOQ as a binary file object, from the cache or rendered now.
+    The cache file is opened here rather than checked for, so a concurrent
+    invalidate_boq_pdf() unlinking it cannot fail the read.
+    """
+    try:
+        return open(boq_pdf_path(boq), 'rb')
+    except FileNotFoundError:
+        content = render_boq_pdf(boq)
+    store_boq_pdf(boq, content)
+    return io.BytesIO(content)
+
+
+def store_boq_pdf(boq, content):
+    """Write PDF bytes to the cache file of the BOQ's current version"""
+    path = boq_pdf_path(boq)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file and rename so readers never see a partial PDF
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(content)
+    os.replace(tmp_path, path)
+
+    invalidate_boq_pdf(boq.pk, keep=path)
+    return path
+
+
+# ============================================================================
+# BACKGROUND GENERATION
+# ============================================================================
+
+_executor = None
+_executor_lock = threading.Lock()
+# boq_id -> True when the BOQ changed again while its PDF was being rendered
+_in_flight = {}
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BOQ_PDF_WORKERS', 2),
+                thread_name_prefix='boq-pdf',
+            )
+        return _executor
+
+
+def _render_in_background(boq_id):
+    close_old_connections()
+    try:
+        while True:
+            try:
+                boq = BOQ.objects.select_related('lead_source', 'created_by').filter(pk=boq_id).first()
+                if boq is not None:
+                    get_boq_pdf(boq).close()
+            except Exception:
+                logger.exception('Background PDF generation failed for BOQ %s', boq_id)
+            with _executor_lock:
+                if not _in_flight.get(boq_id):
+                    _in_flight.pop(boq_id, None)
+                    break
+                _in_flight[boq_id] = False
+    finally:
+        connection.close()
+
+
+def schedule_boq_pdf(boq_id):
+    """Pre-render a BOQ's PDF in the worker pool once the current transaction commits"""
+    if not PDF_AVAILABLE or not getattr(settings, 'BOQ_PDF_BACKGROUND', True):
+        return
+
+    def submit():
+        with _executor_lock:
+            if boq_id in _in_flight:
+                _in_flight[boq_id] = True
+                return
+            _in_flight[boq_id] = False
+        _get_executor().submit(_render_in_background, boq_id)
+
+    transaction.on_commit(submit)
+
+
+# ============================================================================
+# BULK EXPORT
+# ============================================================================
+
+@dataclass
+class ExportStats:
+    exported: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+    @property
+    def docs_per_second(self):
+        return self.exported / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (f'Exported {self.exported} PDFs ({self.failed} failed) in {self.seconds:.2f}s '
+                f'- {self.docs_per_second:.2f} documents/second')
+
+
+def export_queryset(date_from=None, date_to=None, status=None, project_id=None):
+    """BOQs to export; dates filter on the BOQ creation date (inclusive)"""
+    boqs = (
+        BOQ.objects.select_related('lead_source', 'created_by')
+        .prefetch_related('items')
+        .order_by('created_at', 'id')
+    )
+    if date_from:
+        boqs = boqs.filter(created_at__date__gte=date_from)
+    if date_to:
+        boqs = boqs.filter(created_at__date__lte=date_to)
+    if status:
+        boqs = boqs.filter(status=status)
+    if project_id:
+        boqs = boqs.filter(project_id=project_id)
+    return boqs
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def iter_boq_pdfs(boqs, processes=None):
+    """
+    Yield (boq, pdf bytes or None) in queryset order.
+
+    Cached PDFs are reused; the rest are converted in a process pool sized
+    to the available cores. Only a small window of documents is in flight
+    at a time, so memory use does not grow with the number of BOQs.
+    """
+    processes = processes or getattr(settings, 'BOQ_PDF_EXPORT_PROCESSES', None) or available_cores()
+    window = processes * 2
+    pending = deque()
+
+    # Spawned workers only import lms.pdf_worker, never the Django project
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for boq in boqs.iterator(chunk_size=100):
+            try:
+                # Read now: the file can be invalidated before this document's turn comes
+                pending.append((boq, None, boq_pdf_path(boq).read_bytes()))
+            except FileNotFoundError:
+                pending.append((boq, pool.submit(html_to_pdf, render_boq_html(boq)), None))
+
+            while len(pending) >= window or (pending and pending[0][1] is None):
+                yield _collect(*pending.popleft())
+
+        while pending:
+            yield _collect(*pending.popleft())
+
+
+def _collect(boq, future, cached):
+    if future is None:
+        return boq, cached
+    try:
+        content = future.result()
+    except Exception:
+        logger.exception('PDF export failed for BOQ %s', boq.pk)
+        return boq, None
+    if content is not None:
+        store_boq_pdf(boq, content)
+    return boq, content
+
+
+class _ZipStream:
+    """Write-only file object that hands out what the ZipFile wrote so far"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_boq_zip(boqs, processes=None, stats=None):
+    """
+    Generate a ZIP of the BOQ PDFs chunk by chunk. A summary with the
+    throughput is added as the last entry and stored in `stats`.
+    """
+    stats = stats if stats is not None else ExportStats()
+    started = time.monotonic()
+    stream = _ZipStream()
+
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for boq, content in iter_boq_pdfs(boqs, processes):
+            if content is None:
+                stats.failed += 1
+                continue
+            archive.writestr(get_valid_filename(f'BOQ_{boq.invoice_number}.pdf'), content)
+            stats.exported += 1
+            yield stream.pop()
+
+        stats.seconds = time.monotonic() - started
+        logger.info('BOQ PDF export: %s', stats.summary())
+        archive.writestr('export_summary.txt', stats.summary() + '\n')
+    yield stream.pop()
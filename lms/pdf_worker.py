@@ -0,0 +1,18 @@
+"""
+HTML -> PDF conversion executed inside export worker processes.
+
+Kept free of Django imports so spawned workers start without loading the
+project; the parent process renders the templates and only ships HTML.
+"""
+from io import BytesIO
+
+
+def html_to_pdf(html):
+    """Convert rendered HTML to PDF bytes, or None if xhtml2pdf reports an error"""
+    from xhtml2pdf import pisa
+
+    output = BytesIO()
+    pisa_status = pisa.CreatePDF(html, dest=output)
+    if pisa_status.err:
+        return None
+    return output.getvalue()
@@ -0,0 +1,32 @@
+def get_user_groups(user):
+    """
+    Return the set of group names for a user.
+
+    Names are loaded once per request (memoized on the user object). They
+    are not shared between requests, so a revoked membership takes effect
+    on the user's next request in every worker.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    group_names = getattr(user, '_lms_group_names', None)
+    if group_names is None:
+        group_names = frozenset(user.groups.values_list('name', flat=True))
+        user._lms_group_names = group_names
+    return group_names
+
+
+def invalidate_user_groups(user):
+    """Drop the group names memoized on a user object after its groups were changed."""
+    if hasattr(user, '_lms_group_names'):
+        del user._lms_group_names
+
+
+def has_group(user, group_name):
+    """Check if a user belongs to a specific group."""
+    return group_name in get_user_groups(user)
+
+
+def is_admin(user):
+    """Superusers and members of the 'admin' group."""
+    return user.is_authenticated and (user.is_superuser or has_group(user, 'admin'))
@@ -0,0 +1,152 @@
+import logging
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# The same query shape this many times in one request is reported as an N+1 pattern
+NPLUSONE_THRESHOLD = 5
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def query_shape(sql):
+    """SQL with its parameters and IN-list lengths erased, so repeats of one query compare equal"""
+    return _NUMBER.sub('N', _IN_LIST.sub('IN (...)', sql))
+
+
+# Arguments of a connection.execute_wrapper; frames of such wrappers (e.g. the
+# Server-Timing one in lms/instrumentation.py) are never a query's origin
+_WRAPPER_ARGS = ('execute', 'sql', 'params', 'many', 'context')
+
+
+def _is_execute_wrapper(code):
+    return code.co_varnames[:code.co_argcount][-len(_WRAPPER_ARGS):] == _WRAPPER_ARGS
+
+
+def _origin():
+    """Innermost template node being rendered, else innermost frame of project code"""
+    frame = sys._getframe(2)
+    code_frame = None
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated' and 'self' in frame.f_locals:
+            node = frame.f_locals['self']
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                return f'template {origin.template_name}:{token.lineno} {token.contents[:60]!r}'
+        filename = frame.f_code.co_filename
+        if code_frame is None and filename.startswith(PROJECT_ROOT) and 'site-packages' not in filename \
+                and filename != __file__ and not _is_execute_wrapper(frame.f_code):
+            code_frame = f'{Path(filename).relative_to(PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return code_frame or 'unknown'
+
+
+@dataclass
+class QueryPattern:
+    shape: str
+    count: int
+    duration_ms: float
+    origins: Counter
+
+    def describe(self):
+        origins = ', '.join(f'{origin} (x{count})' for origin, count in self.origins.most_common(3))
+        return f'{self.count} x {self.duration_ms:.1f}ms: {self.shape[:300]}\n    from {origins}'
+
+
+@dataclass
+class QueryRecorder:
+    """connection.execute_wrapper that records every query with its duration and origin"""
+    queries: list = field(default_factory=list)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - started) * 1000, _origin()))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration_ms(self):
+        return sum(duration for _, duration, _ in self.queries)
+
+    def patterns(self, threshold=NPLUSONE_THRESHOLD):
+        """Query shapes repeated at least `threshold` times, most frequent first"""
+        groups = defaultdict(list)
+        for sql, duration, origin in self.queries:
+            groups[query_shape(sql)].append((duration, origin))
+        return sorted(
+            (
+                QueryPattern(shape, len(rows), sum(d for d, _ in rows), Counter(origin for _, origin in rows))
+                for shape, rows in groups.items() if len(rows) >= threshold
+            ),
+            key=lambda pattern: -pattern.count,
+        )
+
+    def report(self, threshold=NPLUSONE_THRESHOLD):
+        lines = [f'{self.count} queries in {self.duration_ms:.1f}ms']
+        lines += [pattern.describe() for pattern in self.patterns(threshold)]
+        return '\n'.join(lines)
+
+
+@contextmanager
+def record_queries():
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+
+
+@contextmanager
+def query_budget(budget, label='block'):
+    """
+    Fail (AssertionError) if the block runs more than `budget` queries, with the
+    repeated query shapes and where they came from. For tests:
+
+        with query_budget(12, 'dashboard'):
+            self.client.get('/dashboard/')
+    """
+    with record_queries() as recorder:
+        yield recorder
+    if recorder.count > budget:
+        raise AssertionError(f'{label} ran over its budget of {budget} queries: {recorder.report(threshold=2)}')
+
+
+class QueryInspectorMiddleware:
+    """
+    Development aid: records the queries of every request and logs a warning
+    for repeated query shapes (likely N+1 patterns), with the template node or
+    line of code that ran them. Enabled by QUERY_INSPECTOR (default: DEBUG).
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSPECTOR', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_INSPECTOR_THRESHOLD', NPLUSONE_THRESHOLD)
+
+    def __call__(self, request):
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        patterns = recorder.patterns(self.threshold)
+        if patterns:
+            logger.warning(
+                'Possible N+1 queries in %s %s (%s queries in %.1fms):\n%s',
+                request.method, request.path, recorder.count, recorder.duration_ms,
+                '\n'.join(pattern.describe() for pattern in patterns),
+            )
+        return response
@@ -0,0 +1,344 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import (
+    BOQItem,
+    DashboardRollup,
+    InventoryItem,
+    InventorySalesRollup,
+    LeadSource,
+    LeadSourceRollup,
+    Project,
+    RollupTotal,
+)
+
+PROJECT_STATE_FIELDS = ('user_id', 'city', 'status', 'snapshot_d', 'amount', 'lead_source_id')
+
+
+def _month(value):
+    return timezone.localtime(value).date().replace(day=1)
+
+
+def project_state(project):
+    """
+    The rollup bucket a project falls into, what it adds to it, and its lead
+    source: ((user_id, city, status, month), (project_count, priced_count, revenue), lead_source_id).
+    """
+    if project.get_deferred_fields().intersection(PROJECT_STATE_FIELDS):
+        return None
+    if project.pk is None or project.snapshot_d is None:
+        return None
+
+    priced = project.amount is not None and project.amount > 0
+    key = (project.user_id, project.city or '', project.status, _month(project.snapshot_d))
+    return key, (1, int(priced), Decimal(project.amount) if priced else Decimal('0')), project.lead_source_id
+
+
+def stored_project_state(project_id):
+    """Rollup state of a project as currently stored in the database"""
+    project = Project.objects.filter(pk=project_id).only(*PROJECT_STATE_FIELDS).first()
+    return project_state(project) if project else None
+
+
+def _add_to_bucket(key, project_count, priced_count, revenue):
+    user_id, city, status, month = key
+    bucket = {'user_id': user_id, 'city': city, 'status': status, 'month': month}
+    updated = DashboardRollup.objects.filter(**bucket).update(
+        project_count=F('project_count') + project_count,
+        priced_count=F('priced_count') + priced_count,
+        revenue=F('revenue') + revenue,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            DashboardRollup.objects.create(
+                project_count=project_count, priced_count=priced_count, revenue=revenue, **bucket
+            )
+    except IntegrityError:
+        # Another request created the bucket first
+        _add_to_bucket(key, project_count, priced_count, revenue)
+
+
+def apply_project_change(old_state, new_state):
+    """Move a project's contribution from its old rollup bucket to its new one"""
+    if old_state == new_state:
+        return
+
+    deltas = defaultdict(lambda: [0, 0, Decimal('0')])
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        key, measures, _ = state
+        for i, value in enumerate(measures):
+            deltas[key][i] += sign * value
+
+    for key, (project_count, priced_count, revenue) in deltas.items():
+        if project_count or priced_count or revenue:
+            _add_to_bucket(key, project_count, priced_count, revenue)
+
+    old_lead = old_state[2] if old_state else None
+    new_lead = new_state[2] if new_state else None
+    if old_lead != new_lead:
+        if old_lead is not None:
+            _add_to_lead_source(old_lead, -1)
+        if new_lead is not None:
+            _add_to_lead_source(new_lead, 1)
+
+
+def _add_to_lead_source(lead_source_id, project_count):
+    updated = LeadSourceRollup.objects.filter(lead_source_id=lead_source_id).update(
+        project_count=F('project_count') + project_count,
+    )
+    if updated or project_count < 0:
+        return
+    try:
+        with transaction.atomic():
+            LeadSourceRollup.objects.create(lead_source_id=lead_source_id, project_count=project_count)
+    except IntegrityError:
+        # Another request created the row first
+        _add_to_lead_source(lead_source_id, project_count)
+
+
+def apply_boq_approval(boq, sign):
+    """Add (sign=1) or remove (sign=-1) a BOQ's items from the inventory sales rollup"""
+    rows = (
+        BOQItem.objects.filter(boq=boq)
+        .values('inventory_item_id')
+        .annotate(sold=Sum('quantity'), sales=Sum(F('quantity') * F('unit_price')))
+    )
+    for row in rows:
+        quantity, revenue = sign * row['sold'], sign * row['sales']
+        updated = InventorySalesRollup.objects.filter(inventory_item_id=row['inventory_item_id']).update(
+            quantity_sold=F('quantity_sold') + quantity,
+            revenue=F('revenue') + revenue,
+        )
+        if not updated:
+            InventorySalesRollup.objects.create(
+                inventory_item_id=row['inventory_item_id'], quantity_sold=quantity, revenue=revenue
+            )
+
+
+def _project_buckets(projects):
+    rows = (
+        projects.order_by()
+        .annotate(bucket_city=Coalesce('city', Value('')), bucket_month=TruncMonth('snapshot_d'))
+        .values('user_id', 'bucket_city', 'status', 'bucket_month')
+        .annotate(
+            project_count=Count('id'),
+            priced_count=Count('id', filter=Q(amount__gt=0)),
+            revenue=Sum('amount', filter=Q(amount__gt=0)),
+        )
+    )
+    return [
+        DashboardRollup(
+            user_id=row['user_id'],
+            city=row['bucket_city'],
+            status=row['status'],
+            month=_month(row['bucket_month']),
+            project_count=row['project_count'],
+            priced_count=row['priced_count'],
+            revenue=row['revenue'] or Decimal('0'),
+        )
+        for row in rows
+    ]
+
+
+@transaction.atomic
+def rebuild_project_rollup(user_ids=None):
+    """
+    Recompute DashboardRollup from the Project table. Pass `user_ids` to only
+    rebuild those users' buckets (None in the list stands for unassigned projects).
+    """
+    rollups = DashboardRollup.objects.all()
+    projects = Project.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        ids = [pk for pk in user_ids if pk is not None]
+        rollup_filter = Q(user_id__in=ids)
+        project_filter = Q(user_id__in=ids)
+        if None in user_ids:
+            rollup_filter |= Q(user__isnull=True)
+            project_filter |= Q(user__isnull=True)
+        rollups = rollups.filter(rollup_filter)
+        projects = projects.filter(project_filter)
+
+    rollups.delete()
+    buckets = _project_buckets(projects)
+    DashboardRollup.objects.bulk_create(buckets, batch_size=500)
+    if user_ids is None:
+        # Per-lead counts do not depend on the user, so a partial rebuild leaves them alone
+        rebuild_lead_source_rollup()
+    return len(buckets)
+
+
+@transaction.atomic
+def rebuild_lead_source_rollup():
+    """Recompute LeadSourceRollup from the Project table"""
+    LeadSourceRollup.objects.all().delete()
+    rows = (
+        Project.objects.filter(lead_source__isnull=False)
+        .order_by()
+        .values('lead_source_id')
+        .annotate(count=Count('id'))
+    )
+    LeadSourceRollup.objects.bulk_create(
+        [LeadSourceRollup(lead_source_id=row['lead_source_id'], project_count=row['count']) for row in rows],
+        batch_size=500,
+    )
+    return len(rows)
+
+
+@transaction.atomic
+def rebuild_inventory_rollup():
+    """Recompute InventorySalesRollup from approved BOQ items"""
+    InventorySalesRollup.objects.all().delete()
+    rows = (
+        BOQItem.objects.filter(boq__status='approved')
+        .values('inventory_item_id')
+        .annotate(sold=Sum('quantity'), sales=Sum(F('quantity') * F('unit_price')))
+    )
+    InventorySalesRollup.objects.bulk_create(
+        [
+            InventorySalesRollup(
+                inventory_item_id=row['inventory_item_id'],
+                quantity_sold=row['sold'],
+                revenue=row['sales'],
+            )
+            for row in rows
+        ],
+        batch_size=500,
+    )
+    return len(rows)
+
+
+# ============================================================================
+# Page header totals
+# ============================================================================
+
+# The fields each model's RollupTotal rows are computed from
+TOTAL_FIELDS = {
+    LeadSource: ('has_project',),
+    InventoryItem: ('available_quantity', 'quantity_to_be_ordered'),
+}
+LEAD_TOTALS = ('leads', 'leads_with_projects')
+STOCK_TOTALS = ('inventory', 'inventory_low_stock', 'inventory_out_of_stock', 'inventory_to_order')
+
+
+def row_totals(model, row):
+    """What one row (its TOTAL_FIELDS values) adds to the totals"""
+    if model is LeadSource:
+        has_project, = row
+        return {'leads': 1, 'leads_with_projects': int(has_project)}
+    available, to_order = row
+    return {
+        'inventory': 1,
+        'inventory_low_stock': int(0 < available < 10),
+        'inventory_out_of_stock': int(available == 0),
+        'inventory_to_order': to_order,
+    }
+
+
+def sum_totals(model, rows):
+    totals = defaultdict(int)
+    for row in rows:
+        for name, value in row_totals(model, row).items():
+            totals[name] += value
+    return totals
+
+
+def stored_totals(model, ids, lock=False):
+    """
+    Totals of the stored rows `ids`. With `lock` the rows stay locked until
+    the transaction ends, so a concurrent change waits and counts from our result.
+    """
+    rows = model.objects.filter(pk__in=ids).order_by('pk')
+    if lock:
+        rows = rows.select_for_update()
+    return sum_totals(model, rows.values_list(*TOTAL_FIELDS[model]))
+
+
+def _add_to_total(name, delta):
+    if RollupTotal.objects.filter(name=name).update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            RollupTotal.objects.create(name=name, value=delta)
+    except IntegrityError:
+        # Another request created the row first
+        _add_to_total(name, delta)
+
+
+def apply_totals_change(old_totals, new_totals):
+    """Move the totals from `old_totals` to `new_totals`, with one UPDATE"""
+    deltas = {
+        name: new_totals.get(name, 0) - old_totals.get(name, 0)
+        for name in set(old_totals) | set(new_totals)
+    }
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = RollupTotal.objects.filter(name__in=deltas).update(value=F('value') + Case(
+        *[When(name=name, then=Value(delta)) for name, delta in deltas.items()],
+        output_field=models.BigIntegerField(),
+    ))
+    if updated < len(deltas):
+        existing = set(RollupTotal.objects.filter(name__in=deltas).values_list('name', flat=True))
+        for name in deltas.keys() - existing:
+            _add_to_total(name, deltas[name])
+
+
+@contextmanager
+def track_totals(model, ids):
+    """Keep the totals in step with bulk UPDATEs of rows `ids` made inside the block (in a transaction)"""
+    ids = list(ids)
+    if not ids:
+        yield
+        return
+    old_totals = stored_totals(model, ids, lock=True)
+    yield
+    apply_totals_change(old_totals, stored_totals(model, ids))
+
+
+@contextmanager
+def track_saved_totals(instance):
+    """Keep the totals in step with saving `instance`, new or existing (in a transaction)"""
+    model = type(instance)
+    old_totals = stored_totals(model, [instance.pk], lock=True) if instance.pk else {}
+    yield
+    apply_totals_change(old_totals, stored_totals(model, [instance.pk]))
+
+
+def page_totals(names):
+    """{name: value} of RollupTotal rows, 0 for missing ones"""
+    return {**dict.fromkeys(names, 0), **dict(RollupTotal.objects.filter(name__in=names).values_list('name', 'value'))}
+
+
+def compute_totals():
+    """Every RollupTotal value, recounted from the LeadSource and InventoryItem tables"""
+    leads = LeadSource.objects.aggregate(
+        leads=Count('id'),
+        leads_with_projects=Count('id', filter=Q(has_project=True)),
+    )
+    stock = InventoryItem.objects.aggregate(
+        inventory=Count('id'),
+        inventory_low_stock=Count('id', filter=Q(available_quantity__gt=0, available_quantity__lt=10)),
+        inventory_out_of_stock=Count('id', filter=Q(available_quantity=0)),
+        inventory_to_order=Coalesce(Sum('quantity_to_be_ordered'), 0),
+    )
+    return {**leads, **stock}
+
+
+@transaction.atomic
+def rebuild_totals():
+    """Recompute RollupTotal, e.g. after bulk writes that skip save()"""
+    totals = compute_totals()
+    RollupTotal.objects.all().delete()
+    RollupTotal.objects.bulk_create([RollupTotal(name=name, value=value) for name, value in totals.items()])
+    return len(totals)
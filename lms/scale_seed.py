@@ -0,0 +1,417 @@
+import math
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .inventory_index import inventory_changed
+from .lead_search import rebuild_lead_index
+from .models import (
+    BOQ,
+    BOQItem,
+    Event,
+    InventoryItem,
+    InventoryOrderRequirement,
+    LeadSource,
+    Notification,
+    Project,
+    Task,
+)
+from .rollups import rebuild_inventory_rollup, rebuild_project_rollup, rebuild_totals
+
+SEED_CHUNK_SIZE = 5000  # leads (with their projects, BOQs and tasks) written per transaction
+
+# Weighted choices, roughly shaped like production data
+CITIES = [
+    ('Mumbai', 18), ('Delhi', 16), ('Bengaluru', 14), ('Pune', 10), ('Hyderabad', 9), ('Chennai', 8),
+    ('Ahmedabad', 6), ('Kolkata', 5), ('Jaipur', 4), ('Surat', 3), ('Lucknow', 3), ('Indore', 2),
+    ('Nagpur', 1), ('Kochi', 1),
+]
+PROJECT_STATUSES = [
+    ('open', 15), ('contacted', 15), ('In Progress', 10), ('boq', 15), ('advance', 15), ('won', 18), ('lost', 12),
+]
+BOQ_STATUSES = [('draft', 35), ('sent', 30), ('approved', 25), ('rejected', 10)]
+REQUIREMENT_STATUSES = [('pending', 5), ('ordered', 3), ('received', 2)]
+TASK_PRIORITIES = [('High', 2), ('Medium', 5), ('Low', 3)]
+GROUP_SHARES = [('basic_access', 1.0), ('leads_access', 0.4), ('admin', 0.05)]  # share of seeded users per group
+
+PROJECT_RATE = 0.6  # leads that became a project
+BOQS_PER_PROJECT = (0, 3)
+BOQ_ITEMS_MEAN = 6  # items per BOQ follow a geometric distribution, capped at BOQ_ITEMS_MAX
+BOQ_ITEMS_MAX = 40
+TASKS_PER_PROJECT = (0, 4)
+NOTIFICATION_READ_RATE = 0.8
+TAX_RATE = Decimal('18.00')
+DISCOUNTS = [Decimal(0)] * 6 + [Decimal(5)] * 2 + [Decimal(10)] * 2  # line discount percentages
+CENTS = Decimal('0.01')
+
+# Flushed parents first (foreign keys are only checked at commit anyway)
+SEEDED_MODELS = [InventoryItem, LeadSource, Project, BOQ, BOQItem, InventoryOrderRequirement, Task, Event, Notification]
+
+FIRST_NAMES = [
+    'Aarav', 'Vivaan', 'Aditya', 'Vihaan', 'Arjun', 'Sai', 'Reyansh', 'Krishna', 'Ishaan', 'Rohan',
+    'Ananya', 'Diya', 'Aadhya', 'Saanvi', 'Pari', 'Anika', 'Navya', 'Myra', 'Sara', 'Priya',
+    'Rahul', 'Amit', 'Sunita', 'Neha', 'Vikram', 'Kavya', 'Meera', 'Nikhil', 'Pooja', 'Ravi',
+]
+LAST_NAMES = [
+    'Sharma', 'Verma', 'Patel', 'Shah', 'Mehta', 'Iyer', 'Nair', 'Reddy', 'Rao', 'Gupta',
+    'Singh', 'Kumar', 'Joshi', 'Kulkarni', 'Desai', 'Menon', 'Chopra', 'Malhotra', 'Bose', 'Das',
+]
+ITEM_WORDS = [
+    'Solar Panel', 'Inverter', 'Battery', 'Mounting Rail', 'DC Cable', 'AC Cable', 'Junction Box', 'MC4 Connector',
+    'Earthing Kit', 'Lightning Arrester', 'Meter', 'Distribution Box', 'Conduit', 'Clamp', 'Breaker',
+]
+TASK_TITLES = ['Site survey', 'Follow up', 'Send BOQ', 'Installation', 'Collect advance']
+ITEM_GRADES = ['Standard', 'Premium', 'Heavy Duty', 'Compact', 'Pro', 'Lite']
+NOTIFICATION_MESSAGES = [
+    'New task assigned: {}', 'Task "{}" marked as complete', 'BOQ approved for {}', 'Follow up with {}',
+    'Excel upload completed! Added: 120, Updated: 4, Errors: 0',
+]
+
+
+@dataclass
+class SeedReport:
+    counts: dict = field(default_factory=dict)
+
+    def add(self, model, count):
+        name = model._meta.object_name
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def __str__(self):
+        return ', '.join(f'{count} {name}' for name, count in self.counts.items())
+
+
+class _Sampler:
+    """Deterministic draws from one random.Random"""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+
+    def weighted(self, choices):
+        values, weights = zip(*choices)
+        return self.rng.choices(values, weights)[0]
+
+    def count(self, bounds):
+        return self.rng.randint(*bounds)
+
+    def geometric(self, mean, cap):
+        # Number of trials until the first success, with success probability 1 / mean
+        return min(cap, 1 + int(math.log(1 - self.rng.random()) / math.log(1 - 1 / mean)))
+
+    def money(self, median, sigma=0.8):
+        return Decimal(round(self.rng.lognormvariate(math.log(median), sigma), 2)).quantize(Decimal('0.01'))
+
+    def recent(self, now, days):
+        # Skewed towards the recent past, like a growing business
+        return now - timedelta(days=days * self.rng.random() ** 2, seconds=self.rng.randrange(86400))
+
+
+class SeedConflict(Exception):
+    """Another process wrote to a table while it was being seeded"""
+
+
+class BulkWriter:
+    """
+    Chunked multi-row INSERTs of one model, the way loaddata writes fixtures:
+    ids are allocated up front (so children can reference rows before they
+    are written) and values are adapted per field type once, which avoids
+    bulk_create's per-value compiler overhead (~100µs per row). Rows send no
+    signals and skip save(); auto_now fields take the given values.
+
+    The ids continue from the table's Max(pk) when the writer is built, so
+    nothing else may insert into the table meanwhile: each flush checks
+    that the table still ends at the last id written, and raises
+    SeedConflict (rolling back the chunk) if it does not.
+    """
+
+    def __init__(self, model, report, chunk_size=SEED_CHUNK_SIZE):
+        self.model, self.report, self.chunk_size = model, report, chunk_size
+        self.connection = connections[DEFAULT_DB_ALIAS]
+        ops = self.connection.ops
+        fields = model._meta.concrete_fields
+        # fields[0] is the primary key
+        self.columns = [(f.attname, f.get_default() if f.has_default() else None) for f in fields[1:]]
+        # Values are given as the field's Python type; only these need the backend's adaptation
+        self.adapters = [
+            (i, ops.adapt_datetimefield_value) if isinstance(f, models.DateTimeField)
+            else (i, ops.adapt_datefield_value) if isinstance(f, models.DateField)
+            else (i, partial(ops.adapt_decimalfield_value, max_digits=f.max_digits, decimal_places=f.decimal_places))
+            for i, f in enumerate(fields)
+            if isinstance(f, (models.DateField, models.DecimalField))
+        ]
+        self.sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            ops.quote_name(model._meta.db_table),
+            ', '.join(ops.quote_name(f.column) for f in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        self.last_written = self._last_id()
+        self.next_id = (self.last_written or 0) + 1
+        self.rows = []
+
+    def _last_id(self):
+        return self.model.objects.aggregate(last=Max('pk'))['last']
+
+    def add(self, **values):
+        """Queue a row; returns its id"""
+        pk = self.next_id
+        self.next_id += 1
+        row = [pk] + [values.get(name, default) for name, default in self.columns]
+        for i, adapt in self.adapters:
+            if row[i] is not None:
+                row[i] = adapt(row[i])
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+        return pk
+
+    def flush(self):
+        if self.rows:
+            if self._last_id() != self.last_written:
+                raise SeedConflict(
+                    f'{self.model._meta.db_table} was written to while seeding; seed_scale must run with the site offline'
+                )
+            with self.connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.rows)
+            self.report.add(self.model, len(self.rows))
+            self.last_written = self.rows[-1][0]
+            self.rows = []
+
+
+def _phone_number(n):
+    # A permutation of 7000000000..9999999999 (7919 is coprime with its size), so numbers never repeat
+    return str(7000000000 + n * 7919 % 3000000000)
+
+
+def _seed_users(sample, count, prefix, report):
+    password = make_password(None)
+    users = User.objects.bulk_create([
+        User(
+            username=f'{prefix}user{n}',
+            first_name=sample.rng.choice(FIRST_NAMES),
+            last_name=sample.rng.choice(LAST_NAMES),
+            email=f'{prefix}user{n}@example.com',
+            password=password,
+        )
+        for n in range(count)
+    ])
+    report.add(User, len(users))
+
+    memberships = []
+    for name, share in GROUP_SHARES:
+        group, _ = Group.objects.get_or_create(name=name)
+        members = users if share >= 1 else sample.rng.sample(users, max(1, round(len(users) * share)))
+        memberships += [User.groups.through(user_id=user.pk, group_id=group.pk) for user in members]
+    User.groups.through.objects.bulk_create(memberships)
+    return [user.pk for user in users]
+
+
+def _seed_inventory(sample, writer, count, now, days):
+    inventory = []
+    for n in range(count):
+        name = f'{sample.rng.choice(ITEM_WORDS)} {sample.rng.choice(ITEM_GRADES)} {n}'
+        price = sample.money(2500, 1.1)
+        available = 0 if sample.rng.random() < 0.2 else sample.rng.randint(1, 500)
+        pk = writer.add(
+            item_name=name,
+            unit_selling_price=price,
+            available_quantity=available,
+            quantity_to_be_ordered=0,
+            snapshot_d=sample.recent(now, days),
+        )
+        inventory.append((pk, name, price, available))
+    writer.flush()
+    return inventory
+
+
+def _seed_boq(sample, writers, project, inventory, created_at, invoice_number):
+    boq_id = writers[BOQ].next_id
+    subtotal = item_discounts = Decimal('0')
+    count = min(len(inventory), sample.geometric(BOQ_ITEMS_MEAN, BOQ_ITEMS_MAX))
+    for sr_no, (item_id, name, price, available) in enumerate(sample.rng.sample(inventory, count), 1):
+        quantity = sample.rng.randint(1, 50)
+        discount_percentage = DISCOUNTS[sample.rng.randrange(len(DISCOUNTS))]
+        gross = price * quantity
+        discount = (gross * discount_percentage / 100).quantize(CENTS)
+        subtotal += gross
+        item_discounts += discount
+        boq_item_id = writers[BOQItem].add(
+            boq_id=boq_id,
+            sr_no=sr_no,
+            inventory_item_id=item_id,
+            item_name=name,
+            unit_price=price,
+            quantity=quantity,
+            discount_percentage=discount_percentage,
+            discount_amount=discount,
+            line_total=gross - discount,
+            has_sufficient_stock=available >= quantity,
+            available_quantity=available,
+            created_at=created_at,
+        )
+        if available < quantity:
+            writers[InventoryOrderRequirement].add(
+                inventory_item_id=item_id,
+                project_id=project['id'],
+                boq_id=boq_id,
+                boq_item_id=boq_item_id,
+                required_quantity=quantity,
+                available_quantity=available,
+                shortage_quantity=quantity - available,
+                status=sample.weighted(REQUIREMENT_STATUSES),
+                created_at=created_at,
+                updated_at=created_at,
+            )
+
+    # Same arithmetic as BOQ.calculate_totals, without an overall discount
+    taxable = subtotal - item_discounts
+    total_tax = (taxable * TAX_RATE / 100).quantize(CENTS)
+    writers[BOQ].add(
+        lead_source_id=project['lead_source_id'],
+        project_id=project['id'],
+        invoice_number=invoice_number,
+        tax_rate=TAX_RATE,
+        subtotal=subtotal,
+        total_discount=item_discounts,
+        total_tax=total_tax,
+        grand_total=taxable + total_tax,
+        status=sample.weighted(BOQ_STATUSES),
+        created_by_id=project['user_id'],
+        created_at=created_at,
+        updated_at=created_at,
+    )
+
+
+def _seed_lead_chunk(sample, writers, first, count, user_ids, inventory, now, days):
+    for n in range(first, first + count):
+        first_name, last_name = sample.rng.choice(FIRST_NAMES), sample.rng.choice(LAST_NAMES)
+        user_id = sample.rng.choice(user_ids)
+        snapshot_d = sample.recent(now, days)
+        has_project = sample.rng.random() < PROJECT_RATE
+        lead_id = writers[LeadSource].add(
+            phone_number=_phone_number(n),
+            first_name=first_name,
+            last_name=last_name,
+            address=f'{sample.rng.randint(1, 999)}, {sample.weighted(CITIES)}',
+            has_project=has_project,
+            user_id=user_id,
+            snapshot_d=snapshot_d,
+        )
+        if not has_project:
+            continue
+
+        project = {
+            'project_name': f'{first_name} {last_name} Rooftop {sample.rng.randint(2, 25)} kW',
+            'amount': None if sample.rng.random() < 0.15 else sample.money(250000),
+            'expected_closure': (snapshot_d + timedelta(days=sample.rng.randint(15, 120))).date(),
+            'status': sample.weighted(PROJECT_STATUSES),
+            'lead_source_id': lead_id,
+            'user_id': user_id if sample.rng.random() < 0.9 else sample.rng.choice(user_ids),
+            'snapshot_d': min(now, snapshot_d + timedelta(days=sample.rng.randint(0, 30))),
+            'city': sample.weighted(CITIES),
+        }
+        project['id'] = writers[Project].add(**project)
+
+        for i in range(sample.count(BOQS_PER_PROJECT) if inventory else 0):
+            created_at = min(now, project['snapshot_d'] + timedelta(days=sample.rng.randint(0, 20)))
+            invoice_number = f"INV-{created_at:%Y%m%d}-S{project['id']}-{i}"
+            _seed_boq(sample, writers, project, inventory, created_at, invoice_number)
+
+        for _ in range(sample.count(TASKS_PER_PROJECT)):
+            due_date = now + timedelta(days=sample.rng.uniform(-60, 45))
+            writers[Task].add(
+                user_id=sample.rng.choice(user_ids),
+                assigned_by_id=project['user_id'] or sample.rng.choice(user_ids),
+                project_id=project['id'],
+                title=f"{sample.rng.choice(TASK_TITLES)} - {project['project_name']}",
+                due_date=due_date,
+                completed=due_date < now and sample.rng.random() < 0.7,
+                priority=sample.weighted(TASK_PRIORITIES),
+                snapshot_d=min(now, due_date),
+            )
+
+
+def seed_scale(
+    leads=10000, inventory=2000, users=50, events=5000, notifications=50000, days=365, seed=1, prefix='seed',
+    on_progress=None,
+):
+    """
+    Generate a production-shaped data set: `users` users spread over the access
+    groups, `inventory` items, `leads` leads (PROJECT_RATE of them with a
+    project, each with BOQS_PER_PROJECT BOQs and TASKS_PER_PROJECT tasks), and
+    `events` / `notifications` rows for the seeded users, over the last `days`.
+
+    Rows are written in chunks of SEED_CHUNK_SIZE, one transaction per chunk.
+    The same seed produces the same data (timestamps are relative to today).
+    The derived search index, rollups and caches are rebuilt afterwards.
+
+    Offline only: ids are allocated by BulkWriter rather than the database,
+    so the site must not write to these tables while this runs. Concurrent
+    writes are detected per chunk and raise SeedConflict.
+    """
+    sample = _Sampler(seed)
+    report = SeedReport()
+    now = timezone.make_aware(datetime.combine(timezone.localdate(), time(hour=9)))
+    lead_offset = LeadSource.objects.count()
+    writers = {model: BulkWriter(model, report) for model in SEEDED_MODELS}
+
+    with transaction.atomic():
+        user_ids = _seed_users(sample, users, prefix, report)
+        inventory_rows = _seed_inventory(sample, writers[InventoryItem], inventory, now, days)
+
+    for first in range(0, leads, SEED_CHUNK_SIZE):
+        with transaction.atomic():
+            _seed_lead_chunk(
+                sample, writers, lead_offset + first, min(SEED_CHUNK_SIZE, leads - first),
+                user_ids, inventory_rows, now, days,
+            )
+            for writer in writers.values():
+                writer.flush()
+        if on_progress:
+            on_progress(report)
+
+    with transaction.atomic():
+        for _ in range(events):
+            start = now + timedelta(days=sample.rng.uniform(-days, 30), hours=sample.rng.randint(0, 8))
+            writers[Event].add(
+                start_datetime=start,
+                end_datetime=start + timedelta(minutes=sample.rng.choice([30, 60, 90, 120])),
+                agenda=f'Meeting with {sample.rng.choice(FIRST_NAMES)} {sample.rng.choice(LAST_NAMES)}',
+                user_id=sample.rng.choice(user_ids),
+                snapshot_d=start,
+            )
+        for _ in range(notifications):
+            created_at = sample.recent(now, min(days, 90))
+            writers[Notification].add(
+                user_id=sample.rng.choice(user_ids),
+                message=sample.rng.choice(NOTIFICATION_MESSAGES).format(sample.rng.choice(FIRST_NAMES)),
+                # Older notifications are more likely to have been read
+                is_read=sample.rng.random() < NOTIFICATION_READ_RATE * min(1, (now - created_at).days / 7 + 0.2),
+                created_at=created_at,
+            )
+        for writer in writers.values():
+            writer.flush()
+
+    # Explicit ids leave the id sequences behind on PostgreSQL
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), SEEDED_MODELS):
+            cursor.execute(sql)
+
+    # Nothing above sent signals: rebuild everything the signals would have maintained
+    rebuild_lead_index()
+    rebuild_project_rollup()
+    rebuild_inventory_rollup()
+    rebuild_totals()
+    inventory_changed()
+    return report
@@ -1,50 +1,96 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from django.contrib.auth.models import Group
-from .models import Task, TaskAssignment, Notification
+from django.contrib.auth.models import User
+from .models import Task, TaskAssignment, Project, BOQ, LeadSource, InventoryItem
+from .inventory_index import inventory_changed
+from .lead_search import index_lead, remove_lead
+from .notifications import group_members, notify
+from .pdf import invalidate_boq_pdf
+from .permissions import invalidate_user_groups
+from .rollups import (
+    TOTAL_FIELDS,
+    apply_boq_approval,
+    apply_project_change,
+    apply_totals_change,
+    project_state,
+    rebuild_project_rollup,
+    row_totals,
+)
 
 @receiver(post_save, sender=TaskAssignment)
 def send_task_assignment_notification(sender, instance, created, **kwargs):
     if created:
-        # 1. Save Notification to DB
-        Notification.objects.create(
-            user=instance.user,
-            message=f'You have been assigned a new task: "{instance.task.title}"'
-        )
-
-        # 2. Send WebSocket event
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{instance.user.id}",
-            {
-                "type": "send_notification",
-                "message": f'You have been assigned a new task: "{instance.task.title}"'
-            }
-        )
-
+        notify([instance.user_id], f'You have been assigned a new task: "{instance.task.title}"')
 
 
 @receiver(post_save, sender=Task)
 def notify_admin_on_completion(sender, instance, **kwargs):
     if instance.completed:
-        admin_group = Group.objects.filter(name="Admin").first()
-        if not admin_group:
-            return
-
-        channel_layer = get_channel_layer()
-
-        for admin in admin_group.user_set.all():
-            Notification.objects.create(
-                user=admin,
-                message=f'Task "{instance.title}" has been marked completed by {instance.user.username}'
-            )
-
-            async_to_sync(channel_layer.group_send)(
-                "notifications",
-                {
-                    "type": "send_notification",
-                    "message": f'Task "{instance.title}" completed by {instance.user.username}'
-                }
-            )
+        assignee = instance.user.username if instance.user else 'Unknown'
+        notify(
+            group_members("Admin"),
+            f'Task "{instance.title}" has been marked completed by {assignee}',
+            push_message=f'Task "{instance.title}" completed by {assignee}',
+        )
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_group_cache(sender, instance, action, reverse, **kwargs):
+    """Keep the group names memoized on a user object in sync when its memberships change."""
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_user_groups(instance)
+
+
+@receiver(post_delete, sender=Project)
+def remove_project_from_rollup(sender, instance, **kwargs):
+    state = getattr(instance, '_rollup_state', None) or project_state(instance)
+    apply_project_change(state, None)
+
+
+@receiver(post_delete, sender=LeadSource)
+@receiver(post_delete, sender=InventoryItem)
+def remove_from_totals(sender, instance, **kwargs):
+    # Also sent for rows removed by a cascade or a queryset delete()
+    apply_totals_change(row_totals(sender, [getattr(instance, name) for name in TOTAL_FIELDS[sender]]), {})
+
+
+@receiver(pre_delete, sender=BOQ)
+def remove_boq_from_sales_rollup(sender, instance, **kwargs):
+    # Items are removed by the cascade before post_delete, so this has to run first
+    if instance.status == 'approved':
+        apply_boq_approval(instance, -1)
+
+
+@receiver(post_delete, sender=User)
+def rebuild_unassigned_rollup(sender, instance, **kwargs):
+    # Deleting a user nulls Project.user with a bulk update that never calls save()
+    rebuild_project_rollup(user_ids=[None])
+
+
+@receiver(post_delete, sender=BOQ)
+def remove_boq_pdfs(sender, instance, **kwargs):
+    invalidate_boq_pdf(instance.pk)
+
+
+@receiver(post_save, sender=LeadSource)
+def invalidate_lead_boq_pdfs(sender, instance, created, **kwargs):
+    # Customer details are printed on the BOQ PDF but don't bump BOQ.updated_at
+    if not created:
+        for boq_id in instance.boqs.values_list('id', flat=True):
+            invalidate_boq_pdf(boq_id)
+
+
+@receiver(post_save, sender=LeadSource)
+def index_lead_for_search(sender, instance, **kwargs):
+    index_lead(instance)
+
+
+@receiver(post_delete, sender=LeadSource)
+def remove_lead_from_search(sender, instance, **kwargs):
+    remove_lead(instance.pk)
+
+
+@receiver(post_save, sender=InventoryItem)
+@receiver(post_delete, sender=InventoryItem)
+def refresh_inventory_index(sender, instance, **kwargs):
+    inventory_changed([instance.pk])
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import User
+from django.db.models import Count, Q
+
+from .models import Project
+
+TASK_BUCKETS = ('active', 'completed', 'pending')
+
+# Keyset orderings per bucket, served by the (user / assigned_by, completed, due_date) indexes
+BUCKET_ORDERINGS = {
+    'active': ('due_date', 'id'),  # next due first
+    'completed': ('-due_date', '-id'),  # most recent first
+    'pending': ('due_date', 'id'),  # longest overdue first
+}
+
+
+def bucket_filter(bucket, now):
+    """Active: open and not yet due. Pending: open and overdue."""
+    return {
+        'active': Q(completed=False, due_date__gt=now),
+        'completed': Q(completed=True),
+        'pending': Q(completed=False, due_date__lte=now),
+    }[bucket]
+
+
+def bucket_counts(tasks, now):
+    """Task count per bucket, in one conditional-aggregate query"""
+    row = tasks.order_by().aggregate(
+        **{f'{bucket}_count': Count('id', filter=bucket_filter(bucket, now)) for bucket in TASK_BUCKETS}
+    )
+    return {bucket: row[f'{bucket}_count'] for bucket in TASK_BUCKETS}
+
+
+def bucket_tasks(tasks, bucket, now):
+    """The tasks of one bucket with everything the task table renders"""
+    return tasks.filter(bucket_filter(bucket, now)).select_related('project', 'user', 'assigned_by')
+
+
+# Dropdown options of the task forms. Read on every request rather than cached, so a
+# project or user added by any worker can be picked at once; each is one index scan.
+
+def project_choices():
+    """(id, project_name) of every project, by name (project_name_idx)"""
+    return list(Project.objects.order_by('project_name').values_list('id', 'project_name'))
+
+
+def user_choices():
+    """(id, username) of every user, by username (its unique index)"""
+    return list(User.objects.order_by('username').values_list('id', 'username'))
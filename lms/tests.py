@@ -1,3 +1,1044 @@
-from django.test import TestCase
+import io
+import json
+import pstats
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from urllib.parse import parse_qsl
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import channel_layers, get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.contrib.messages import get_messages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmarks import compare, load_baseline, run_benchmarks, seed_benchmark_data
+from .boq import BOQLine, build_boq_items, reconcile_boq_items
+from .consumers import NotificationConsumer
+from .dashboard import (
+    build_dashboard_summary,
+    build_rollup_dashboard_summary,
+    lead_source_counts,
+    rollup_cities,
+    rollup_lead_source_counts,
+    rollup_statuses,
+)
+from .instrumentation import histogram
+from .import_jobs import run_import_job
+from . import inventory_index, notification_retention
+from .inventory_import import IMPORT_LOCK, import_inventory_rows
+from .lead_search import _fts_enabled, _search_orm, filter_leads, parse_query, search_lead_ids
+from .locks import DatabaseLock, LockUnavailable
+from .models import (
+    BOQ,
+    BOQItem,
+    Event,
+    InventoryImportJob,
+    InventoryIndexChange,
+    InventoryItem,
+    InventoryOrderRequirement,
+    InvoiceSequence,
+    LeadSource,
+    NamedLock,
+    Notification,
+    NotificationArchive,
+    Project,
+    RollupTotal,
+    Task,
+)
+from .notifications import notify, unread_count
+from .pagination import BY_ITEM_NAME, NEWEST_CREATED, PAGE_SIZE, RECENT_FIRST
+from .pdf import export_queryset, get_boq_pdf, invalidate_boq_pdf, store_boq_pdf, stream_boq_zip
+from .rollups import LEAD_TOTALS, STOCK_TOTALS, compute_totals, page_totals
+from .query_inspector import query_budget, record_queries
+from .scale_seed import SeedConflict, seed_scale
+from .task_lists import project_choices, user_choices
+
+
+class QueryPlanTests(TestCase):
+    """The hot list/count queries of the views are answered from the Meta.indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be scanned sequentially
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'{index_name} not used by:\n{queryset.query}\n{plan}')
+
+    def test_project_lists(self):
+        page = PAGE_SIZE + 1
+        self.assertUsesIndex(Project.objects.order_by(*RECENT_FIRST)[:page], 'project_recent_idx')
+        self.assertUsesIndex(
+            Project.objects.filter(status='advance').order_by(*RECENT_FIRST)[:page], 'project_status_recent_idx'
+        )
+        self.assertUsesIndex(Project.objects.filter(user=self.user, status='won'), 'project_user_status_idx')
+        self.assertUsesIndex(Project.objects.filter(city='Pune'), 'project_city_idx')
+        self.assertUsesIndex(Project.objects.filter(amount__gt=0).order_by('-amount')[:10], 'project_amount_idx')
+
+    def test_lead_and_inventory_lists(self):
+        page = PAGE_SIZE + 1
+        self.assertUsesIndex(LeadSource.objects.order_by(*RECENT_FIRST)[:page], 'lead_recent_idx')
+        self.assertUsesIndex(InventoryItem.objects.order_by(*BY_ITEM_NAME)[:page], 'inventory_name_idx')
+
+    def test_notifications(self):
+        self.assertUsesIndex(
+            Notification.objects.filter(user=self.user).order_by(*NEWEST_CREATED)[:PAGE_SIZE + 1],
+            'notification_user_recent_idx',
+        )
+        self.assertUsesIndex(Notification.objects.filter(user=self.user, is_read=False), 'notification_user_unread_idx')
+
+    def test_tasks(self):
+        now = timezone.now()
+        self.assertUsesIndex(
+            Task.objects.filter(user=self.user, completed=False, due_date__gt=now), 'task_user_open_due_idx'
+        )
+        self.assertUsesIndex(Task.objects.filter(assigned_by=self.user, completed=True), 'task_assigner_open_due_idx')
+        self.assertUsesIndex(Project.objects.order_by('project_name').values_list('id', 'project_name'), 'project_name_idx')
+
+    def test_project_documents(self):
+        self.assertUsesIndex(BOQ.objects.filter(project_id=1).order_by('-created_at'), 'boq_project_created_idx')
+        self.assertUsesIndex(
+            InventoryOrderRequirement.objects.filter(inventory_item_id=1).order_by('-created_at'),
+            'requirement_item_created_idx',
+        )
+
+    def test_lead_phone_lookup(self):
+        # SQLite names the index backing a table-level UNIQUE constraint itself
+        index_name = 'sqlite_autoindex_lms_leadsource' if connection.vendor == 'sqlite' else 'unique_lead_phone'
+        self.assertUsesIndex(LeadSource.objects.filter(country_code='+91', phone_number='9876543210'), index_name)
+
+
+class TaskChoicesTests(TestCase):
+    def test_choices_see_rows_written_elsewhere(self):
+        self.assertEqual(project_choices(), [])
+        # bulk_create sends no signals, like a write made by another worker
+        project = Project.objects.bulk_create([Project(project_name='Rooftop')])[0]
+        User.objects.bulk_create([User(username='newhire')])
+        self.assertEqual(project_choices(), [(project.id, 'Rooftop')])
+        self.assertIn('newhire', [name for _, name in user_choices()])
+
+
+class LeadPhoneConstraintTests(TestCase):
+    def test_duplicate_phone_rejected(self):
+        LeadSource.objects.create(first_name='A', phone_number='9876543210')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LeadSource.objects.create(first_name='B', phone_number='9876543210')
+        LeadSource.objects.create(first_name='C', country_code='+1', phone_number='9876543210')
+
+
+class DashboardRollupTests(TestCase):
+    """The rollup dashboard shows the same figures as the live queries it replaces"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('rollup', is_superuser=True)
+        cls.leads = [
+            LeadSource.objects.create(first_name=f'Lead{i}', phone_number=f'900000000{i}') for i in range(3)
+        ]
+
+    def create_project(self, lead, **fields):
+        return Project.objects.create(project_name='P', lead_source=lead, user=self.admin, **fields)
+
+    def test_summary_matches_live_queries(self):
+        self.create_project(self.leads[0], status='advance', amount=1000, city='Pune')
+        self.create_project(self.leads[0], status='won', city='')
+        self.create_project(self.leads[1], status='advance', city=None)
+        moved = self.create_project(self.leads[1], status='open', amount=50, city='Delhi')
+        moved.lead_source = self.leads[2]
+        moved.status = 'advance'
+        moved.save()
+        self.create_project(self.leads[2], status='lost', city='Mumbai').delete()
+
+        live = build_dashboard_summary(Project.objects.all())
+        rollup = build_rollup_dashboard_summary(Project.objects.all())
+        for name in ('total_projects', 'won_count', 'billed_count', 'total_revenue', 'status_counts',
+                     'lead_source_counts', 'city_counts', 'revenue_data'):
+            self.assertEqual(getattr(rollup, name), getattr(live, name), name)
+        self.assertEqual(rollup_lead_source_counts(), {'Lead0': 2, 'Lead1': 1, 'Lead2': 1})
+        self.assertEqual(rollup_lead_source_counts(), lead_source_counts(Project.objects.all()))
+
+        # Emptied buckets are not offered as filters
+        self.assertEqual(rollup_cities(), ['Delhi', 'Pune'])
+        self.assertEqual(rollup_statuses(), ['advance', 'won'])
+
+    def test_dashboard_does_not_list_every_lead(self):
+        self.create_project(self.leads[0], status='advance', amount=10)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('dashboard'))
+        self.assertNotContains(response, 'Lead2')
+
+        response = self.client.get(reverse('dashboard'), {'lead': self.leads[2].pk})
+        self.assertContains(response, 'value="Lead2 ')
+
+
+class PageTotalsTests(TestCase):
+    """The lead source and inventory header counts are kept in RollupTotal by every write path"""
+
+    def assertTotalsCurrent(self):
+        self.assertEqual(page_totals(LEAD_TOTALS + STOCK_TOTALS), compute_totals())
+
+    def test_lead_saves_and_deletes(self):
+        lead = LeadSource.objects.create(first_name='Asha', phone_number='9222222222')
+        LeadSource.objects.create(first_name='Bina', phone_number='9222222223')
+        self.assertEqual(page_totals(LEAD_TOTALS), {'leads': 2, 'leads_with_projects': 0})
+
+        lead.has_project = True
+        lead.save()
+        lead.save()  # unchanged
+        self.assertEqual(page_totals(LEAD_TOTALS), {'leads': 2, 'leads_with_projects': 1})
+
+        lead.delete()
+        self.assertEqual(page_totals(LEAD_TOTALS), {'leads': 1, 'leads_with_projects': 0})
+
+        # Cascaded deletes are counted too
+        user = User.objects.create_user('owner')
+        LeadSource.objects.create(first_name='Chitra', phone_number='9222222224', user=user, has_project=True)
+        user.delete()
+        self.assertTotalsCurrent()
+
+    def test_inventory_write_paths(self):
+        cable = InventoryItem.objects.create(item_name='Cable', unit_selling_price=10, available_quantity=5)
+        InventoryItem.objects.create(item_name='Panel', unit_selling_price=100, available_quantity=0)
+        self.assertEqual(page_totals(STOCK_TOTALS), {
+            'inventory': 2, 'inventory_low_stock': 1, 'inventory_out_of_stock': 1, 'inventory_to_order': 0,
+        })
+
+        # Stock reserved by a BOQ, shortages added by reconciling it, an import
+        lead = LeadSource.objects.create(first_name='Boq', phone_number='9333333333')
+        boq = BOQ.objects.create(lead_source=lead, project=Project.objects.create(project_name='P', lead_source=lead))
+        build_boq_items(boq, [BOQLine(1, cable.pk, 5)])
+        self.assertEqual(page_totals(STOCK_TOTALS)['inventory_out_of_stock'], 2)
+        reconcile_boq_items(boq, [BOQLine(1, cable.pk, 8)])
+        self.assertTotalsCurrent()
+        import_inventory_rows(enumerate([('cable', 10, 20, 0), ('Mount', 5, 3, 4)], start=2))
+        self.assertEqual(page_totals(STOCK_TOTALS), {
+            'inventory': 3, 'inventory_low_stock': 1, 'inventory_out_of_stock': 1, 'inventory_to_order': 12,
+        })
+        self.assertTotalsCurrent()
+
+        InventoryItem.objects.get(item_name='Panel').delete()
+        InventoryItem.objects.filter(item_name='Mount').delete()
+        self.assertEqual(page_totals(STOCK_TOTALS)['inventory'], 1)
+        self.assertTotalsCurrent()
+
+    def test_headers_read_the_rollup(self):
+        self.client.force_login(User.objects.create_superuser('header', password='pw'))
+        RollupTotal.objects.update_or_create(name='leads', defaults={'value': 1234567})
+        RollupTotal.objects.update_or_create(name='inventory_to_order', defaults={'value': 7654321})
+
+        with record_queries() as recorder:
+            self.assertContains(self.client.get(reverse('lead_sources')), '1234567')
+            self.assertContains(self.client.get(reverse('inventory')), '7654321')
+        self.assertFalse([sql for sql, _, _ in recorder.queries if 'COUNT(' in sql])
+
+
+class BOQItemTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = LeadSource.objects.create(first_name='Boq', phone_number='9111111111')
+        cls.project = Project.objects.create(project_name='P', lead_source=cls.lead)
+
+    def setUp(self):
+        self.cable = InventoryItem.objects.create(item_name='Cable', unit_selling_price=10, available_quantity=5)
+        self.boq = BOQ.objects.create(lead_source=self.lead, project=self.project)
+
+    def test_repeated_item_sees_stock_reserved_by_earlier_lines(self):
+        result = build_boq_items(self.boq, [BOQLine(1, self.cable.pk, 3), BOQLine(2, self.cable.pk, 3)])
+
+        first, second = result.items
+        self.assertEqual((first.available_quantity, first.has_sufficient_stock), (5, True))
+        self.assertEqual((second.available_quantity, second.has_sufficient_stock), (2, False))
+        self.assertEqual([r.shortage_quantity for r in result.requirements], [1])
+        self.cable.refresh_from_db()
+        self.assertEqual((self.cable.available_quantity, self.cable.quantity_to_be_ordered), (-1, 1))
+        self.boq.refresh_from_db()
+        self.assertEqual(self.boq.subtotal, Decimal('60'))
+
+    def build(self):
+        screen = InventoryItem.objects.create(item_name='Screen', unit_selling_price=100, available_quantity=2)
+        build_boq_items(self.boq, [BOQLine(1, self.cable.pk, 2), BOQLine(2, screen.pk, 1)])
+        return screen, {item.inventory_item_id: item.pk for item in self.boq.items.all()}
+
+    def rows(self):
+        return list(self.boq.items.values_list('sr_no', 'inventory_item_id', 'quantity'))
+
+    def test_swapped_lines_keep_their_rows(self):
+        screen, pks = self.build()
+        result = reconcile_boq_items(self.boq, [BOQLine(1, screen.pk, 1), BOQLine(2, self.cable.pk, 2)])
+
+        self.assertEqual((result.created, result.deleted_count), ([], 0))
+        self.assertEqual({item.pk for item in result.updated}, set(pks.values()))
+        # Rows parked on negative numbers during the swap end up on the submitted ones
+        self.assertEqual(self.rows(), [(1, screen.pk, 1), (2, self.cable.pk, 2)])
+        self.assertEqual(self.boq.items.get(sr_no=1).pk, pks[screen.pk])
+
+    def test_removed_line_frees_its_serial_number(self):
+        screen, pks = self.build()
+        hdmi = InventoryItem.objects.create(item_name='HDMI', unit_selling_price=5, available_quantity=10)
+        result = reconcile_boq_items(self.boq, [BOQLine(1, self.cable.pk, 2), BOQLine(2, hdmi.pk, 4)])
+
+        self.assertEqual(result.deleted_count, 1)
+        self.assertEqual([item.sr_no for item in result.created], [2])
+        self.assertEqual([item.pk for item in result.unchanged], [pks[self.cable.pk]])
+        self.assertEqual(self.rows(), [(1, self.cable.pk, 2), (2, hdmi.pk, 4)])
+        self.boq.refresh_from_db()
+        self.assertEqual(self.boq.subtotal, Decimal('40'))
+
+    def test_changed_quantity_orders_only_the_extra_shortage(self):
+        screen, pks = self.build()  # 1 of the 2 screens is left in stock
+
+        def reconcile(quantity):
+            reconcile_boq_items(self.boq, [BOQLine(1, self.cable.pk, 2), BOQLine(2, screen.pk, quantity)])
+            screen.refresh_from_db()
+            return screen.quantity_to_be_ordered, list(
+                InventoryOrderRequirement.objects.filter(boq=self.boq).values_list('shortage_quantity', flat=True)
+            )
+
+        self.assertEqual(reconcile(4), (3, [3]))
+        self.assertEqual(reconcile(5), (4, [4]))
+        self.assertEqual(reconcile(2), (4, [1]))  # lowering a quantity never un-orders stock
+        self.assertEqual(screen.available_quantity, 1)  # stock is not reserved again
+
+
+class InvoiceNumberTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = LeadSource.objects.create(first_name='Invoice', phone_number='9222222222')
+        cls.today = timezone.localdate()
+
+    def number(self, n):
+        return InvoiceSequence.format_number(self.today, n)
+
+    def issue_by_hand(self, *numbers):
+        BOQ.objects.bulk_create([BOQ(lead_source=self.lead, invoice_number=self.number(n)) for n in numbers])
+
+    def test_first_counter_continues_after_issued_numbers(self):
+        self.issue_by_hand(7)
+        self.assertEqual(list(InvoiceSequence.allocate()), [8])
+        self.assertEqual(list(InvoiceSequence.allocate(2)), [9, 10])
+        self.assertEqual(InvoiceSequence.objects.get(day=self.today).last_number, 10)
+
+    def test_counter_created_concurrently_is_bumped_instead(self):
+        # Another request creates today's counter between our UPDATE and INSERT
+        InvoiceSequence.objects.create(day=self.today, last_number=4)
+        real_update, calls = QuerySet.update, []
+
+        def first_update_misses(queryset, **kwargs):
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else real_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=first_update_misses):
+            self.assertEqual(list(InvoiceSequence.allocate()), [5])
+        self.assertEqual(len(calls), 2)
+
+    def test_reserve(self):
+        self.assertEqual(InvoiceSequence.reserve(3), [self.number(1), self.number(2), self.number(3)])
+        self.assertEqual(InvoiceSequence.next_invoice_number(), self.number(4))
+
+    def test_save_skips_numbers_assigned_by_hand(self):
+        InvoiceSequence.objects.create(day=self.today, last_number=0)
+        self.issue_by_hand(1, 2)
+        boq = BOQ.objects.create(lead_source=self.lead)
+        self.assertEqual(boq.invoice_number, self.number(3))
+
+    def test_save_gives_up_after_its_attempts(self):
+        InvoiceSequence.objects.create(day=self.today, last_number=0)
+        self.issue_by_hand(*range(1, BOQ.INVOICE_SAVE_ATTEMPTS + 1))
+        boq = BOQ(lead_source=self.lead)
+        with self.assertRaises(IntegrityError):
+            boq.save()
+        self.assertEqual(boq.invoice_number, '')
+
+
+class BOQPdfCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pdf', is_superuser=True)
+        cls.lead = LeadSource.objects.create(first_name='Pdf', phone_number='9333333333')
+
+    def setUp(self):
+        self.boq = BOQ.objects.create(lead_source=self.lead, created_by=self.user)
+        pdf_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(pdf_dir.cleanup)
+        self.enterContext(override_settings(BOQ_PDF_CACHE_DIR=Path(pdf_dir.name), BOQ_PDF_BACKGROUND=False))
+        self.render = self.enterContext(mock.patch('lms.pdf.html_to_pdf', return_value=b'%PDF-1 rendered'))
+
+    def download(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('download_boq_pdf', args=[self.boq.pk]))
+        return b''.join(response.streaming_content)
+
+    def test_cache_hit_and_invalidation(self):
+        self.assertEqual(self.download(), b'%PDF-1 rendered')
+        self.assertEqual(self.download(), b'%PDF-1 rendered')
+        self.assertEqual(self.render.call_count, 1)
+
+        self.boq.notes = 'changed'
+        self.boq.save()  # a new version; the old file is removed
+        self.assertEqual(self.download(), b'%PDF-1 rendered')
+        self.assertEqual(self.render.call_count, 2)
+        self.assertEqual(len(list(settings.BOQ_PDF_CACHE_DIR.glob(f'{self.boq.pk}_*.pdf'))), 1)
+
+    def test_invalidated_while_serving(self):
+        store_boq_pdf(self.boq, b'%PDF-1 cached')
+        with get_boq_pdf(self.boq) as pdf:
+            invalidate_boq_pdf(self.boq.pk)
+            self.assertEqual(pdf.read(), b'%PDF-1 cached')
+        # Gone before it was opened: rendered again instead of failing
+        with get_boq_pdf(self.boq) as pdf:
+            self.assertEqual(pdf.read(), b'%PDF-1 rendered')
+
+    def test_zip_export(self):
+        other = BOQ.objects.create(lead_source=self.lead, created_by=self.user)
+        store_boq_pdf(self.boq, b'%PDF-1 first')
+        store_boq_pdf(other, b'%PDF-1 second')
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(stream_boq_zip(export_queryset(), processes=1))))
+        self.assertEqual(archive.namelist(), [
+            f'BOQ_{self.boq.invoice_number}.pdf', f'BOQ_{other.invoice_number}.pdf', 'export_summary.txt',
+        ])
+        self.assertEqual(archive.read(f'BOQ_{other.invoice_number}.pdf'), b'%PDF-1 second')
+        self.assertIn(b'Exported 2 PDFs (0 failed)', archive.read('export_summary.txt'))
+        self.render.assert_not_called()
+
+    def test_export_rejects_bad_filters(self):
+        self.client.force_login(self.user)
+        for params, error in [
+            ({'project': 'abc'}, 'Project must be a valid project ID!'),
+            ({'from': '18-10-2026'}, 'Dates must be in YYYY-MM-DD format!'),
+        ]:
+            with self.subTest(**params), mock.patch('lms.views.PDF_AVAILABLE', True):
+                response = self.client.get(reverse('export_boq_pdfs'), params)
+                self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+                self.assertEqual(str(list(get_messages(response.wsgi_request))[-1]), error)
+
+
+class InventoryImportTests(TestCase):
+    def setUp(self):
+        self.cable = InventoryItem.objects.create(
+            item_name='HDMI Cable', unit_selling_price=10, available_quantity=5, quantity_to_be_ordered=1
+        )
+
+    def run_import(self, *rows, **kwargs):
+        return import_inventory_rows(enumerate(rows, start=2), **kwargs)
+
+    def test_existing_items_matched_case_insensitively(self):
+        report = self.run_import(('hdmi cable', 12, 3, 2), ('Speaker', 50, 4, 0))
+
+        self.assertEqual((report.added, report.updated, report.errors), (1, 1, []))
+        self.cable.refresh_from_db()
+        # Quantities are added to, the price is replaced
+        self.assertEqual(
+            (self.cable.unit_selling_price, self.cable.available_quantity, self.cable.quantity_to_be_ordered),
+            (Decimal('12'), 8, 3),
+        )
+        self.assertEqual(InventoryItem.objects.filter(item_name__iexact='hdmi cable').count(), 1)
+
+    def test_error_rows_are_reported_and_skipped(self):
+        report = self.run_import(('Speaker', 50, 1), ('', 5, 1), ('Mic', 'abc', 1), ('Mount', 0, 1), ('Amp', 20, 'x'))
+
+        self.assertEqual(report.added, 1)
+        self.assertEqual([error['row'] for error in report.errors], [4, 5, 6])
+        self.assertIn('Invalid unit price', report.errors[0]['error'])
+        self.assertIn('greater than 0', report.errors[1]['error'])
+
+    def test_chunk_boundaries(self):
+        progress = []
+        report = self.run_import(
+            # Repeats of an item not created yet are merged into it, not buffered again
+            ('Speaker', 50, 1), ('speaker', 55, 2), ('SPEAKER', 60, 3),
+            ('HDMI Cable', 11, 1),  # fills the first chunk
+            ('Hdmi Cable', 12, 1),
+            chunk_size=2, on_progress=progress.append,
+        )
+
+        self.assertEqual((report.added, report.updated), (1, 4))
+        self.assertEqual(progress, [4, 5])
+        speaker = InventoryItem.objects.get(item_name__iexact='speaker')
+        self.assertEqual((speaker.unit_selling_price, speaker.available_quantity), (Decimal('60'), 6))
+        self.cable.refresh_from_db()
+        self.assertEqual((self.cable.unit_selling_price, self.cable.available_quantity), (Decimal('12'), 7))
+
+    def test_stock_taken_during_the_import_is_kept(self):
+        def boq_reserves_stock(processed):
+            InventoryItem.objects.filter(pk=self.cable.pk).update(available_quantity=F('available_quantity') - 4)
+
+        self.run_import(('HDMI Cable', 10, 1), ('Speaker', 50, 1), ('HDMI Cable', 10, 1),
+                        chunk_size=1, on_progress=boq_reserves_stock)
+        self.cable.refresh_from_db()
+        self.assertEqual(self.cable.available_quantity, 5 + 2 - 4 * 4)
+
+
+class InventoryImportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('importer')
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def create_job(self, *rows, content=None):
+        if content is None:
+            import openpyxl
+            workbook = openpyxl.Workbook()
+            workbook.active.append(['Item Name', 'Unit Selling Price', 'Available Quantity', 'Quantity to be Ordered'])
+            for row in rows:
+                workbook.active.append(row)
+            buffer = io.BytesIO()
+            workbook.save(buffer)
+            content = buffer.getvalue()
+        return InventoryImportJob.objects.create(
+            user=self.user, file=SimpleUploadedFile('stock.xlsx', content), file_name='stock.xlsx'
+        )
+
+    def test_job_lifecycle(self):
+        job = self.create_job(['Speaker', 50, 4, 0], ['Mic', 'abc', 1, 0], ['speaker', 55, 1, 0])
+        file_path = job.file.path
+
+        run_import_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.added, job.updated, job.error_count, job.processed_rows), (1, 1, 1, 3))
+        self.assertEqual(job.errors, [{'row': 3, 'error': 'Invalid unit price: abc'}])
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(Path(file_path).exists())
+        self.assertEqual(InventoryItem.objects.get(item_name='Speaker').available_quantity, 5)
+        self.assertTrue(Notification.objects.filter(user=self.user, message__startswith='Excel upload completed').exists())
+
+        self.assertIsNone(run_import_job(job.pk))  # only queued jobs run
+
+    def test_unreadable_file_fails_the_job(self):
+        job = self.create_job(content=b'not a workbook')
+        run_import_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Error reading Excel file', job.message)
+
+    def test_imports_are_serialized(self):
+        with DatabaseLock(IMPORT_LOCK):
+            with self.assertRaises(LockUnavailable):
+                import_inventory_rows([(2, ('Speaker', 50, 1))], lock_timeout=0)
+        self.assertFalse(InventoryItem.objects.exists())
+
+        # A lock left behind by a crashed import expires
+        NamedLock.objects.create(name=IMPORT_LOCK, owner='crashed', expires_at=timezone.now())
+        report = import_inventory_rows([(2, ('Speaker', 50, 1))], lock_timeout=0)
+        self.assertEqual(report.added, 1)
+        self.assertFalse(NamedLock.objects.exists())
+
+
+class ListFilterTests(TestCase):
+    """Searches and filters of the keyset-paginated lists run on the server, on every page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('lister', password='pw')
+        for n in range(6):
+            LeadSource.objects.create(first_name=f'Lead{n}', last_name='Patel', phone_number=f'90000000{n:02d}')
+        LeadSource.objects.create(first_name='Zubin', last_name='Mehta', phone_number='9111111111')
+        for n, available in enumerate([0, 0, 5, 50, 0, 7]):
+            InventoryItem.objects.create(item_name=f'Panel {n}', unit_selling_price=100, available_quantity=available)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def pages(self, url, **params):
+        """Every row id of a list, following next_cursor the way keyset_loader.html does"""
+        html = self.client.get(url, params)
+        loader_params = dict(parse_qsl(html.context['list_params']))
+        ids, cursor = [], None
+        while True:
+            data = self.client.get(url, {**loader_params, 'format': 'json', 'page_size': 2, **({'cursor': cursor} if cursor else {})}).json()
+            ids += [row['id'] for row in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return ids
+
+    def test_lead_search_finds_leads_beyond_the_first_page(self):
+        zubin = LeadSource.objects.get(first_name='Zubin')
+        LeadSource.objects.filter(pk=zubin.pk).update(snapshot_d=timezone.now() - timedelta(days=30))
+
+        self.assertEqual(self.pages(reverse('lead_sources'), search='zub'), [zubin.pk])
+        self.assertEqual(len(self.pages(reverse('lead_sources'), search='patel')), 6)
+        self.assertEqual(len(self.pages(reverse('lead_sources'))), 7)
+
+        response = self.client.get(reverse('lead_sources'), {'search': 'nobody'})
+        self.assertContains(response, 'No lead sources match')
+
+    def test_inventory_stock_filter(self):
+        names = lambda ids: sorted(InventoryItem.objects.filter(pk__in=ids).values_list('item_name', flat=True))
+        self.assertEqual(names(self.pages(reverse('inventory'), stock='out')), ['Panel 0', 'Panel 1', 'Panel 4'])
+        self.assertEqual(names(self.pages(reverse('inventory'), stock='low')), ['Panel 2', 'Panel 5'])
+        self.assertEqual(names(self.pages(reverse('inventory'), stock='in')), ['Panel 3'])
+        self.assertEqual(names(self.pages(reverse('inventory'), stock='out', search='panel 4')), ['Panel 4'])
+        self.assertEqual(len(self.pages(reverse('inventory'), stock='bogus')), 6)
+
+
+class LeadSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ravindra = LeadSource.objects.create(first_name='Ravindra', last_name='Kumar', phone_number='9876543210')
+        cls.ravi = LeadSource.objects.create(first_name='Ravi', last_name='Shah', phone_number='9123456789')
+        cls.anita = LeadSource.objects.create(first_name='Anita', last_name='Sharma', phone_number='9000012345')
+
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            self.assertTrue(_fts_enabled(), 'the FTS5 index should be searched on SQLite')
+
+    def search(self, query):
+        return search_lead_ids(query)
+
+    def test_parse_query(self):
+        self.assertEqual(parse_query('+91 98765-43210'), ([], ['919876543210']))
+        self.assertEqual(parse_query("ravi o'neil 3210"), (['ravi', 'o neil'], ['3210']))
+
+    def test_name_prefix(self):
+        # Exact word matches first, then prefix matches, newest first within each
+        self.assertEqual(self.search('ravi'), [self.ravi.pk, self.ravindra.pk])
+        self.assertEqual(self.search('sha'), [self.anita.pk, self.ravi.pk])
+        self.assertEqual(self.search('ravi sha'), [self.ravi.pk])
+        self.assertEqual(self.search('kum rav'), [self.ravindra.pk])
+
+    def test_phone_suffix(self):
+        self.assertEqual(self.search('3210'), [self.ravindra.pk])
+        self.assertEqual(self.search('9876543210'), [self.ravindra.pk])
+        self.assertEqual(self.search('45'), [self.anita.pk])
+        self.assertEqual(self.search('ravi 789'), [self.ravi.pk])
+        self.assertEqual(self.search('9876'), [])  # a prefix of the number is not a suffix
+
+    def test_index_follows_saves_and_deletes(self):
+        self.ravi.first_name = 'Rohan'
+        self.ravi.phone_number = '9555500000'
+        self.ravi.save()
+        self.assertEqual(self.search('ravi'), [self.ravindra.pk])
+        self.assertEqual(self.search('rohan 0000'), [self.ravi.pk])
+        self.assertEqual(self.search('6789'), [])
+
+        self.ravindra.delete()
+        self.assertEqual(self.search('kumar'), [])
+
+    def test_orm_fallback(self):
+        self.assertEqual(set(_search_orm(['ravi'], [], 10)), {self.ravi.pk, self.ravindra.pk})
+        self.assertEqual(_search_orm(['an'], ['345'], 10), [self.anita.pk])
+
+    def test_filter_leads(self):
+        leads = LeadSource.objects.order_by('pk')
+        self.assertEqual(list(filter_leads(leads, 'ravi')), [self.ravindra, self.ravi])
+        self.assertEqual(list(filter_leads(leads, 'sha 45')), [self.anita])
+        self.assertEqual(filter_leads(leads, ' !? ').count(), 3)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'pg_trgm ranking needs PostgreSQL')
+    def test_trigram_ranking(self):
+        self.assertEqual(_search_orm(['ravi'], [], 10), [self.ravi.pk, self.ravindra.pk])
+
+
+class InventoryIndexTests(TestCase):
+    def setUp(self):
+        inventory_index._index = None  # the process-local index outlives each test's rollback
+        self.addCleanup(setattr, inventory_index, '_index', None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cable = InventoryItem.objects.create(item_name='HDMI Cable', unit_selling_price=10, available_quantity=5)
+            self.speaker = InventoryItem.objects.create(item_name='Speaker', unit_selling_price=50)
+
+    def test_local_changes(self):
+        self.assertEqual([entry.id for entry in inventory_index.search_inventory('hdmi')], [self.cable.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cable.item_name = 'DisplayPort Cable'
+            self.cable.save()
+        self.assertEqual(inventory_index.search_inventory('hdmi'), [])
+        self.assertEqual(inventory_index.get_inventory_entry(self.cable.pk).name, 'DisplayPort Cable')
+
+    def test_change_made_by_another_worker(self):
+        self.assertEqual(inventory_index.get_inventory_entry(self.cable.pk).price, Decimal('10'))
+
+        # Another worker: writes the row and publishes the change, bypassing this process' index
+        InventoryItem.objects.filter(pk=self.cable.pk).update(unit_selling_price=12, available_quantity=1)
+        InventoryIndexChange.objects.create(item_ids=[self.cable.pk])
+
+        with record_queries() as recorder:
+            entry = inventory_index.get_inventory_entry(self.cable.pk)
+        self.assertEqual((entry.price, entry.available_quantity), (Decimal('12'), 1))
+        self.assertEqual(recorder.count, 3)  # version, change log, the changed item
+
+    def test_missing_versions_reload_everything(self):
+        inventory_index.get_index()
+        InventoryItem.objects.filter(pk=self.speaker.pk).update(unit_selling_price=55)
+        # The version before this one is missing, e.g. still being committed by another worker
+        version = InventoryIndexChange.objects.order_by('-id').values_list('id', flat=True).first() + 2
+        InventoryIndexChange.objects.create(pk=version, item_ids=[])
+        self.assertEqual(inventory_index.get_inventory_entry(self.speaker.pk).price, Decimal('55'))
+
+
+class GroupPermissionTests(TestCase):
+    def test_revoked_group_takes_effect_on_next_request(self):
+        admin_group = Group.objects.create(name='admin')
+        user = User.objects.create_user('revoked')
+        user.groups.add(admin_group)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('access_control')).status_code, 200)
+
+        # From the group side, as another worker or the admin site would
+        admin_group.user_set.remove(user)
+        self.assertEqual(self.client.get(reverse('access_control')).status_code, 302)
+
+
+class UnreadCountTests(TestCase):
+    """Unread counts come from the database, and every change pushes the new count"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='pw')
+        self.client.force_login(self.user)
+        self.pushed = []
+        self.enterContext(mock.patch('lms.notifications._send', self.pushed.extend))
+
+    def pushed_counts(self):
+        return [event['count'] for _, event in self.pushed if event['type'] == 'unread_count']
+
+    def test_notify_increments(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.user], 'first')
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.user.pk], 'second')
+        self.assertEqual(unread_count(self.user), 2)
+        self.assertEqual(self.pushed_counts(), [1, 2])
+
+    def test_marking_one_read_decrements(self):
+        first, = notify([self.user], 'first')
+        notify([self.user], 'second')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mark_notification_read', args=[first.pk]))
+        self.assertEqual(unread_count(self.user.pk), 1)
+        self.assertEqual(self.pushed_counts(), [1])
+
+    def test_mark_all_read_resets(self):
+        notify([self.user], 'first')
+        notify([self.user], 'second')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mark_notifications_read'))
+        self.assertEqual(unread_count(self.user), 0)
+        self.assertEqual(self.pushed_counts(), [0])
+        self.assertEqual(self.client.get(reverse('unread_notification_count')).json()['count'], 0)
+
+
+@override_settings(NOTIFICATION_READ_TTL_DAYS=30, NOTIFICATION_UNREAD_TTL_DAYS=180)
+class NotificationRetentionTests(TestCase):
+    """Expired notifications are removed in batches, by one process at a time"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('keeper')
+        self.now = timezone.now()
+
+    def notification(self, days_old, is_read, message='hello'):
+        notification = Notification.objects.create(user=self.user, message=message, is_read=is_read)
+        Notification.objects.filter(pk=notification.pk).update(created_at=self.now - timedelta(days=days_old))
+        return notification.pk
+
+    def test_cutoff_per_read_state(self):
+        kept = {self.notification(29, True), self.notification(179, False)}
+        self.notification(31, True)
+        self.notification(181, False)
+
+        report = notification_retention.run_retention(now=self.now)
+
+        self.assertEqual(report.expired, 2)
+        self.assertEqual(set(Notification.objects.values_list('pk', flat=True)), kept)
+
+    @override_settings(NOTIFICATION_UNREAD_TTL_DAYS=None)
+    def test_ttl_of_none_keeps_forever(self):
+        kept = self.notification(1000, False)
+        self.notification(1000, True)
+        notification_retention.run_retention(now=self.now)
+        self.assertEqual(list(Notification.objects.values_list('pk', flat=True)), [kept])
+
+    def test_batches(self):
+        for index in range(5):
+            self.notification(40, True, f'old {index}')
+        fresh = self.notification(1, True)
+
+        with mock.patch.object(notification_retention, '_remove', wraps=notification_retention._remove) as remove:
+            report = notification_retention.run_retention(batch_size=2, archive=True, now=self.now)
+
+        self.assertEqual([len(call.args[0]) for call in remove.call_args_list], [2, 2, 1])
+        self.assertEqual((report.expired, report.archived), (5, 5))
+        self.assertEqual(list(Notification.objects.values_list('pk', flat=True)), [fresh])
+        self.assertEqual(NotificationArchive.objects.filter(reason='expired').count(), 5)
+        self.assertFalse(NamedLock.objects.filter(name=notification_retention.RETENTION_LOCK).exists())
+
+    def test_overlapping_run_is_skipped(self):
+        self.notification(40, True)
+        with DatabaseLock(notification_retention.RETENTION_LOCK):
+            with self.assertRaises(LockUnavailable):
+                notification_retention.run_retention(now=self.now)
+            out = io.StringIO()
+            call_command('prune_notifications', stdout=out)
+        self.assertIn('skipping', out.getvalue())
+        self.assertEqual(Notification.objects.count(), 1)
+
+
+class ChannelLayerTests(SimpleTestCase):
+    """Pushes reach a channel of the user's group, across workers when Redis is configured"""
+
+    def round_trip(self, sender, receiver):
+        async def run():
+            channel = await receiver.new_channel()
+            await receiver.group_add('user_test', channel)
+            try:
+                await sender.group_send('user_test', {'type': 'send_notification', 'message': 'hello'})
+                return await receiver.receive(channel)
+            finally:
+                await receiver.group_discard('user_test', channel)
+        return async_to_sync(run)()
+
+    def test_default_layer(self):
+        layer = get_channel_layer()
+        self.assertEqual(self.round_trip(layer, layer)['message'], 'hello')
+
+    def redis_workers(self):
+        # Two independent layer instances stand in for two daphne processes
+        with override_settings(CHANNEL_LAYERS={'default': settings.REDIS_CHANNEL_LAYER}):
+            return [channel_layers.make_backend('default') for _ in range(2)]
+
+    def test_redis_layer_between_workers(self):
+        from fakeredis import FakeServer
+        from fakeredis.aioredis import FakeConnection
+        from redis.asyncio import ConnectionPool
+
+        # Both workers' connections reach the same in-process Redis
+        server = FakeServer()
+        with mock.patch(
+            'channels_redis.core.RedisChannelLayer.create_pool',
+            lambda layer, index: ConnectionPool(connection_class=FakeConnection, server=server),
+        ):
+            worker_a, worker_b = self.redis_workers()
+            self.assertEqual(type(worker_a).__module__, 'channels_redis.core')
+            self.assertEqual(self.round_trip(worker_a, worker_b)['message'], 'hello')
+
+    @unittest.skipUnless(settings.CHANNEL_REDIS_URL, 'CHANNEL_REDIS_URL is not set')
+    def test_real_redis_between_workers(self):
+        worker_a, worker_b = self.redis_workers()
+        self.assertEqual(self.round_trip(worker_a, worker_b)['message'], 'hello')
+
+
+@override_settings(NOTIFICATION_BATCH_WINDOW_MS=20, NOTIFICATION_BATCH_MAX_UNACKED=2, NOTIFICATION_BATCH_MAX_PENDING=2)
+class NotificationBatchTests(SimpleTestCase):
+    """Batched sockets get one frame per window, and nothing more while frames are unacknowledged"""
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/ws/notifications/?batch=1')
+        communicator.scope['user'] = mock.Mock(is_anonymous=False, id=4242)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def notify(self, *messages):
+        for message in messages:
+            await get_channel_layer().group_send('user_4242', {'type': 'send_notification', 'message': message})
+
+    async def test_events_of_a_window_share_a_frame(self):
+        communicator = await self.connect()
+        try:
+            await self.notify('a', 'b')
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['seq'], 1)
+            self.assertEqual([event['message'] for event in frame['events']], ['a', 'b'])
+            self.assertEqual(frame['unread_delta'], 2)
+        finally:
+            await communicator.disconnect()
+
+    async def test_unacknowledged_frames_hold_back_sending(self):
+        communicator = await self.connect()
+        try:
+            for seq, message in enumerate(['a', 'b'], start=1):
+                await self.notify(message)
+                self.assertEqual((await communicator.receive_json_from())['seq'], seq)
+
+            # Two frames unacknowledged: later events wait, and only the newest two are kept
+            await self.notify('c', 'd', 'e')
+            self.assertTrue(await communicator.receive_nothing(0.1))
+
+            await communicator.send_json_to({'ack': 1})
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['seq'], 3)
+            self.assertEqual([event['message'] for event in frame['events']], ['d', 'e'])
+            self.assertEqual(frame['dropped'], 1)
+            self.assertEqual(frame['unread_delta'], 3)
+        finally:
+            await communicator.disconnect()
+
+
+class SeedScaleTests(TestCase):
+    """seed_scale writes the requested rows, deterministically, and refuses to race other writers"""
+
+    SIZES = dict(leads=40, inventory=20, users=5, events=7, notifications=30)
+
+    def seed(self, **kwargs):
+        """Seed inside a rolled-back transaction; returns the report counts and the rows written"""
+        with transaction.atomic():
+            report = seed_scale(**self.SIZES, **kwargs)
+            rows = {
+                model.__name__: list(model.objects.order_by('pk').values_list())
+                for model in (LeadSource, Project, BOQ, BOQItem, Task, Event, Notification)
+            }
+            transaction.set_rollback(True)
+        return report.counts, rows
+
+    def test_counts(self):
+        counts, rows = self.seed()
+        self.assertEqual(counts['User'], 5)
+        self.assertEqual(counts['InventoryItem'], 20)
+        self.assertEqual(counts['LeadSource'], 40)
+        self.assertEqual(counts['Event'], 7)
+        self.assertEqual(counts['Notification'], 30)
+        for name, written in rows.items():
+            self.assertEqual(len(written), counts.get(name, 0), name)
+
+    def test_same_seed_same_data(self):
+        first = self.seed(seed=7)
+        self.assertEqual(self.seed(seed=7), first)
+        self.assertNotEqual(self.seed(seed=8)[1]['LeadSource'], first[1]['LeadSource'])
+
+    def test_concurrent_insert_aborts(self):
+        user = User.objects.create_user('intruder')
+
+        def intrude(report):
+            LeadSource.objects.create(phone_number='9000000001', first_name='Other', user=user)
+
+        with mock.patch('lms.scale_seed.SEED_CHUNK_SIZE', 10), self.assertRaises(SeedConflict):
+            seed_scale(**self.SIZES, on_progress=intrude)
+        # The first chunk was committed before the intruder wrote; the second was rolled back
+        self.assertEqual(LeadSource.objects.exclude(first_name='Other').count(), 10)
+
+
+class BenchmarkBaselineTests(TestCase):
+    """The benchmarked views use no more queries, and render no more bytes, than lms/benchmark_baseline.json"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_benchmark_data()
+
+    def test_no_regressions(self):
+        # Wall times are compared by `manage.py benchmark_views`, not on shared test machines
+        regressions = compare(run_benchmarks(iterations=1), load_baseline(), time_threshold=None)
+        self.assertEqual(regressions, [], '\n'.join(regressions))
+
+
+class QueryBudgetTests(TestCase):
+    """Per-view query budgets; they do not depend on the number of rows shown"""
+
+    BUDGETS = {
+        'dashboard': 10,
+        'leads_list': 4,
+        'lead_sources': 4,
+        'ongoing_projects': 4,
+        'tasks': 15,
+        'inventory': 5,
+        'notifications': 4,
+        'access_control': 5,
+        'lead_detail': 6,
+        'view_boq': 7,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_scale(leads=300, inventory=100, users=30, events=50, notifications=500)
+        cls.user = User.objects.get(username='seeduser0')
+        cls.user.is_superuser = True
+        cls.user.save()
+        cls.boq = BOQ.objects.select_related('project').order_by('id').first()
+
+    def url(self, name):
+        if name == 'lead_detail':
+            return reverse(name, args=[self.boq.project_id])
+        if name == 'view_boq':
+            return reverse(name, args=[self.boq.pk])
+        return reverse(name)
+
+    def test_views_within_budget(self):
+        self.client.force_login(self.user)
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(name):
+                self.client.get(self.url(name))  # fill the per-user caches first
+                with query_budget(budget, name):
+                    response = self.client.get(self.url(name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_repeated_queries_are_reported(self):
+        with record_queries() as recorder:
+            names = [project.lead_source.first_name for project in Project.objects.order_by('id')[:6]]
+        self.assertEqual(len(names), 6)
+        [pattern] = recorder.patterns()
+        self.assertEqual(pattern.count, 6)
+        self.assertIn('lms_leadsource', pattern.shape)
+        self.assertTrue(pattern.origins.most_common(1)[0][0].startswith('lms/tests.py'))
+
+    @override_settings(SERVER_TIMING=True, QUERY_INSPECTOR=True, QUERY_INSPECTOR_THRESHOLD=1)
+    def test_origin_skips_the_server_timing_wrapper(self):
+        self.client.force_login(self.user)
+        with mock.patch('lms.query_inspector.logger') as logger:
+            self.client.post(reverse('mark_notifications_read'))
+        lines = logger.warning.call_args.args[-1].split('\n')
+        update = next(i for i, line in enumerate(lines) if 'UPDATE "lms_notification"' in line)
+        # Each pattern's line is followed by the line listing its origins
+        self.assertRegex(lines[update + 1], r'from lms/views\.py:\d+ in mark_notifications_read \(x1\)')
+
+
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('timed', is_superuser=True)
+
+    def setUp(self):
+        histogram.reset()
+        self.client.force_login(self.user)
+
+    def test_header_and_histogram(self):
+        response = self.client.get(reverse('dashboard'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'queries;desc=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+        metrics = self.client.get(reverse('performance_metrics')).json()
+        dashboard = metrics['endpoints']['GET dashboard']
+        self.assertEqual(dashboard['count'], 1)
+        self.assertGreater(dashboard['mean_queries'], 0)
+        self.assertEqual(sum(dashboard['buckets'].values()), 1)
+
+    def test_slow_requests_are_profiled(self):
+        with tempfile.TemporaryDirectory() as profile_dir, override_settings(
+            SLOW_REQUEST_PROFILE_MS=0, SLOW_REQUEST_PROFILE_SAMPLE_RATE=1.0,
+            SLOW_REQUEST_PROFILE_DIR=profile_dir, SLOW_REQUEST_PROFILE_MAX_FILES=2,
+        ):
+            for _ in range(3):
+                self.client.get(reverse('dashboard'))
+            profiles = sorted(Path(profile_dir).glob('*.prof'))
+            self.assertEqual(len(profiles), 2)
+            pstats.Stats(str(profiles[-1]))
+            meta = json.loads(profiles[-1].with_suffix('.json').read_text())
+        self.assertEqual(meta['url'], reverse('dashboard'))
+        self.assertEqual(meta['user'], self.user.pk)
+        self.assertGreater(meta['queries'], 0)
+
+    def test_metrics_are_admin_only(self):
+        self.client.force_login(User.objects.create_user('basic'))
+        self.assertEqual(self.client.get(reverse('performance_metrics')).status_code, 302)
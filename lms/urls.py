@@ -18,6 +18,7 @@ urlpatterns = [
     path('projects/<project_id>/create-boq/', views.create_boq, name='create_boq'),
     path('boq/<int:boq_id>/view/', views.view_boq, name='view_boq'),
     path('boq/<int:boq_id>/download/', views.download_boq_pdf, name='download_boq_pdf'),
+    path('boq/export/', views.export_boq_pdfs, name='export_boq_pdfs'),
     path('boq/<int:boq_id>/update/', views.update_boq, name='update_boq'),
     path('boq/<int:boq_id>/delete/', views.delete_boq, name='delete_boq'),
     path('boq/<int:boq_id>/change-status/', views.change_boq_status, name='change_boq_status'),
@@ -72,10 +73,12 @@ urlpatterns = [
     # API endpoints
     path('api/inventory/<int:item_id>/', views.get_inventory_item, name='get_inventory_item'),
     path('api/inventory/<int:item_id>/requirements/', views.get_inventory_requirements, name='get_inventory_requirements'),
+    path('api/inventory/imports/<int:job_id>/', views.inventory_import_status, name='inventory_import_status'),
     path('api/inventory/search/', views.search_inventory, name='search_inventory'),
     path('api/leads/summary/', views.api_leads_summary, name='api_leads_summary'),
     path('api/projects/summary/', views.api_projects_summary, name='api_projects_summary'),
     path('api/notification/count/', views.unread_notification_count, name='unread_notification_count'),
+    path('api/metrics/performance/', views.performance_metrics, name='performance_metrics'),
 
     path('change-password/', auth_views.PasswordChangeView.as_view(
         template_name='change_password.html',
@@ -8,13 +8,12 @@ from .models import LeadSource, InventoryItem, Project, Task, Event, Invoice,Not
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from django.db import IntegrityError, transaction
 from django.db.models import Q, Count ,Sum
 from django.utils import timezone
 from datetime import datetime, timedelta
 from django.contrib.auth.models import User
 from django.utils import timezone
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from django.contrib.auth.models import Group
 from django.http import JsonResponse
 from .models import LeadSource
@@ -28,10 +27,31 @@ from django.contrib import messages
 from django.shortcuts import redirect
 from .models import InventoryItem
 from functools import wraps
-
-def has_group(user, group_name):
-    """Check if a user belongs to a specific group."""
-    return user.is_authenticated and user.groups.filter(name=group_name).exists()
+from .permissions import get_user_groups, has_group, invalidate_user_groups, is_admin
+from .boq import build_boq_items, parse_boq_lines, reconcile_boq_items
+from .import_jobs import job_payload, submit_import_job
+from .instrumentation import histogram
+from .notifications import group_members, notify, publish, unread_count
+from . import inventory_index, lead_search
+from .task_lists import BUCKET_ORDERINGS, TASK_BUCKETS, bucket_counts, bucket_tasks, project_choices, user_choices
+from .pagination import (
+    BY_ITEM_NAME,
+    NEWEST_CREATED,
+    RECENT_FIRST,
+    keyset_json_response,
+    keyset_paginate,
+    keyset_params,
+    paginate_request,
+    wants_json,
+)
+from .dashboard import (
+    build_dashboard_summary,
+    build_rollup_dashboard_summary,
+    rollup_cities,
+    rollup_status_counts,
+    rollup_statuses,
+)
+from .rollups import LEAD_TOTALS, STOCK_TOTALS, page_totals
 
 def require_permission(*group_names):
     """
@@ -46,13 +66,12 @@ def require_permission(*group_names):
                 return redirect('login')
             
             # Check if user is superuser or admin
-            if request.user.is_superuser or request.user.groups.filter(name='admin').exists():
+            if is_admin(request.user):
                 return view_func(request, *args, **kwargs)
             
             # Check for any of the required groups
-            for group_name in group_names:
-                if request.user.groups.filter(name=group_name).exists():
-                    return view_func(request, *args, **kwargs)
+            if get_user_groups(request.user).intersection(group_names):
+                return view_func(request, *args, **kwargs)
             
             # Permission denied - redirect to dashboard or referer with error message
             messages.error(request, 'You do not have permission to access this page.')
@@ -67,7 +86,7 @@ def require_permission(*group_names):
 @require_permission('admin')
 def access_control(request):
     """Admin page to view and assign groups to users."""
-    users = User.objects.exclude(is_superuser=True).select_related()
+    users = User.objects.exclude(is_superuser=True).prefetch_related('groups')
     groups = Group.objects.all().order_by('name')
     return render(request, 'lms/access_control.html', {'users': users, 'groups': groups})
 
@@ -89,6 +108,7 @@ def update_user_groups(request):
                 user.groups.add(group)
             elif action == 'remove':
                 user.groups.remove(group)
+            invalidate_user_groups(user)
 
             return JsonResponse({'success': True, 'message': 'Updated successfully.'})
         except (User.DoesNotExist, Group.DoesNotExist):
@@ -109,15 +129,18 @@ def add_inline_lead(request):
             return JsonResponse({'success': False, 'message': 'First name and phone number are required!'})
 
         # Create lead
-        lead = LeadSource.objects.create(
-            first_name=first_name,
-            last_name=last_name,
-            country_code=country_code,
-            phone_number=phone_number,
-            address=address,
-            user=request.user 
-
-        )
+        try:
+            with transaction.atomic():
+                lead = LeadSource.objects.create(
+                    first_name=first_name,
+                    last_name=last_name,
+                    country_code=country_code,
+                    phone_number=phone_number,
+                    address=address,
+                    user=request.user
+                )
+        except IntegrityError:
+            return JsonResponse({'success': False, 'message': 'A lead with this phone number already exists!'})
 
         return JsonResponse({
             'success': True,
@@ -135,7 +158,7 @@ def update_project_status(request, project_id):
         new_status = request.POST.get('status')
         
         # Access control
-        if not (request.user.is_superuser or request.user.groups.filter(name="admin").exists()):
+        if not is_admin(request.user):
             if project.user != request.user:
                 return JsonResponse({
                     'success': False,
@@ -174,15 +197,12 @@ def search_leads(request):
     if len(query) < 2:
         return JsonResponse([], safe=False)
     
-    leads = LeadSource.objects.filter(
-        first_name__icontains=query
-    ) | LeadSource.objects.filter(
-        last_name__icontains=query
-    ) | LeadSource.objects.filter(
-        phone_number__icontains=query
-    )
+    try:
+        limit = int(request.GET.get('limit', lead_search.DEFAULT_LIMIT))
+    except ValueError:
+        limit = lead_search.DEFAULT_LIMIT
 
-    data = list(leads.values('id', 'first_name', 'last_name'))
+    data = lead_search.search_leads(query, limit)
     return JsonResponse(data, safe=False)
 
 
@@ -226,20 +246,15 @@ def logout_view(request):
 def leads_list(request):
     """Display list of all leads with search and filter capabilities"""
 
-    if request.user.is_superuser or request.user.groups.filter(name="admin").exists():
-        leads = LeadSource.objects.all().order_by('-snapshot_d')
-        projects = Project.objects.select_related('lead_source').all()
-    else:
-        leads = LeadSource.objects.all().order_by('-snapshot_d')
-        projects = Project.objects.select_related('lead_source').all()
+    projects = Project.objects.select_related('lead_source')
     
     # Search functionality
     search_query = request.GET.get('search', '')
     if search_query:
-        leads = leads.filter(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
+        projects = projects.filter(
+            Q(project_name__icontains=search_query) |
+            Q(lead_source__first_name__icontains=search_query) |
+            Q(lead_source__last_name__icontains=search_query) |
             Q(city__icontains=search_query)
         )
     
@@ -251,19 +266,38 @@ def leads_list(request):
     # Filter by status
     status_filter = request.GET.get('status', '')
     if status_filter:
-        leads = leads.filter(status=status_filter)
+        projects = projects.filter(status=status_filter)
+    
+    # Most recently updated first, one keyset page at a time
+    page = paginate_request(request, projects, RECENT_FIRST)
+    if wants_json(request):
+        return keyset_json_response(request, page, _project_json, 'lms/leads_list_rows.html')
     
     context = {
-        'leads': leads,
+        'page': page,
+        'cities': rollup_cities(),
         'search_query': search_query,
         'city_filter': city_filter,
         'status_filter': status_filter,
-        'projects': projects
     }
     
     return render(request, 'lms/leads_list.html', context)
 
 
+def _project_json(project):
+    lead = project.lead_source
+    return {
+        'id': project.id,
+        'project_name': project.project_name,
+        'lead_source': {'id': lead.id, 'first_name': lead.first_name, 'last_name': lead.last_name} if lead else None,
+        'city': project.city,
+        'amount': float(project.amount) if project.amount is not None else None,
+        'expected_closure': project.expected_closure.isoformat() if project.expected_closure else None,
+        'status': project.status,
+        'snapshot_d': project.snapshot_d.isoformat(),
+    }
+
+
 @login_required
 @require_POST
 def add_lead(request):
@@ -275,7 +309,6 @@ def add_lead(request):
         last_name = request.POST.get('last_name', '').strip()
         address = request.POST.get('address', '').strip()
         remarks = request.POST.get('remarks', '').strip()
-        status = request.POST.get('status', 'open')
         
         # Validation
         if not phone_number or not first_name:
@@ -286,23 +319,22 @@ def add_lead(request):
             messages.error(request, 'Phone number must be exactly 10 digits!')
             return redirect('leads_list')
         
-        # Check for duplicate phone number
-        if LeadSource.objects.filter(country_code=country_code, phone_number=phone_number).exists():
+        # Create new lead; the unique_lead_phone constraint rejects duplicates
+        try:
+            with transaction.atomic():
+                LeadSource.objects.create(
+                    country_code=country_code,
+                    phone_number=phone_number,
+                    first_name=first_name,
+                    last_name=last_name,
+                    address=address,
+                    remarks=remarks,
+                    user=request.user
+                )
+        except IntegrityError:
             messages.error(request, 'A lead with this phone number already exists!')
             return redirect('leads_list')
         
-        # Create new lead
-        lead = LeadSource.objects.create(
-            country_code=country_code,
-            phone_number=phone_number,
-            first_name=first_name,
-            last_name=last_name,
-            address=address,
-            remarks=remarks,
-            status=status,
-            user=request.user
-        )
-        
         messages.success(request, f'Lead "{first_name} {last_name}" added successfully!')
         return redirect('leads_list')
         
@@ -432,21 +464,22 @@ def lead_sources(request):
                     messages.error(request, 'Phone number must be exactly 10 digits!')
                     return redirect('lead_sources')
                 
-                # Check for duplicate
-                if LeadSource.objects.filter(country_code=country_code, phone_number=phone_number).exists():
+                # The unique_lead_phone constraint rejects duplicates
+                try:
+                    with transaction.atomic():
+                        LeadSource.objects.create(
+                            first_name=first_name,
+                            last_name=last_name,
+                            country_code=country_code,
+                            phone_number=phone_number,
+                            address=address,
+                            remarks=remarks,
+                            user=request.user
+                        )
+                except IntegrityError:
                     messages.error(request, 'A lead source with this phone number already exists!')
                     return redirect('lead_sources')
                 
-                LeadSource.objects.create(
-                    first_name=first_name,
-                    last_name=last_name,
-                    country_code=country_code,
-                    phone_number=phone_number,
-                    address=address,
-                    remarks=remarks,
-                    user=request.user
-                )
-                
                 messages.success(request, f'Lead source "{first_name} {last_name}" added successfully!')
                 return redirect('lead_sources')
                 
@@ -476,21 +509,18 @@ def lead_sources(request):
                     messages.error(request, 'Phone number must be exactly 10 digits!')
                     return redirect('lead_sources')
                 
-                # Check for duplicate (excluding current source)
-                if LeadSource.objects.filter(
-                    country_code=country_code, 
-                    phone_number=phone_number
-                ).exclude(id=source_id).exists():
-                    messages.error(request, 'Another lead source with this phone number already exists!')
-                    return redirect('lead_sources')
-                
                 source.first_name = first_name
                 source.last_name = last_name
                 source.country_code = country_code
                 source.phone_number = phone_number
                 source.address = address
                 source.remarks = remarks
-                source.save()
+                try:
+                    with transaction.atomic():
+                        source.save()
+                except IntegrityError:
+                    messages.error(request, 'Another lead source with this phone number already exists!')
+                    return redirect('lead_sources')
                 
                 messages.success(request, f'Lead source "{first_name} {last_name}" updated successfully!')
                 return redirect('lead_sources')
@@ -520,35 +550,51 @@ def lead_sources(request):
                 messages.error(request, f'Error deleting lead source: {str(e)}')
                 return redirect('lead_sources')
     
-    # GET request - display all lead sources
-    lead_sources_list = LeadSource.objects.all().order_by('-snapshot_d')
-    with_projects_count = LeadSource.objects.filter(has_project=True).count()
-    without_projects_count = LeadSource.objects.filter(has_project=False).count()
+    # GET request - display lead sources, newest first, one keyset page at a time
+    search_query = request.GET.get('search', '').strip()
+    sources = lead_search.filter_leads(LeadSource.objects.all(), search_query)
+    page = paginate_request(request, sources, RECENT_FIRST)
+    if wants_json(request):
+        return keyset_json_response(
+            request, page, _lead_source_json, 'lms/lead_sources_rows.html', {'search_query': search_query}
+        )
+    
+    # Header counts come from the rollup, not a COUNT over the whole table
+    totals = page_totals(LEAD_TOTALS)
     
     context = {
-        'lead_sources': lead_sources_list,
-        'with_projects_count': with_projects_count,
-        'without_projects_count': without_projects_count,
+        'page': page,
+        'search_query': search_query,
+        'list_params': keyset_params(search=search_query),
+        'total_count': totals['leads'],
+        'with_projects_count': totals['leads_with_projects'],
+        'without_projects_count': totals['leads'] - totals['leads_with_projects'],
     }
     
     return render(request, 'lms/lead_sources.html', context)
 
 
+def _lead_source_json(source):
+    return {
+        'id': source.id,
+        'first_name': source.first_name,
+        'last_name': source.last_name,
+        'country_code': source.country_code,
+        'phone_number': source.phone_number,
+        'address': source.address,
+        'remarks': source.remarks,
+        'has_project': source.has_project,
+        'snapshot_d': source.snapshot_d.isoformat(),
+    }
+
+
 # ============================================================================
 # DASHBOARD VIEW
 # ============================================================================
 from django.http import HttpResponse
-from django.template.loader import get_template
-from io import BytesIO
-from .models import BOQ, BOQItem, InventoryOrderRequirement
-
-# For PDF generation, install: pip install xhtml2pdf reportlab
-try:
-    from xhtml2pdf import pisa
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
-    print("Warning: xhtml2pdf not installed. PDF generation will not work.")
+from django.http import FileResponse, StreamingHttpResponse
+from .models import BOQ, BOQItem, InventoryImportJob, InventoryOrderRequirement
+from .pdf import PDF_AVAILABLE, PDFRenderError, export_queryset, get_boq_pdf, schedule_boq_pdf, stream_boq_zip
 
 
 @login_required
@@ -562,7 +608,7 @@ def lead_detail(request, project_id):
     lead = project.lead_source
 
     # Permission check
-    if not (request.user.is_superuser or request.user.groups.filter(name="admin").exists()):
+    if not is_admin(request.user):
         if lead.user != request.user:
             messages.error(request, 'You do not have permission to view this project.')
             return redirect('ongoing_projects')
@@ -591,7 +637,6 @@ def lead_detail(request, project_id):
 def create_boq(request, project_id):
     """Create BOQ from project screen"""
     from decimal import Decimal
-    from django.db.models import F
 
     project = get_object_or_404(Project, id=project_id)
     lead = project.lead_source  # required for invoice numbering
@@ -611,76 +656,28 @@ def create_boq(request, project_id):
         created_by=request.user
     )
 
-    # Get items arrays
-    sr_nos = request.POST.getlist('sr_no[]')
-    inventory_ids = request.POST.getlist('inventory_id[]')
-    quantities = request.POST.getlist('quantity[]')
-    discounts = request.POST.getlist('discount[]')
-
-    valid_items = [
-        i for i, inv_id in enumerate(inventory_ids)
-        if inv_id and inv_id.strip()
-    ]
+    lines, errors = parse_boq_lines(request.POST)
 
-    if not valid_items:
+    if not lines and not errors:
         boq.delete()
         messages.error(request, "Please add at least 1 item in the BOQ.")
         return redirect("project_boq_detail", project_id=project_id)
 
-    items_created = 0
-
-    for i in valid_items:
-        try:
-            inventory = get_object_or_404(InventoryItem, id=int(inventory_ids[i]))
-            quantity = int(quantities[i])
-            discount = Decimal(discounts[i]) if discounts[i] else Decimal('0')
-
-            boq_item = BOQItem.objects.create(
-                boq=boq,
-                sr_no=int(sr_nos[i]),
-                inventory_item=inventory,
-                quantity=quantity,
-                discount_percentage=discount
-            )
-
-            items_created += 1
-
-            # 🔥 Reduce inventory stock safely
-            inventory.available_quantity = F('available_quantity') - quantity
-            inventory.save()
-
-            # If stock not sufficient → create order requirement
-            if not boq_item.has_sufficient_stock:
-                shortage = boq_item.quantity - boq_item.available_quantity
-
-                InventoryOrderRequirement.objects.create(
-                    inventory_item=inventory,
-                    project=project,
-                    boq=boq,
-                    boq_item=boq_item,
-                    required_quantity=quantity,
-                    available_quantity=boq_item.available_quantity,
-                    shortage_quantity=shortage,
-                    status='pending'
-                )
+    # Price, insert and reserve stock for all lines at once (totals included)
+    result = build_boq_items(boq, lines)
+    for error in errors + result.errors:
+        messages.warning(request, error)
 
-        except Exception as e:
-            messages.warning(request, f"Error adding BOQ item {i+1}: {str(e)}")
-            continue
-
-    if items_created == 0:
+    if not result.items:
         boq.delete()
         messages.error(request, "No BOQ items could be saved!")
         return redirect("project_boq_detail", project_id=project_id)
 
-    # Calculate totals
-    boq.calculate_totals()
-    boq.refresh_from_db()
-
     # Update project amount with BOQ total
     project.amount = boq.grand_total
     project.save()
 
+    schedule_boq_pdf(boq.id)
     messages.success(request, f"BOQ {boq.invoice_number} created successfully!")
     return redirect("view_boq", boq_id=boq.id)
 
@@ -692,7 +689,7 @@ def edit_project(request, project_id):
         project = get_object_or_404(Project, id=project_id)
 
         # Access control: only the assigned user, admin, or superuser can edit
-        if not (request.user.is_superuser or request.user.groups.filter(name="admin").exists()):
+        if not is_admin(request.user):
             if project.user != request.user:
                 messages.error(request, 'You do not have permission to edit this project!')
                 referer = request.META.get('HTTP_REFERER')
@@ -748,7 +745,7 @@ def delete_project(request, project_id):
         project = get_object_or_404(Project, id=project_id)
 
         # Access control
-        if not (request.user.is_superuser or request.user.groups.filter(name="admin").exists()):
+        if not is_admin(request.user):
             if project.user != request.user:
                 messages.error(request, 'You do not have permission to delete this project!')
                 referer = request.META.get('HTTP_REFERER')
@@ -780,7 +777,7 @@ def update_boq(request, boq_id):
             return redirect('view_boq', boq_id=boq_id)
         
         # Check permissions
-        if not (request.user.is_superuser or request.user.groups.filter(name="admin").exists()):
+        if not is_admin(request.user):
             if boq.created_by != request.user:
                 messages.error(request, 'You do not have permission to edit this BOQ.')
                 return redirect('view_boq', boq_id=boq_id)
@@ -789,57 +786,13 @@ def update_boq(request, boq_id):
         boq.tax_rate = Decimal(request.POST.get('tax_rate', '18.00'))
         boq.overall_discount_percentage = Decimal(request.POST.get('overall_discount_percentage', '0'))
         boq.notes = request.POST.get('notes', '')
-        boq.save()
-        
-        # Delete existing items and order requirements
-        boq.items.all().delete()
-        InventoryOrderRequirement.objects.filter(boq=boq).delete()
-        
-        # Create new items
-        sr_nos = request.POST.getlist('sr_no[]')
-        inventory_ids = request.POST.getlist('inventory_id[]')
-        quantities = request.POST.getlist('quantity[]')
-        discounts = request.POST.getlist('discount[]')
         
-        valid_items = [i for i, inv_id in enumerate(inventory_ids) if inv_id and inv_id.strip()]
-        items_created = 0
-        
-        for i in valid_items:
-            try:
-                inventory_item = get_object_or_404(InventoryItem, id=int(inventory_ids[i]))
-                quantity = int(quantities[i])
-                discount = Decimal(discounts[i]) if discounts[i] else Decimal('0')
-                
-                boq_item = BOQItem.objects.create(
-                    boq=boq,
-                    sr_no=int(sr_nos[i]),
-                    inventory_item=inventory_item,
-                    quantity=quantity,
-                    discount_percentage=discount
-                )
-                items_created += 1
-                
-                # Create order requirement if insufficient stock
-                if not boq_item.has_sufficient_stock:
-                    shortage = quantity - boq_item.available_quantity
-                    
-                    if boq.project:
-                        InventoryOrderRequirement.objects.create(
-                            inventory_item=inventory_item,
-                            project=boq.project,
-                            boq=boq,
-                            boq_item=boq_item,
-                            required_quantity=quantity,
-                            available_quantity=boq_item.available_quantity,
-                            shortage_quantity=shortage,
-                            status='pending'
-                        )
-            except Exception as e:
-                messages.warning(request, f'Error adding item {i+1}: {str(e)}')
-                continue
-        
-        # Recalculate totals
-        boq.calculate_totals()
+        # Apply only the rows that changed; totals are recalculated and the BOQ saved once
+        lines, errors = parse_boq_lines(request.POST)
+        result = reconcile_boq_items(boq, lines)
+        items_created = len(result.items)
+        for error in errors + result.errors:
+            messages.warning(request, error)
         
         # Reload BOQ
         boq.refresh_from_db()
@@ -849,6 +802,7 @@ def update_boq(request, boq_id):
             boq.project.amount = boq.grand_total
             boq.project.save()
         
+        schedule_boq_pdf(boq.id)
         messages.success(request, f'BOQ {boq.invoice_number} updated successfully with {items_created} items!')
         return redirect('view_boq', boq_id=boq_id)
         
@@ -864,7 +818,7 @@ def view_boq(request, boq_id):
     boq = get_object_or_404(BOQ, id=boq_id)
     
     # Check permissions
-    if not (request.user.is_superuser or request.user.groups.filter(name="admin").exists()):
+    if not is_admin(request.user):
         if boq.lead_source.user != request.user:
             messages.error(request, 'You do not have permission to view this BOQ.')
             return redirect('leads_list')
@@ -886,58 +840,83 @@ def download_boq_pdf(request, boq_id):
         messages.error(request, 'PDF generation is not available. Please install xhtml2pdf.')
         return redirect('view_boq', boq_id=boq_id)
     
-    boq = get_object_or_404(BOQ, id=boq_id)
-    items = boq.items.all().order_by('sr_no')
+    boq = get_object_or_404(BOQ.objects.select_related('lead_source', 'created_by'), id=boq_id)
     
-    # Prepare context
-    context = {
-        'boq': boq,
-        'items': items,
-        'company_name': 'SecureTech AV',
-        'company_address': 'Your Company Address Here',
-        'company_phone': '+91-XXXXXXXXXX',
-        'company_email': 'info@securetechav.com',
-        'company_gst': 'GSTIN: XXXXXXXXXXXX',
-    }
-    
-    # Render template
-    template = get_template('lms/boq_pdf_template.html')
-    html = template.render(context)
+    # Served from the PDF cache; only rendered here if the background worker hasn't yet
+    try:
+        pdf_file = get_boq_pdf(boq)
+    except PDFRenderError:
+        messages.error(request, 'Error generating PDF')
+        return redirect('view_boq', boq_id=boq_id)
     
-    # Create PDF
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="BOQ_{boq.invoice_number}.pdf"'
+    return FileResponse(
+        pdf_file,
+        as_attachment=True,
+        filename=f'BOQ_{boq.invoice_number}.pdf',
+        content_type='application/pdf',
+    )
+
+
+@login_required
+@require_permission('boq_export')
+def export_boq_pdfs(request):
+    """Download the PDFs of all BOQs matching the filters as one streamed ZIP"""
+    if not PDF_AVAILABLE:
+        messages.error(request, 'PDF generation is not available. Please install xhtml2pdf.')
+        return redirect('dashboard')
     
-    # Generate PDF
-    pisa_status = pisa.CreatePDF(html, dest=response)
+    try:
+        date_from = request.GET.get('from') or None
+        date_to = request.GET.get('to') or None
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError:
+        messages.error(request, 'Dates must be in YYYY-MM-DD format!')
+        return redirect('dashboard')
     
-    if pisa_status.err:
-        messages.error(request, 'Error generating PDF')
-        return redirect('view_boq', boq_id=boq_id)
+    try:
+        project_id = request.GET.get('project') or None
+        project_id = int(project_id) if project_id else None
+    except ValueError:
+        messages.error(request, 'Project must be a valid project ID!')
+        return redirect('dashboard')
     
+    boqs = export_queryset(
+        date_from=date_from,
+        date_to=date_to,
+        status=request.GET.get('status') or None,
+        project_id=project_id,
+    )
+    response = StreamingHttpResponse(stream_boq_zip(boqs), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="BOQ_export_{timezone.localdate():%Y%m%d}.zip"'
     return response
+
+
 # Add these missing functions to your lms/views.py file
 
 
 @login_required
 def get_inventory_item(request, item_id):
     """API endpoint to get inventory item details"""
-    try:
-        item = get_object_or_404(InventoryItem, id=item_id)
-        return JsonResponse({
-            'success': True,
-            'item': {
-                'id': item.id,
-                'name': item.item_name,
-                'price': float(item.unit_selling_price),
-                'available_quantity': item.available_quantity
-            }
-        })
-    except Exception as e:
+    entry = inventory_index.get_inventory_entry(item_id)
+    if entry is None:
         return JsonResponse({
             'success': False,
-            'message': str(e)
+            'message': 'No InventoryItem matches the given query.'
         }, status=404)
+    return JsonResponse({
+        'success': True,
+        'item': entry.as_dict()
+    })
+
+
+@login_required
+def inventory_import_status(request, job_id):
+    """API endpoint with the progress and result of an inventory import job"""
+    job = get_object_or_404(InventoryImportJob, id=job_id)
+    if job.user_id != request.user.id and not is_admin(request.user):
+        return JsonResponse({'success': False, 'message': 'Permission denied'}, status=403)
+    return JsonResponse({'success': True, 'job': job_payload(job)})
 
 
 @login_required
@@ -948,16 +927,7 @@ def search_inventory(request):
     if len(query) < 2:
         return JsonResponse({'items': []})
     
-    items = InventoryItem.objects.filter(
-        item_name__icontains=query
-    )[:10]
-    
-    results = [{
-        'id': item.id,
-        'name': item.item_name,
-        'price': float(item.unit_selling_price),
-        'available_quantity': item.available_quantity
-    } for item in items]
+    results = [entry.as_dict() for entry in inventory_index.search_inventory(query)]
     
     return JsonResponse({'items': results})
 
@@ -1099,22 +1069,6 @@ def add_event(request):
         return redirect('events')
 
 
-@login_required
-def api_projects_summary(request):
-    """API endpoint for projects summary statistics"""
-    if request.user.is_superuser or request.user.groups.filter(name="admin").exists():
-        projects = Project.objects.all()
-    else:
-        projects = Project.objects.filter(user=request.user)
-    
-    summary = {
-        'total': projects.count(),
-        'active': projects.filter(status__in=['In Progress', 'Testing']).count(),
-        'completed': projects.filter(status='Completed').count(),
-        'on_hold': projects.filter(status='On Hold').count(),
-    }
-    return JsonResponse(summary)
-
 @login_required
 @require_POST
 def change_boq_status(request, boq_id):
@@ -1127,6 +1081,7 @@ def change_boq_status(request, boq_id):
             old_status = boq.status
             boq.status = new_status
             boq.save()
+            schedule_boq_pdf(boq.id)
             
             # If approved, update lead status to advanced
             if new_status == 'approved' and boq.lead_source.status == 'boq':
@@ -1158,7 +1113,7 @@ def delete_boq(request, boq_id):
             return redirect('view_boq', boq_id=boq_id)
         
         # Check permissions
-        if not (request.user.is_superuser or request.user.groups.filter(name="admin").exists()):
+        if not is_admin(request.user):
             if boq.created_by != request.user:
                 messages.error(request, 'You do not have permission to delete this BOQ.')
                 return redirect('view_boq', boq_id=boq_id)
@@ -1174,39 +1129,68 @@ def delete_boq(request, boq_id):
 
 
 
+# ?stock= filters of the inventory list, matching the header counts
+STOCK_LEVELS = {
+    'out': Q(available_quantity=0),
+    'low': Q(available_quantity__gt=0, available_quantity__lt=10),
+    'in': Q(available_quantity__gte=10),
+}
+
+
 @login_required
 @require_permission('inventory_access_view')
 def inventory(request):
     """Display inventory items with enhanced tracking - FIXED VERSION"""
-    items = InventoryItem.objects.all().order_by('item_name')
+    items = InventoryItem.objects.all()
     
-    # Search functionality
-    search_query = request.GET.get('search', '')
+    # Search and stock level filter
+    search_query = request.GET.get('search', '').strip()
     if search_query:
         items = items.filter(item_name__icontains=search_query)
+    stock_filter = request.GET.get('stock', '')
+    if stock_filter in STOCK_LEVELS:
+        items = items.filter(STOCK_LEVELS[stock_filter])
+    else:
+        stock_filter = ''
     
-    # Annotate with order requirements count
-    from django.db.models import Count, Sum
-    items = items.annotate(
-        requirements_count=Count('order_requirements'),
-        total_shortage=Sum('order_requirements__shortage_quantity')
-    )
+    # One keyset page of items by name; more are loaded while scrolling
+    page = paginate_request(request, items, BY_ITEM_NAME)
+    if wants_json(request):
+        return keyset_json_response(
+            request, page, _inventory_item_json, 'lms/inventory_rows.html',
+            {'search_query': search_query, 'stock_filter': stock_filter},
+        )
     
-    # Calculate stats
-    low_stock_count = items.filter(available_quantity__lt=10, available_quantity__gt=0).count()
-    out_of_stock_count = items.filter(available_quantity=0).count()
-    total_to_order = sum(item.quantity_to_be_ordered for item in items)
+    # Header stats come from the rollup, not aggregates over the whole table
+    stats = page_totals(STOCK_TOTALS)
     
     context = {
-        'items': items,
+        'page': page,
         'search_query': search_query,
-        'low_stock_count': low_stock_count,
-        'out_of_stock_count': out_of_stock_count,
-        'total_to_order': total_to_order,
+        'stock_filter': stock_filter,
+        'list_params': keyset_params(search=search_query, stock=stock_filter),
+        'total_count': stats['inventory'],
+        'low_stock_count': stats['inventory_low_stock'],
+        'out_of_stock_count': stats['inventory_out_of_stock'],
+        'total_to_order': stats['inventory_to_order'],
+        'import_jobs': [
+            job_payload(job)
+            for job in InventoryImportJob.objects.filter(user=request.user, status__in=['queued', 'running'])
+        ],
     }
     
     return render(request, 'lms/inventory.html', context)
 
+
+def _inventory_item_json(item):
+    return {
+        'id': item.id,
+        'item_name': item.item_name,
+        'unit_selling_price': float(item.unit_selling_price),
+        'available_quantity': item.available_quantity,
+        'quantity_to_be_ordered': item.quantity_to_be_ordered,
+    }
+
 # Add this function to your lms/views.py file
 # Place it near your other inventory-related functions
 
@@ -1214,7 +1198,7 @@ def inventory(request):
 @require_permission('inventory_access_edit')
 @require_POST
 def upload_inventory_excel(request):
-    """Upload inventory items from Excel file"""
+    """Upload inventory items from Excel file; the rows are imported by a background job"""
     try:
         if 'excel_file' not in request.FILES:
             messages.error(request, 'No file uploaded!')
@@ -1227,82 +1211,22 @@ def upload_inventory_excel(request):
             messages.error(request, 'Invalid file format! Please upload an Excel file (.xlsx or .xls)')
             return redirect('inventory')
         
-        # Read Excel file
-        try:
-            import openpyxl
-            wb = openpyxl.load_workbook(excel_file)
-            ws = wb.active
-        except Exception as e:
-            messages.error(request, f'Error reading Excel file: {str(e)}')
-            return redirect('inventory')
-        
-        # Process rows (skip header)
-        added_count = 0
-        updated_count = 0
-        error_count = 0
-        errors = []
+        job = InventoryImportJob.objects.create(
+            user=request.user,
+            file=excel_file,
+            file_name=excel_file.name[:255],
+        )
+        submit_import_job(job)
         
-        for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                # Expected columns: Item Name, Unit Selling Price, Available Quantity, Quantity to be Ordered
-                if not row or not row[0]:  # Skip empty rows
-                    continue
-                
-                item_name = str(row[0]).strip()
-                unit_selling_price = float(row[1]) if row[1] else 0
-                available_quantity = int(row[2]) if row[2] else 0
-                quantity_to_be_ordered = int(row[3]) if len(row) > 3 and row[3] else 0
-                
-                # Validation
-                if not item_name:
-                    errors.append(f'Row {row_num}: Item name is required')
-                    error_count += 1
-                    continue
-                
-                if unit_selling_price <= 0:
-                    errors.append(f'Row {row_num}: Unit price must be greater than 0')
-                    error_count += 1
-                    continue
-                
-                # Check if item exists
-                existing_item = InventoryItem.objects.filter(item_name__iexact=item_name).first()
-                
-                if existing_item:
-                    # Update existing item (add to existing quantities)
-                    existing_item.available_quantity += available_quantity
-                    if quantity_to_be_ordered > 0:
-                        existing_item.quantity_to_be_ordered += quantity_to_be_ordered
-                    existing_item.unit_selling_price = unit_selling_price  # Update price
-                    existing_item.save()
-                    updated_count += 1
-                else:
-                    # Create new item
-                    InventoryItem.objects.create(
-                        item_name=item_name,
-                        unit_selling_price=unit_selling_price,
-                        available_quantity=available_quantity,
-                        quantity_to_be_ordered=quantity_to_be_ordered
-                    )
-                    added_count += 1
-                
-            except Exception as e:
-                errors.append(f'Row {row_num}: {str(e)}')
-                error_count += 1
-                continue
-        
-        # Success message
-        if added_count > 0 or updated_count > 0:
-            messages.success(request, 
-                f'Excel upload completed! Added: {added_count}, Updated: {updated_count}, Errors: {error_count}')
-        
-        # Show errors if any
-        if errors:
-            error_message = '<br>'.join(errors[:10])  # Show first 10 errors
-            if len(errors) > 10:
-                error_message += f'<br>... and {len(errors) - 10} more errors'
-            from django.utils.safestring import mark_safe
-            messages.warning(request, mark_safe(f'Some rows had errors:<br>{error_message}'))
+        if request.headers.get('Accept', '').startswith('application/json'):
+            return JsonResponse({
+                'success': True,
+                'job': job_payload(job),
+                'status_url': reverse('inventory_import_status', args=[job.id]),
+            }, status=202)
         
+        messages.success(request, 
+            f'Excel upload received! {excel_file.name} is being imported, you will be notified when it is done.')
         return redirect('inventory')
         
     except Exception as e:
@@ -1343,25 +1267,6 @@ def get_inventory_requirements(request, item_id):
         }, status=500)
 
 
-@login_required
-def api_leads_summary(request):
-    """API endpoint for leads summary statistics"""
-    if request.user.is_superuser or request.user.groups.filter(name="admin").exists():
-        leads = LeadSource.objects.all()
-    else:
-        leads = LeadSource.objects.filter(user=request.user)
-    
-    summary = {
-        'total': leads.count(),
-        'open': leads.filter(status='open').count(),
-        'contacted': leads.filter(status='contacted').count(),
-        'boq': leads.filter(status='boq').count(),
-        'advance': leads.filter(status='advance').count(),
-        'won': leads.filter(status='won').count(),
-        'closed': leads.filter(status='closed').count(),
-        'lost': leads.filter(status='lost').count(),
-    }
-    return JsonResponse(summary)
 from django.db import models
 from django.conf import settings
 
@@ -1380,7 +1285,7 @@ def dashboard(request):
     # === PROJECTS ===
     projects = Project.objects.select_related('lead_source')
 
-    if not user.is_superuser and not user.groups.filter(name="admin").exists():
+    if not is_admin(user):
         projects = projects.filter(user=user)
 
     if lead_filter:
@@ -1390,146 +1295,39 @@ def dashboard(request):
     if status_filter:
         projects = projects.filter(status=status_filter)
 
-    total_projects = projects.count()
-
-    # === STATUS COUNTS ===
-    raw_status_counts = dict(
-        projects.values('status')
-                .annotate(count=Count('status'))
-                .values_list('status', 'count')
-    )
-
-    status_map = {
-        'open': 'New',
-        'contacted': 'Contacted',
-        'boq': 'BOQ',
-        'advance': 'Advance',
-        'In Progress': 'In Progress',
-        'Testing': 'Testing',
-        'won': 'Won',
-        'closed': 'Closed',
-        'lost': 'Lost',
-    }
-
-    status_counts = {
-        status_map.get(key, key): raw_status_counts.get(key, 0)
-        for key in status_map.keys()
-    }
-
-    # === LEAD SOURCE DISTRIBUTION ===
-    lead_source_counts = dict(
-        projects.values('lead_source__first_name', 'lead_source__last_name')
-                .annotate(count=Count('id'))
-                .order_by('-count')[:8]
-                .values_list('lead_source__first_name', 'count')
-    )
-
-    # === CITY DISTRIBUTION ===
-
-    city_counts = dict(
-        projects.exclude(city__isnull=True)
-                .values('city')
-                .annotate(count=Count('id'))
-                .order_by('-count')[:10]
-                .values_list('city', 'count')
-    )
-
-    # === REVENUE & KPIs (FIXED) ===
-    # Calculate total revenue from ALL projects with amount > 0
-    projects_with_amount = projects.filter(status='advance').exclude(amount__isnull=True).exclude(amount=0)    
-    total_revenue = projects_with_amount.aggregate(total=Sum('amount'))['total'] or 0
-    
-    # Count won projects for win rate
-    won_projects = projects.filter(status='won')
-    won_count = won_projects.count()
-    
-    # Calculate average deal size from projects with amounts
-    total_projects_with_amount = projects_with_amount.count()
-    avg_deal = (total_revenue / total_projects_with_amount) if total_projects_with_amount > 0 else 0
-    
-    # Win rate = won projects / total projects
-    win_rate = round((won_count / total_projects * 100), 1) if total_projects > 0 else 0
-    
-    # Conversion rate: projects with amount / total projects
-    conversion_rate = round((total_projects_with_amount / total_projects * 100), 1) if total_projects > 0 else 0
+    if lead_filter:
+        # The rollup is not broken down by lead source
+        summary = build_dashboard_summary(projects)
+    else:
+        summary = build_rollup_dashboard_summary(
+            projects,
+            user=None if is_admin(user) else user,
+            city=city_filter,
+            status=status_filter,
+        )
 
     # === TOP PROJECTS ===
     top_leads = projects.filter(amount__gt=0).order_by('-amount')[:10]
 
-    # === TOP SELLING INVENTORY ===
-    from django.db.models import F
-    
-    top_inventory = (
-        BOQItem.objects
-        .filter(boq__status='approved')
-        .values('inventory_item__id', 'inventory_item__item_name')
-        .annotate(
-            total_sold=Sum('quantity'),
-            total_revenue=Sum(F('quantity') * F('unit_price'))
-        )
-        .order_by('-total_revenue')[:10]
-    )
-
-    # Format inventory data
-    top_inventory_list = [
-        {
-            'item_name': item['inventory_item__item_name'],
-            'total_sold': item['total_sold'],
-            'total_revenue': item['total_revenue']
-        }
-        for item in top_inventory
-    ]
-
-    # === REVENUE TREND ===
-    today = timezone.now().date()
-    months, revenue_data = [], []
-
-    for i in range(11, -1, -1):
-        month_date = today - timedelta(days=30 * i)
-        month_start = month_date.replace(day=1)
-        next_month = (month_start.replace(year=month_start.year + 1, month=1, day=1)
-                      if month_start.month == 12
-                      else month_start.replace(month=month_start.month + 1, day=1))
-        month_end = next_month - timedelta(days=1)
-
-        month_revenue = projects.filter(
-            amount__isnull=False,
-            amount__gt=0,
-            snapshot_d__date__gte=month_start,
-            snapshot_d__date__lte=month_end
-        ).aggregate(total=Sum('amount'))['total'] or 0
-
-        months.append(month_start.strftime('%b'))
-        revenue_data.append(float(month_revenue))
-
     # === FILTER OPTIONS ===
-    all_leads = LeadSource.objects.all().order_by('first_name')
-    all_cities = list(
-        Project.objects.exclude(city__isnull=True)
-        .exclude(city__exact="")
-        .values_list('city', flat=True)
-        .distinct()
-        .order_by('city')
-    )
-    all_statuses = list(
-        Project.objects.values_list('status', flat=True)
-        .distinct()
-        .order_by('status')
-    )
+    # Leads are picked through the /leads/search/ autocomplete; only the selected one is loaded
+    selected_lead = LeadSource.objects.filter(pk=lead_filter).first() if lead_filter.isdigit() else None
+    all_cities = rollup_cities()
+    all_statuses = rollup_statuses()
 
     context = {
-        'total_billing': int(total_revenue),
-        'conversion_rate': conversion_rate,
-        'avg_deal': int(avg_deal),
-        'win_rate': win_rate,
-        'status_counts': json.dumps(status_counts),
-        'lead_source_counts': json.dumps(lead_source_counts),
-        'city_counts': json.dumps(city_counts),
+        'total_billing': int(summary.total_revenue),
+        'conversion_rate': summary.conversion_rate,
+        'avg_deal': int(summary.avg_deal),
+        'win_rate': summary.win_rate,
+        'status_counts': json.dumps(summary.status_counts),
+        'lead_source_counts': json.dumps(summary.lead_source_counts),
+        'city_counts': json.dumps(summary.city_counts),
         'top_leads': top_leads,
-        'top_inventory': top_inventory_list,
-        'revenue_labels': json.dumps(months),
-        'revenue_data': json.dumps(revenue_data),
-        'all_leads': all_leads,
+        'top_inventory': summary.top_inventory,
+        'revenue_labels': json.dumps(summary.revenue_labels),
+        'revenue_data': json.dumps(summary.revenue_data),
+        'selected_lead': selected_lead,
         'all_cities': all_cities,
         'all_statuses': all_statuses,
         'lead_filter': lead_filter,
@@ -1549,7 +1347,7 @@ def update_project_amount(request, project_id):
         project = get_object_or_404(Project, id=project_id)
         
         # Access control
-        if not (request.user.is_superuser or request.user.groups.filter(name="admin").exists()):
+        if not is_admin(request.user):
             if project.user != request.user:
                 return JsonResponse({
                     'success': False,
@@ -1635,8 +1433,11 @@ def delete_inventory_item(request, item_id):
 @require_permission('ongoing_projects_access')
 def ongoing_projects(request):
     # Only show projects with 'advance' status
-    projects = Project.objects.filter(status='advance').select_related('lead_source').order_by('-id')
-    return render(request, 'lms/ongoing_projects.html', {'projects': projects})
+    projects = Project.objects.filter(status='advance').select_related('lead_source')
+    page = paginate_request(request, projects, RECENT_FIRST)
+    if wants_json(request):
+        return keyset_json_response(request, page, _project_json, 'lms/ongoing_projects_rows.html')
+    return render(request, 'lms/ongoing_projects.html', {'page': page, 'cities': rollup_cities(status='advance')})
 
 
 from .models import Project, BOQ
@@ -1694,6 +1495,7 @@ def update_invoice_number(request, boq_id):
 
     boq.invoice_number = new_invoice
     boq.save()
+    schedule_boq_pdf(boq.id)
 
     messages.success(request, "Invoice number updated successfully!")
     return redirect("view_boq", boq_id=boq_id)
@@ -1748,70 +1550,74 @@ def add_project(request):
 @require_permission('basic_access')
 def tasks(request):
     user = request.user
-    # Build two views: Assigned to Me and Assigned by Me
-    assigned_to_qs = Task.objects.filter(user=user)
-    assigned_by_qs = Task.objects.filter(assigned_by=user)
     now = timezone.now()
-    # Segregation logic for both views
-    assigned_to_active_tasks = [t for t in assigned_to_qs if not t.completed and t.due_date > now]
-    assigned_to_completed_tasks = [t for t in assigned_to_qs if t.completed]
-    assigned_to_pending_tasks = [t for t in assigned_to_qs if not t.completed and t.due_date <= now]
-    assigned_by_active_tasks = [t for t in assigned_by_qs if not t.completed and t.due_date > now]
-    assigned_by_completed_tasks = [t for t in assigned_by_qs if t.completed]
-    assigned_by_pending_tasks = [t for t in assigned_by_qs if not t.completed and t.due_date <= now]
-    # Counters for dynamic display
-    assigned_to_active_count = len(assigned_to_active_tasks)
-    assigned_to_completed_count = len(assigned_to_completed_tasks)
-    assigned_to_pending_count = len(assigned_to_pending_tasks)
-    assigned_by_active_count = len(assigned_by_active_tasks)
-    assigned_by_completed_count = len(assigned_by_completed_tasks)
-    assigned_by_pending_count = len(assigned_by_pending_tasks)
-    projects = Project.objects.all()
-    users = User.objects.all()
-    is_admin = request.user.groups.filter(name="admin").exists()
-    is_task_role = request.user.groups.filter(name="task_permission_edit").exists()
-    notifications_qs = Notification.objects.filter(user=request.user).order_by('-created_at')
-    unread_count = notifications_qs.filter(is_read=False).count()
-    notifications = notifications_qs[:5]
+    # Two views: Assigned to Me and Assigned by Me
+    directions = {
+        'to': Task.objects.filter(user=user),
+        'by': Task.objects.filter(assigned_by=user),
+    }
+    user_groups = get_user_groups(request.user)
+    is_admin_member = 'admin' in user_groups
+    is_task_role = 'task_permission_edit' in user_groups
+
+    # Next page of one table while scrolling, e.g. ?format=json&bucket=to-active&cursor=...
+    if wants_json(request):
+        direction, _, bucket = request.GET.get('bucket', '').partition('-')
+        if direction not in directions or bucket not in TASK_BUCKETS:
+            return JsonResponse({'success': False, 'message': 'Unknown task list.'}, status=400)
+        page = paginate_request(request, bucket_tasks(directions[direction], bucket, now), BUCKET_ORDERINGS[bucket])
+        return keyset_json_response(request, page, _task_json, 'lms/tasks_table_rows.html', {'is_admin': is_admin_member})
+
+    context = {}
+    for direction, direction_tasks in directions.items():
+        # Counters for dynamic display
+        counts = bucket_counts(direction_tasks, now)
+        for bucket in TASK_BUCKETS:
+            context[f'assigned_{direction}_{bucket}_count'] = counts[bucket]
+            context[f'assigned_{direction}_{bucket}_tasks'] = keyset_paginate(
+                bucket_tasks(direction_tasks, bucket, now), BUCKET_ORDERINGS[bucket]
+            )
 
-    context = {
+    notifications = Notification.objects.filter(user=request.user).order_by('-created_at')[:5]
+
+    context.update({
         # Default view: Assigned to Me
-        "active_tasks": assigned_to_active_tasks,
-        "completed_tasks": assigned_to_completed_tasks,
-        "pending_tasks": assigned_to_pending_tasks,
-        # Full data sets for both views
-        "assigned_to_active_tasks": assigned_to_active_tasks,
-        "assigned_to_completed_tasks": assigned_to_completed_tasks,
-        "assigned_to_pending_tasks": assigned_to_pending_tasks,
-        "assigned_by_active_tasks": assigned_by_active_tasks,
-        "assigned_by_completed_tasks": assigned_by_completed_tasks,
-        "assigned_by_pending_tasks": assigned_by_pending_tasks,
-        # Counters
-        "assigned_to_active_count": assigned_to_active_count,
-        "assigned_to_completed_count": assigned_to_completed_count,
-        "assigned_to_pending_count": assigned_to_pending_count,
-        "assigned_by_active_count": assigned_by_active_count,
-        "assigned_by_completed_count": assigned_by_completed_count,
-        "assigned_by_pending_count": assigned_by_pending_count,
-        # Other context
-        "projects": projects,
-        "users": users,
-        "is_admin": is_admin, 
+        "active_tasks": context['assigned_to_active_tasks'],
+        "completed_tasks": context['assigned_to_completed_tasks'],
+        "pending_tasks": context['assigned_to_pending_tasks'],
+        # Dropdown options for the task forms
+        "projects": project_choices(),
+        "users": user_choices(),
+        "is_admin": is_admin_member,
         "notifications": notifications,
-        "unread_count": unread_count,
+        "unread_count": unread_count(request.user),
         "is_task_role": is_task_role
-    }
+    })
 
     return render(request, "lms/tasks.html", context)
 
 
+def _task_json(task):
+    return {
+        'id': task.id,
+        'title': task.title,
+        'description': task.description,
+        'priority': task.priority,
+        'due_date': task.due_date.isoformat() if task.due_date else None,
+        'completed': task.completed,
+        'project': {'id': task.project_id, 'project_name': task.project.project_name},
+        'user': task.user.username if task.user else None,
+        'assigned_by': task.assigned_by.username if task.assigned_by else None,
+    }
+
+
 @login_required
 @require_POST
 @require_permission('task_permission_edit')
 def add_task(request):
     print(request)
     """Add a new task"""
-    if not (request.user.is_superuser or request.user.groups.filter(name="admin").exists()):
+    if not is_admin(request.user):
         messages.error(request, 'You do not have permission to create tasks.')
         return redirect('tasks')
     
@@ -1852,7 +1658,7 @@ def add_task(request):
 from django.contrib.auth.decorators import user_passes_test
 
 def is_admin_or_superuser(user):
-    return user.is_superuser or user.groups.filter(name='admin').exists()
+    return is_admin(user)
 
 @login_required
 @require_permission('admin')
@@ -2072,27 +1878,23 @@ def add_event(request):
 @login_required
 def api_leads_summary(request):
     """API endpoint for leads summary statistics"""
-    summary = {
-        'total': LeadSource.objects.count(),
-        'open': LeadSource.objects.filter(status='open').count(),
-        'contacted': LeadSource.objects.filter(status='contacted').count(),
-        'boq': LeadSource.objects.filter(status='boq').count(),
-        'advance': LeadSource.objects.filter(status='advance').count(),
-        'won': LeadSource.objects.filter(status='won').count(),
-        'closed': LeadSource.objects.filter(status='closed').count(),
-        'lost': LeadSource.objects.filter(status='lost').count(),
-    }
+    # Lead pipeline status lives on the lead's project
+    counts = rollup_status_counts()
+    summary = {'total': sum(counts.values())}
+    for status in ['open', 'contacted', 'boq', 'advance', 'won', 'closed', 'lost']:
+        summary[status] = counts.get(status, 0)
     return JsonResponse(summary)
 
 
 @login_required
 def api_projects_summary(request):
     """API endpoint for projects summary statistics"""
+    counts = rollup_status_counts()
     summary = {
-        'total': Project.objects.count(),
-        'active': Project.objects.filter(status__in=['open', 'contacted', 'boq', 'advance']).count(),
-        'won': Project.objects.filter(status='won').count(),
-        'lost': Project.objects.filter(status='lost').count(),
+        'total': sum(counts.values()),
+        'active': sum(counts.get(status, 0) for status in ['open', 'contacted', 'boq', 'advance']),
+        'won': counts.get('won', 0),
+        'lost': counts.get('lost', 0),
     }
     return JsonResponse(summary)
 
@@ -2107,22 +1909,39 @@ from .models import Notification
 @login_required
 def notifications(request):
     """Display all notifications for the current user"""
-    notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-    unread_count = notifications.filter(is_read=False).count()
+    notifications = Notification.objects.filter(user=request.user)
+    page = paginate_request(request, notifications, NEWEST_CREATED)
+    if wants_json(request):
+        return keyset_json_response(request, page, _notification_json, 'lms/notification_cards.html')
+    
+    counts = notifications.aggregate(total=Count('id'), unread=Count('id', filter=Q(is_read=False)))
     
     context = {
-        'notifications': notifications,
-        'unread_count': unread_count,
-        'is_admin': request.user.is_superuser or request.user.groups.filter(name="admin").exists(),
+        'page': page,
+        'total_count': counts['total'],
+        'unread_count': counts['unread'],
+        'read_count': counts['total'] - counts['unread'],
+        'is_admin': is_admin(request.user),
     }
     
     return render(request, 'lms/notifications.html', context)
 
 
+def _notification_json(notification):
+    return {
+        'id': notification.id,
+        'message': notification.message,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
 @login_required
 def mark_notifications_read(request):
     """Mark all notifications as read for the current user"""
-    Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    with transaction.atomic():
+        Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        publish(unread_counts={request.user.pk: 0})
     messages.success(request, 'All notifications marked as read!')
     return redirect('notifications')
 
@@ -2133,8 +1952,11 @@ def mark_notification_read(request, notif_id):
     """Mark a single notification as read"""
     try:
         notification = get_object_or_404(Notification, id=notif_id, user=request.user)
-        notification.is_read = True
-        notification.save()
+        if not notification.is_read:
+            with transaction.atomic():
+                notification.is_read = True
+                notification.save(update_fields=['is_read'])
+                publish(unread_deltas={request.user.pk: -1})
         
         return JsonResponse({
             'status': 'success',
@@ -2153,7 +1975,10 @@ def delete_notification(request, notif_id):
     """Delete a notification"""
     try:
         notification = get_object_or_404(Notification, id=notif_id, user=request.user)
-        notification.delete()
+        with transaction.atomic():
+            notification.delete()
+            if not notification.is_read:
+                publish(unread_deltas={request.user.pk: -1})
         
         return JsonResponse({
             'status': 'success',
@@ -2166,12 +1991,6 @@ def delete_notification(request, notif_id):
         }, status=500)
 
 
-@login_required
-def unread_notification_count(request):
-    """API endpoint for unread notification count"""
-    count = Notification.objects.filter(user=request.user, is_read=False).count()
-    return JsonResponse({'count': count})
-
 from .models import TaskAssignment, Notification
 
 @login_required
@@ -2221,37 +2040,31 @@ def add_task_check(request):
 
 @login_required
 def unread_notification_count(request):
-    """API endpoint for unread notification count"""
-    count = Notification.objects.filter(user=request.user, is_read=False).count()
-    return JsonResponse({'count': count})
+    """API endpoint for unread notification count (the page gets updates pushed over the WebSocket)"""
+    return JsonResponse({'count': unread_count(request.user)})
+
+
+@login_required
+@require_permission('admin')
+def performance_metrics(request):
+    """Per-endpoint latency histogram of this server process (see ServerTimingMiddleware)"""
+    return JsonResponse(histogram.snapshot())
 
 @csrf_exempt
 def mark_task_complete(request, task_id):
     if request.method == 'POST':
         try:
-            task = Task.objects.get(id=task_id)
-            task.completed = True
-            task.save()
-
-            # Notify all admins
-            channel_layer = get_channel_layer()
-            admin_group = Group.objects.filter(name="admin").first()
-            if admin_group:
-                for admin in admin_group.user_set.all():
-                    # DB notification
-                    Notification.objects.create(
-                        user=admin,
-                        message=f"✅ Task '{task.title}' has been completed by {request.user.username}"
-                    )
-
-                    # Real-time WebSocket push
-                    async_to_sync(channel_layer.group_send)(
-                        f"user_{admin.id}",  # 👈 per admin WebSocket group
-                        {
-                            "type": "send_notification",
-                            "message": f"✅ Task '{task.title}' completed by {request.user.username}"
-                        }
-                    )
+            with transaction.atomic():
+                task = Task.objects.get(id=task_id)
+                task.completed = True
+                task.save()
+
+                # Notify all admins (pushed once the transaction commits)
+                notify(
+                    group_members("admin"),
+                    f"✅ Task '{task.title}' has been completed by {request.user.username}",
+                    push_message=f"✅ Task '{task.title}' completed by {request.user.username}",
+                )
 
             return JsonResponse({'status': 'success', 'message': 'Task marked complete'})
         except Task.DoesNotExist:
@@ -2262,28 +2075,17 @@ def mark_task_complete(request, task_id):
 def mark_task_incomplete(request, task_id):
     if request.method == 'POST':
         try:
-            task = Task.objects.get(id=task_id)
-            task.completed = False
-            task.save()
-
-            # Optional: send admin notification for reverting
-            channel_layer = get_channel_layer()
-            admin_group = Group.objects.filter(name="admin").first()
-            if admin_group:
-                other_admins = admin_group.user_set.exclude(id=request.user.id)
-                for admin in other_admins:
-                    Notification.objects.create(
-                        user=admin,
-                        message=f"❌ Task '{task.title}' was marked incomplete by {request.user.username}"
-                    )
-
-                    async_to_sync(channel_layer.group_send)(
-                        f"user_{admin.id}",
-                        {
-                            "type": "send_notification",
-                            "message": f"❌ Task '{task.title}' marked incomplete by {request.user.username}"
-                        }
-                    )
+            with transaction.atomic():
+                task = Task.objects.get(id=task_id)
+                task.completed = False
+                task.save()
+
+                # Let the other admins know about the revert
+                notify(
+                    group_members("admin", exclude=request.user),
+                    f"❌ Task '{task.title}' was marked incomplete by {request.user.username}",
+                    push_message=f"❌ Task '{task.title}' marked incomplete by {request.user.username}",
+                )
 
             return JsonResponse({'status': 'success', 'message': 'Task marked incomplete'})
         except Task.DoesNotExist: